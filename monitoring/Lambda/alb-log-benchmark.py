@@ -0,0 +1,620 @@
+"""
+ALB 로그 처리 Lambda 벤치마크
+
+stress_test/ 시나리오(대기열 폴링, 주문, 결제 흐름)의 요청 비율, 상태 코드 분포, 응답 시간 분포,
+봇/target 미도달(-1) 비율을 본뜬 합성 ALB 로그(gzip)를 만들고,
+parse_alb_log/parse_alb_record의 라인 처리 속도, 출력 프로필별 직렬화 속도/이벤트 크기,
+콜드 스타트(모듈 import와 첫 호출) 시간, 단계 계측(PipelineMetrics) 오버헤드, 로컬 S3/Logs 스텁에 대한 lambda_handler 처리량/최대 RSS를 측정
+
+    # 합성 로그 생성
+    python alb-log-benchmark.py generate --scenario stress --size-mb 100 -o stress-100mb.log.gz
+    # 벤치마크 실행 후 기준값과 비교 (기준보다 느려지면 종료 코드 1)
+    python alb-log-benchmark.py run --sizes 1,10,100,300 --output results.json --baseline benchmark-baseline.json
+"""
+import contextlib
+import gzip
+import importlib.util
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+PROCESSOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alb-log-processor.py')
+
+# Lambda 파일 동적 로드 (하이픈이 있어서 import 불가능하므로, 테스트에서 이미 로드했으면 재사용)
+if 'alb_log_processor' in sys.modules:
+    alb_log_processor = sys.modules['alb_log_processor']
+else:
+    _spec = importlib.util.spec_from_file_location('alb_log_processor', PROCESSOR_PATH)
+    alb_log_processor = importlib.util.module_from_spec(_spec)
+    sys.modules['alb_log_processor'] = alb_log_processor
+    _spec.loader.exec_module(alb_log_processor)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark-baseline.json')
+DEFAULT_SIZES_MB = (1, 10, 100, 300)
+DEFAULT_TOLERANCE = 0.25  # 기준값 대비 허용 변동 (처리량은 이만큼 느려지면, RSS는 이만큼 늘면 회귀)
+PARSE_BENCHMARK_LINES = 50000
+SERIALIZE_PROFILES = ('full', 'compact', 'raw')
+COLD_START_RUNS = 5
+MIN_HANDLER_RUNS = 1
+MAX_HANDLER_RUNS = 5
+
+ACCOUNT_ID = '339712948064'
+REGION = 'ap-northeast-2'
+ELB_ID = 'app/flash-ticket-alb/1234567890abcdef'
+CERT_ARN = f'arn:aws:acm:{REGION}:{ACCOUNT_ID}:certificate/12345678-1234-1234-1234-123456789012'
+EVENT_ID = '5fc5e855-f1e6-4c0a-a758-5f76eb6aee4e'
+
+# 호스트별 도메인, 대상 그룹, 대상 IP:포트 (stress_test/endpoints.md)
+HOSTS = {
+    'gateway': ('gateway.highgarden.cloud', 'flash-gateway/abcd1234', ('10.0.1.100', '10.0.1.101'), 3000),
+    'api': ('api.highgarden.cloud', 'flash-api/efgh5678', ('10.0.2.100', '10.0.2.101'), 4000),
+}
+
+# 사용자 여정 단계: (메서드, 호스트, 경로 템플릿, 성공 상태 코드) (stress_test/scenarios/03-load-test.jmx)
+STEPS = {
+    'login': ('POST', 'gateway', '/auth/login', 201),
+    'events': ('GET', 'api', '/events', 200),
+    'enqueue': ('POST', 'gateway', '/queue/enqueue', 201),
+    'queue_status': ('GET', 'gateway', '/queue/status?ticketId={id}', 200),
+    'enter': ('POST', 'gateway', '/queue/enter', 201),
+    'event_detail': ('GET', 'api', f'/events/{EVENT_ID}', 200),
+    'create_order': ('POST', 'api', '/orders', 201),
+    'create_payment': ('POST', 'api', '/payments', 201),
+    'payment_callback': ('POST', 'api', '/payments/callback', 201),
+    'verify_order': ('GET', 'api', '/orders/{id}', 200),
+}
+
+# 봇/스캐너 요청 (gateway 도메인, 절반은 대상 404, 절반은 ALB에서 거부되어 -1)
+BOT_PATHS = ('/', '/robots.txt', '/favicon.ico', '/.env', '/wp-login.php', '/admin', '/health', '/metrics')
+BOT_USER_AGENTS = ('Mozilla/5.0 (compatible; Googlebot/2.1)', 'python-requests/2.31.0', 'curl/8.4.0', 'zgrab/0.x')
+USER_AGENT = 'Apache-HttpClient/4.5.14 (Java/17.0.9)'
+
+# 상태 분포 항목: (ELB 상태, 대상 상태 또는 None, 비율)
+# 대상 상태가 None이면 target 미도달/타임아웃으로 처리 시간이 -1로 기록됨
+SUCCESS = 'success'  # 단계의 성공 상태 코드로 대체
+# 시나리오: 여정 단계별 요청 수, 상태 분포, 응답 시간 (중앙값 ms, p99 ms), 봇 요청 비율, 초당 요청 수
+# 상태 분포가 없는 단계는 모두 성공, 응답 시간이 없는 단계는 'default' 사용
+SCENARIOS = {
+    # 01-smoke-test: 단일 사용자 전체 여정, 폴링 2회, 주문은 1인 제한으로 400
+    'smoke': {
+        'journey': (('login', 1), ('events', 1), ('enqueue', 1), ('queue_status', 2), ('enter', 1),
+                    ('event_detail', 1), ('create_order', 1)),
+        'status': {
+            'create_order': ((400, 400, 1.0),),
+        },
+        'latency_ms': {'default': (25, 120), 'login': (120, 400), 'queue_status': (9, 40)},
+        'bot_ratio': 0.01,
+        'requests_per_second': 2,
+    },
+    # 02-load-test: 50명, 폴링 10회, 주문 이후 단계는 1인 제한으로 60% 실패
+    'load': {
+        'journey': (('login', 1), ('enqueue', 1), ('queue_status', 10), ('enter', 1), ('event_detail', 1),
+                    ('create_order', 1), ('create_payment', 1), ('payment_callback', 1), ('verify_order', 1)),
+        'status': {
+            'create_order': ((SUCCESS, SUCCESS, 0.4), (400, 400, 0.6)),
+            'create_payment': ((SUCCESS, SUCCESS, 0.4), (400, 400, 0.6)),
+            'payment_callback': ((SUCCESS, SUCCESS, 0.4), (400, 400, 0.6)),
+            'verify_order': ((SUCCESS, SUCCESS, 0.4), (500, 500, 0.6)),
+        },
+        'latency_ms': {'default': (30, 150), 'login': (150, 565), 'queue_status': (12, 60)},
+        'bot_ratio': 0.02,
+        'requests_per_second': 18,
+    },
+    # 03-load-test: 1000명, 인증/대기열 과부하 (503, 404, 502/504 타임아웃)
+    'stress': {
+        'journey': (('login', 1), ('enqueue', 1), ('queue_status', 10), ('enter', 1), ('event_detail', 1),
+                    ('create_order', 1), ('create_payment', 1), ('payment_callback', 1), ('verify_order', 1)),
+        'status': {
+            'login': ((SUCCESS, SUCCESS, 0.521), (503, None, 0.45), (504, None, 0.029)),
+            'enqueue': ((SUCCESS, SUCCESS, 0.407), (503, None, 0.35), (404, 404, 0.243)),
+            'queue_status': ((SUCCESS, SUCCESS, 0.26), (503, None, 0.438), (404, 404, 0.237),
+                             (504, None, 0.033), (502, None, 0.032)),
+            'enter': ((SUCCESS, SUCCESS, 0.276), (503, None, 0.5), (404, 404, 0.224)),
+            'create_order': ((SUCCESS, SUCCESS, 0.521), (503, None, 0.479)),
+            'create_payment': ((SUCCESS, SUCCESS, 0.521), (503, None, 0.479)),
+            'payment_callback': ((SUCCESS, SUCCESS, 0.521), (503, None, 0.479)),
+            'verify_order': ((SUCCESS, SUCCESS, 0.521), (503, None, 0.479)),
+        },
+        'latency_ms': {'default': (120, 6000), 'login': (900, 30000), 'queue_status': (60, 3000),
+                       'event_detail': (40, 800)},
+        'bot_ratio': 0.05,
+        'requests_per_second': 128,
+    },
+}
+DEFAULT_START = '2025-11-03T15:44:00'
+
+
+def _lognormal_params(median_ms, p99_ms):
+    # 로그정규분포: p99 = median * exp(2.326 * sigma)
+    return math.log(median_ms / 1000), math.log(p99_ms / median_ms) / 2.3263
+
+
+def iter_synthetic_lines(scenario='load', seed=0, start=DEFAULT_START):
+    """
+    시나리오 분포를 따르는 ALB 로그 라인을 끝없이 생성 (같은 seed면 같은 라인)
+    라인은 요청 생성 시각 순서이고 time 필드(응답 시각)는 응답 시간만큼 뒤로 밀려 실제 로그처럼 거의 정렬됨
+    """
+    config = SCENARIOS[scenario]
+    rng = random.Random(seed)
+    latency = {name: _lognormal_params(*value) for name, value in config['latency_ms'].items()}
+
+    # 단계별 요청 템플릿: (비율 누적, 메서드, 도메인, 대상 그룹 ARN, 대상 IP들, 포트, 경로, 상태 누적 분포, 응답 시간)
+    steps = []
+    for name, count in config['journey']:
+        method, host, path, success = STEPS[name]
+        domain, target_group, target_ips, port = HOSTS[host]
+        statuses = config['status'].get(name, ((SUCCESS, SUCCESS, 1.0),))
+        steps.append((
+            count, method, domain,
+            f'arn:aws:elasticloadbalancing:{REGION}:{ACCOUNT_ID}:targetgroup/{target_group}',
+            target_ips, port, path,
+            list(itertools.accumulate(weight for _, _, weight in statuses)),
+            [(success if elb == SUCCESS else elb, success if target == SUCCESS else target)
+             for elb, target, _ in statuses],
+            latency.get(name, latency['default']),
+        ))
+    step_weights = list(itertools.accumulate(step[0] for step in steps))
+    bot_ratio = config['bot_ratio']
+    gateway_domain, gateway_group, gateway_ips, gateway_port = HOSTS['gateway']
+    gateway_arn = f'arn:aws:elasticloadbalancing:{REGION}:{ACCOUNT_ID}:targetgroup/{gateway_group}'
+
+    interval_us = 1000000 // config['requests_per_second']
+    created_us = alb_log_processor._epoch_seconds(start) * 1000000
+    second_prefixes = {}
+
+    def iso(us):
+        seconds, micros = divmod(us, 1000000)
+        prefix = second_prefixes.get(seconds)
+        if prefix is None:
+            if len(second_prefixes) > 4096:
+                second_prefixes.clear()
+            prefix = second_prefixes[seconds] = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+        return f'{prefix}.{micros:06d}Z'
+
+    choices = rng.choices
+    randrange = rng.randrange
+    random_float = rng.random
+    lognormvariate = rng.lognormvariate
+    getrandbits = rng.getrandbits
+    while True:
+        created_us += randrange(1, 2 * interval_us)
+        client = f'203.0.113.{randrange(1, 255)}:{randrange(1024, 65535)}'
+        trace = f'Root=1-{created_us // 1000000:08x}-{getrandbits(96):024x}'
+
+        if random_float() < bot_ratio:
+            method, domain, group_arn, user_agent = 'GET', gateway_domain, gateway_arn, choices(BOT_USER_AGENTS)[0]
+            path = choices(BOT_PATHS)[0]
+            if random_float() < 0.5:
+                elb_status, target_status, seconds = 404, 404, 0.002 + random_float() * 0.01
+                target = f'{choices(gateway_ips)[0]}:{gateway_port}'
+            else:
+                elb_status, target_status, seconds, target = 403, None, 0.0, '-'
+        else:
+            _, method, domain, group_arn, target_ips, port, path, status_weights, statuses, (mu, sigma) = \
+                choices(steps, cum_weights=step_weights)[0]
+            elb_status, target_status = choices(statuses, cum_weights=status_weights)[0]
+            user_agent = USER_AGENT
+            if '{id}' in path:
+                path = path.replace('{id}', f'{getrandbits(64):016x}')
+            # 타임아웃(504)은 대상에 연결된 뒤 응답이 없음, 그 외 미도달은 대상 없음
+            target = f'{choices(target_ips)[0]}:{port}' if target_status is not None or elb_status == 504 else '-'
+            seconds = 30.0 if elb_status == 504 else min(lognormvariate(mu, sigma), 30.0)
+
+        if target_status is None:
+            timings = '0.000 -1 -1' if target != '-' else '-1 -1 -1'
+            target_status_field = '-'
+        else:
+            timings = f'0.000 {seconds:.3f} 0.000'
+            target_status_field = target_status
+        response_us = created_us + int(seconds * 1000000)
+        yield (
+            f'h2 {iso(response_us)} {ELB_ID} {client} {target} {timings} {elb_status} {target_status_field} '
+            f'{randrange(200, 900)} {randrange(150, 4000)} "{method} https://{domain}:443{path} HTTP/2.0" '
+            f'"{user_agent}" ECDHE-RSA-AES128-GCM-SHA256 TLSv1.2 {group_arn} "{trace}" "{domain}" '
+            f'"{CERT_ARN}" 1 {iso(created_us)} "forward" "-" "-" "{target}" "{target_status_field}" "-" "-" '
+            f'TID_{getrandbits(64):016x}'
+        )
+
+
+def write_synthetic_log(path, size_bytes, scenario='load', seed=0):
+    """
+    압축 해제 크기가 size_bytes 이상이 될 때까지 합성 로그를 gzip 파일로 저장
+    반환: {'lines', 'bytes'(압축 해제 크기), 'compressed_bytes'}
+    """
+    lines = iter_synthetic_lines(scenario, seed)
+    written = count = 0
+    with gzip.open(path, 'wb', compresslevel=6) as f:
+        while written < size_bytes:
+            chunk = ('\n'.join(itertools.islice(lines, 1000)) + '\n').encode('utf-8')
+            f.write(chunk)
+            written += len(chunk)
+            count += 1000
+    return {'lines': count, 'bytes': written, 'compressed_bytes': os.path.getsize(path)}
+
+
+class LocalS3Client:
+    """로컬 gzip 파일을 S3 객체처럼 제공하는 스텁"""
+
+    def __init__(self, objects):
+        self.objects = objects  # {(bucket, key): path}
+
+    def get_object(self, Bucket, Key):
+        return {'Body': open(self.objects[(Bucket, Key)], 'rb'), 'ETag': '"benchmark"'}
+
+
+class DiscardingLogsClient:
+    """PutLogEvents 요청의 이벤트 수와 바이트만 세고 버리는 CloudWatch Logs 스텁"""
+
+    class exceptions:
+        class ResourceAlreadyExistsException(Exception):
+            pass
+
+    def __init__(self):
+        self.events = 0
+        self.bytes = 0
+        self.calls = 0
+
+    def create_log_stream(self, logGroupName, logStreamName):
+        pass
+
+    def put_log_events(self, logGroupName, logStreamName, logEvents):
+        # 업로드 스레드들에서 호출되지만 벤치마크 결과 확인용 근사치라 잠금 없이 집계
+        self.calls += 1
+        self.events += len(logEvents)
+        self.bytes += sum(len(event['message']) for event in logEvents)
+        return {'nextSequenceToken': str(self.calls)}
+
+
+def peak_rss_mb():
+    """
+    현재 프로세스의 최대 RSS (MB, resource 모듈이 없는 플랫폼은 None)
+
+    Linux의 ru_maxrss는 fork/exec를 거쳐도 유지되어 부모 프로세스의 RSS가 섞이므로
+    /proc/self/status의 VmHWM(exec 이후 이 프로세스의 최대 RSS)을 먼저 사용
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux는 KB, macOS는 바이트 단위
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def benchmark_parse(lines, repeat=3, parse=None):
+    """
+    파서(기본 parse_alb_log)의 라인 처리 속도 (repeat번 중 가장 빠른 값)
+    """
+    parse = parse or alb_log_processor.parse_alb_log
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for line in lines:
+            parse(line)
+        best = min(best, time.perf_counter() - started)
+    return {'lines': len(lines), 'seconds': round(best, 4), 'lines_per_sec': round(len(lines) / best)}
+
+
+def benchmark_instrumentation(lines, repeat=3):
+    """
+    iter_parsed_logs를 PipelineMetrics 없이/있이 실행한 처리 속도와 오버헤드 비율 (instrumented / plain 소요 시간)
+    """
+    def run(metrics):
+        started = time.perf_counter()
+        for _ in alb_log_processor.iter_parsed_logs(lines, metrics=metrics):
+            pass
+        return time.perf_counter() - started
+
+    plain = min(run(None) for _ in range(repeat))
+    instrumented = min(run(alb_log_processor.PipelineMetrics()) for _ in range(repeat))
+    return {
+        'plain_lines_per_sec': round(len(lines) / plain),
+        'lines_per_sec': round(len(lines) / instrumented),
+        'overhead': round(instrumented / plain, 3),
+    }
+
+
+def benchmark_serialize(parsed, repeat=3):
+    """
+    출력 프로필별 직렬화 속도와 이벤트 크기 (비교용 json_dumps는 json.dumps(parsed, ensure_ascii=False))
+    """
+    serializers = {profile: alb_log_processor.get_serializer(profile) for profile in SERIALIZE_PROFILES}
+    serializers['json_dumps'] = lambda record: json.dumps(record, ensure_ascii=False)
+    results = {}
+    for name, serialize in serializers.items():
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for record in parsed:
+                serialize(record)
+            best = min(best, time.perf_counter() - started)
+        size = sum(len(serialize(record).encode('utf-8')) for record in parsed)
+        results[name] = {
+            'lines_per_sec': round(len(parsed) / best),
+            'bytes_per_line': round(size / len(parsed), 1),
+        }
+    return results
+
+
+# 새 인터프리터에서 실행: 모듈 import 시간과 첫 parse/serialize 호출 시간 (밀리초)
+COLD_START_SCRIPT = '''
+import importlib.util, json, sys, time
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("alb_log_processor", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+module.to_log_event(module.parse_alb_log(sys.argv[2]), module.get_serializer(module.OUTPUT_PROFILE))
+first_call = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "first_call_ms": (first_call - imported) * 1000}))
+'''
+
+
+def benchmark_cold_start(line, runs=COLD_START_RUNS):
+    """
+    모듈 import와 첫 호출 시간 (runs번 중 가장 빠른 값)
+    첫 실행은 .pyc 생성 비용이 포함되므로 버리고, Lambda처럼 AWS_ 환경 변수 없이 실행
+    """
+    env = {key: value for key, value in os.environ.items() if not key.startswith('AWS_')}
+    samples = []
+    for _ in range(runs + 1):
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START_SCRIPT, PROCESSOR_PATH, line],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+        samples.append(json.loads(output))
+    samples = samples[1:]
+    return {
+        'import_ms': round(min(sample['import_ms'] for sample in samples), 2),
+        'first_call_ms': round(min(sample['first_call_ms'] for sample in samples), 3),
+    }
+
+
+def benchmark_handler(path, lines=None):
+    """
+    로컬 S3/Logs 스텁으로 lambda_handler를 한 번 실행하여 처리량과 최대 RSS 측정
+    (handler 출력은 버림, 최대 RSS는 프로세스 전체 기준이므로 run_benchmarks는 크기마다 새 프로세스에서 실행)
+    """
+    size = os.path.getsize(path)
+    if lines is None:
+        with gzip.open(path, 'rb') as f:
+            uncompressed = lines = 0
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                uncompressed += len(chunk)
+                lines += chunk.count(b'\n')
+    else:
+        uncompressed = None
+
+    fake_logs = DiscardingLogsClient()
+    event = {'Records': [{'s3': {'bucket': {'name': 'benchmark'}, 'object': {'key': os.path.basename(path)}}}]}
+    saved = alb_log_processor.s3, alb_log_processor.logs
+    alb_log_processor.s3 = LocalS3Client({('benchmark', os.path.basename(path)): path})
+    alb_log_processor.logs = fake_logs
+    try:
+        # 짧게 끝나는 작은 파일은 측정 잡음을 줄이도록 1초 가까이 반복하고 가장 빠른 값 사용
+        seconds = float('inf')
+        runs = 0
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            while runs < MIN_HANDLER_RUNS or (runs < MAX_HANDLER_RUNS and seconds * runs < 1.0):
+                fake_logs.events = 0
+                started = time.perf_counter()
+                response = alb_log_processor.lambda_handler(event, None)
+                seconds = min(seconds, time.perf_counter() - started)
+                runs += 1
+                if response['statusCode'] != 200:
+                    break
+    finally:
+        alb_log_processor.s3, alb_log_processor.logs = saved
+    if response['statusCode'] != 200:
+        raise RuntimeError(f"lambda_handler failed: {response['body']}")
+
+    result = {
+        'lines': lines,
+        'compressed_mb': round(size / 1e6, 2),
+        'seconds': round(seconds, 3),
+        'runs': runs,
+        'lines_per_sec': round(lines / seconds),
+        'events_uploaded': fake_logs.events,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if uncompressed is not None:
+        result['mb_per_sec'] = round(uncompressed / 1e6 / seconds, 2)
+    return result
+
+
+def _benchmark_handler_isolated(path):
+    # 크기별 최대 RSS가 섞이지 않도록 새 인터프리터에서 실행
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), 'handler', path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_benchmarks(sizes_mb=DEFAULT_SIZES_MB, scenario='load', seed=0, work_dir=None, isolate=True):
+    """
+    파싱/직렬화 속도와 파일 크기별 lambda_handler 처리량/최대 RSS를 측정하여 결과 문서(dict) 반환
+    합성 로그는 work_dir에 저장하고 같은 이름의 파일이 있으면 재사용
+    """
+    with contextlib.ExitStack() as stack:
+        if work_dir is None:
+            work_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix='alb-benchmark-'))
+        os.makedirs(work_dir, exist_ok=True)
+
+        lines = list(itertools.islice(iter_synthetic_lines(scenario, seed), PARSE_BENCHMARK_LINES))
+        results = {
+            'scenario': scenario,
+            'seed': seed,
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+            },
+            'parse': benchmark_parse(lines),
+            'parse_record': benchmark_parse(lines, parse=alb_log_processor.parse_alb_record),
+            'serialize': benchmark_serialize([parsed for parsed in map(alb_log_processor.parse_alb_log, lines)
+                                              if parsed is not None]),
+            'cold_start': benchmark_cold_start(lines[0]),
+            'instrumentation': benchmark_instrumentation(lines),
+            'handler': [],
+        }
+        for size_mb in sizes_mb:
+            path = os.path.join(work_dir, f'synthetic-{scenario}-{seed}-{size_mb:g}mb.log.gz')
+            if not os.path.exists(path):
+                write_synthetic_log(f'{path}.tmp', int(size_mb * 1e6), scenario, seed)
+                os.replace(f'{path}.tmp', path)
+            result = _benchmark_handler_isolated(path) if isolate else benchmark_handler(path)
+            results['handler'].append({'size_mb': size_mb, **result})
+    return results
+
+
+def compare_results(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    결과를 기준값과 비교하여 회귀 목록(문자열) 반환
+    처리량(lines_per_sec, mb_per_sec)은 기준보다 tolerance 이상 낮으면,
+    peak_rss_mb, 직렬화 이벤트 크기(bytes_per_line), 콜드 스타트 시간, 계측 오버헤드 비율은 tolerance 이상 높으면 회귀
+    기준값에 없는 파일 크기는 비교하지 않음
+    """
+    regressions = []
+
+    def check(label, metric, value, expected, higher_is_better=True):
+        if value is None or expected is None:
+            return
+        if higher_is_better and value < expected * (1 - tolerance):
+            regressions.append(f"{label} {metric}: {value:g} < baseline {expected:g} (-{1 - value / expected:.0%})")
+        elif not higher_is_better and value > expected * (1 + tolerance):
+            regressions.append(f"{label} {metric}: {value:g} > baseline {expected:g} (+{value / expected - 1:.0%})")
+
+    for name in ('parse', 'parse_record'):
+        if name in baseline and name in current:
+            check(name, 'lines_per_sec', current[name]['lines_per_sec'], baseline[name]['lines_per_sec'])
+    for profile, expected in baseline.get('serialize', {}).items():
+        row = current.get('serialize', {}).get(profile)
+        if row is None:
+            continue
+        check(f"serialize {profile}", 'lines_per_sec', row['lines_per_sec'], expected.get('lines_per_sec'))
+        check(f"serialize {profile}", 'bytes_per_line', row['bytes_per_line'], expected.get('bytes_per_line'),
+              higher_is_better=False)
+    if 'instrumentation' in baseline and 'instrumentation' in current:
+        check('instrumentation', 'lines_per_sec', current['instrumentation']['lines_per_sec'],
+              baseline['instrumentation'].get('lines_per_sec'))
+        check('instrumentation', 'overhead', current['instrumentation']['overhead'],
+              baseline['instrumentation'].get('overhead'), higher_is_better=False)
+    if 'cold_start' in baseline and 'cold_start' in current:
+        for metric in ('import_ms', 'first_call_ms'):
+            check('cold_start', metric, current['cold_start'][metric], baseline['cold_start'].get(metric),
+                  higher_is_better=False)
+    expected_by_size = {row['size_mb']: row for row in baseline.get('handler', [])}
+    for row in current['handler']:
+        expected = expected_by_size.get(row['size_mb'])
+        if expected is None:
+            continue
+        label = f"handler {row['size_mb']:g}MB"
+        check(label, 'lines_per_sec', row['lines_per_sec'], expected.get('lines_per_sec'))
+        check(label, 'mb_per_sec', row.get('mb_per_sec'), expected.get('mb_per_sec'))
+        check(label, 'peak_rss_mb', row.get('peak_rss_mb'), expected.get('peak_rss_mb'), higher_is_better=False)
+    return regressions
+
+
+def format_results(results):
+    """
+    결과 문서를 표로 변환 (stdout 출력용)
+    """
+    lines = [
+        f"scenario={results['scenario']} seed={results['seed']} python={results['environment']['python']}",
+        f"parse_alb_log: {results['parse']['lines_per_sec']:,} lines/s",
+        f"parse_alb_record: {results['parse_record']['lines_per_sec']:,} lines/s",
+        'serialize: ' + ', '.join(f"{profile} {row['lines_per_sec']:,} lines/s {row['bytes_per_line']:g}B/line"
+                                  for profile, row in results['serialize'].items()),
+        f"cold start: import {results['cold_start']['import_ms']:g}ms, "
+        f"first call {results['cold_start']['first_call_ms']:g}ms",
+        f"instrumented parse: {results['instrumentation']['lines_per_sec']:,} lines/s "
+        f"(x{results['instrumentation']['overhead']:g} of plain)",
+        f"{'size':>8}{'lines':>12}{'seconds':>10}{'lines/s':>12}{'MB/s':>9}{'peak RSS':>11}",
+    ]
+    for row in results['handler']:
+        lines.append(
+            f"{row['size_mb']:>6g}MB{row['lines']:>12,}{row['seconds']:>10.2f}{row['lines_per_sec']:>12,}"
+            f"{row.get('mb_per_sec') or 0:>9.1f}{row.get('peak_rss_mb') or 0:>9.1f}MB"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='ALB 로그 처리 Lambda 벤치마크')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='합성 ALB 로그(gzip) 생성')
+    generate.add_argument('--scenario', choices=sorted(SCENARIOS), default='load')
+    generate.add_argument('--size-mb', type=float, default=10, help='압축 해제 기준 크기 (MB)')
+    generate.add_argument('--seed', type=int, default=0)
+    generate.add_argument('-o', '--output', required=True)
+
+    run = commands.add_parser('run', help='벤치마크 실행 후 기준값과 비교')
+    run.add_argument('--scenario', choices=sorted(SCENARIOS), default='load')
+    run.add_argument('--sizes', default=','.join(f'{size:g}' for size in DEFAULT_SIZES_MB),
+                     help='쉼표로 구분한 파일 크기 목록 (MB)')
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--work-dir', help='합성 로그 저장 디렉터리 (지정하면 다음 실행에서 재사용)')
+    run.add_argument('--output', help='결과 JSON 파일')
+    run.add_argument('--baseline', default=BASELINE_PATH, help='비교할 기준값 JSON (없으면 비교 생략)')
+    run.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    run.add_argument('--update-baseline', action='store_true', help='결과를 기준값 파일에 저장')
+
+    handler = commands.add_parser('handler', help='(내부용) 파일 하나로 lambda_handler 측정 후 JSON 출력')
+    handler.add_argument('path')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        stats = write_synthetic_log(args.output, int(args.size_mb * 1e6), args.scenario, args.seed)
+        print(json.dumps(stats))
+        return 0
+    if args.command == 'handler':
+        print(json.dumps(benchmark_handler(args.path)))
+        return 0
+
+    sizes = [float(size) for size in args.sizes.split(',') if size]
+    results = run_benchmarks(sizes, args.scenario, args.seed, args.work_dir)
+    print(format_results(results))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        return 0
+
+    if not args.baseline or not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('scenario') != results['scenario']:
+        print(f"baseline scenario {baseline.get('scenario')} != {results['scenario']}, skipping comparison",
+              file=sys.stderr)
+        return 0
+    regressions = compare_results(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"PERFORMANCE REGRESSION: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,260 +1,3135 @@
+import codecs
+import functools
+import hashlib
 import json
-import boto3
-import gzip
+import operator
+import os
+import random
 import re
+import sys
+import tempfile
+import threading
 import time
-from datetime import datetime
-from io import BytesIO
-from urllib.parse import urlparse
+import zlib
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import NamedTuple, Optional, Tuple
+from urllib.parse import unquote_plus
 
-s3 = boto3.client('s3')
-logs = boto3.client('logs')
+try:
+    # 선택 의존성: 설치되어 있으면 compact 출력 직렬화에 사용
+    import orjson
+except ImportError:
+    orjson = None
 
 LOG_GROUP_NAME = '/aws/alb/flash-ticket'
 LOG_STREAM_NAME = 'alb-access-logs'
 
+# 로그 스트림 샤딩 (스트림당 수집 한도를 동시 실행 Lambda 수만큼 분산)
+# - none: 단일 스트림 (LOG_STREAM_NAME)
+# - service: 서비스별 스트림 (alb-access-logs/service/flash-api)
+# - node: ALB 노드별 스트림, S3 키의 노드 IP 사용 (alb-access-logs/node/10.0.1.5)
+# - hash: S3 키 해시로 LOG_STREAM_SHARDS개 중 하나 선택 (alb-access-logs/shard/3)
+LOG_STREAM_SHARDING = os.environ.get('LOG_STREAM_SHARDING', 'none')
+LOG_STREAM_SHARDS = int(os.environ.get('LOG_STREAM_SHARDS', '8'))
+
+# 스트리밍 처리 설정
+# 파일 전체를 메모리에 올리지 않고 청크 단위로 읽고/해제하고/업로드하여
+# 객체 크기와 무관하게 최대 메모리 사용량을 일정하게 유지
+READ_CHUNK_SIZE = 1024 * 1024          # S3 StreamingBody에서 한 번에 읽을 압축 바이트 수
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024    # 한 번의 해제 호출에서 생성할 최대 바이트 수 (압축 폭탄 방지)
+GZIP_WBITS = 16 + zlib.MAX_WBITS       # zlib에서 gzip 헤더/트레일러를 처리하기 위한 wbits
+
+# CloudWatch Logs PutLogEvents 제한
+# https://docs.aws.amazon.com/AmazonCloudWatchLogs/latest/APIReference/API_PutLogEvents.html
+MAX_BATCH_EVENTS = 10000                     # 배치당 최대 이벤트 수
+MAX_BATCH_BYTES = 1048576                    # 배치당 최대 바이트 (UTF-8 메시지 + 이벤트당 오버헤드)
+EVENT_OVERHEAD_BYTES = 26                    # 이벤트당 추가로 계산되는 바이트
+MAX_EVENT_BYTES = 262144 - EVENT_OVERHEAD_BYTES  # 단일 이벤트 최대 메시지 크기
+MAX_BATCH_SPAN_MS = 24 * 60 * 60 * 1000      # 한 배치 안의 타임스탬프 범위는 24시간 이내
+
+# 업로드 병렬도 및 재시도 설정
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', '4'))
+UPLOAD_MAX_RETRIES = int(os.environ.get('UPLOAD_MAX_RETRIES', '6'))
+UPLOAD_BACKOFF_BASE = 0.1   # 초
+UPLOAD_BACKOFF_CAP = 5.0    # 초
+# 서비스/라우트/상태 코드 클래스/분 단위 집계 메트릭 (CloudWatch Embedded Metric Format)
+# EMF 문서는 stdout으로 출력하면 Lambda 로그 그룹에서 메트릭으로 추출됨
+EMIT_METRICS = os.environ.get('EMIT_METRICS', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'FlashTicket/ALB')
+EMF_MAX_VALUES = 100  # EMF 메트릭 값 배열의 최대 길이
+# 서비스 차원 문서는 라우트 버킷을 합친 히스토그램으로 따로 출력 (버킷별 값 배열을 합치면 요청이 많은 버킷의 비중이 줄어듦)
+SERVICE_METRIC_DIMENSIONS = [['Service']]
+ROUTE_METRIC_DIMENSIONS = [['Service', 'Route', 'StatusClass']]
+
+# 처리 단계별 계측 (fetch/decompress/parse/classify/serialize/sort/upload)
+# 라인 단위 단계(parse/classify/serialize)는 STAGE_SAMPLE_INTERVAL 라인마다 한 번만 측정하고 전체 라인 수로 환산
+# PROFILE_SAMPLE_RATE 비율의 호출은 cProfile/tracemalloc으로 프로파일링하여 상위 PROFILE_TOP_N 항목을 로그로 출력
+PIPELINE_STAGES = ('fetch', 'decompress', 'parse', 'classify', 'serialize', 'sort', 'upload', 'upload_wait')
+PIPELINE_COUNTERS = (
+    'lines_seen', 'lines_skipped', 'lines_filtered', 'parse_failures', 'malformed_timestamps',
+    'events_dropped', 'events_sampled_out', 'bytes_in', 'bytes_decompressed', 'bytes_out'
+)
+STAGE_SAMPLE_INTERVAL = int(os.environ.get('STAGE_SAMPLE_INTERVAL', '16'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', '20'))
+
+# 원본 이벤트 전송 비율 (1.0: 전체, 0.0: sample 규칙/기본 비율 대상은 전송 안 함 → 집계 메트릭만 사용)
+# sample 규칙과 기본 비율에 곱해서 적용 (트레이스 ID 기반으로 결정적), keep 규칙(에러, 느린 요청)은 항상 전송
+RAW_EVENT_SAMPLE_RATE = float(os.environ.get('RAW_EVENT_SAMPLE_RATE', '1.0'))
+
+# 전송하는 원본 이벤트의 출력 형식
+# - full: parse_alb_log 결과 전체 (기존 형식, 대시보드의 "key": value 파싱과 호환)
+# - compact: 짧은 키, null 생략, raw_message/timestamp_ms 제외
+# - raw: ALB 원본 라인 그대로 (샘플링된 이벤트의 sample_weight는 기록되지 않음)
+OUTPUT_PROFILE = os.environ.get('OUTPUT_PROFILE', 'full')
+FULL_OUTPUT_KEYS = (
+    'type', 'time', 'status_code', 'target_status_code', 'response_time_ms',
+    'request_processing_time_ms', 'target_processing_time_ms', 'response_processing_time_ms',
+    'service', 'request_path', 'route', 'http_method', 'raw_message', 'timestamp_ms'
+)
+COMPACT_OUTPUT_KEYS = {
+    'type': 'ty',
+    'time': 't',
+    'status_code': 's',
+    'target_status_code': 'ts',
+    'response_time_ms': 'rt',
+    'request_processing_time_ms': 'rq',
+    'target_processing_time_ms': 'tg',
+    'response_processing_time_ms': 'rs',
+    'service': 'sv',
+    'request_path': 'p',
+    'route': 'r',
+    'http_method': 'm',
+}
+
+# 한 번의 호출에 포함된 S3 객체들을 동시에 처리할 워커 수
+OBJECT_CONCURRENCY = int(os.environ.get('OBJECT_CONCURRENCY', '4'))
+
+# 분석용 컬럼 파일 내보내기 (비어 있으면 비활성, s3://bucket/prefix 또는 로컬 디렉토리)
+# date=YYYY-MM-DD/hour=HH/service=<서비스>/part-<객체 키 해시>.<parquet|albc> 로 분할 저장
+# - parquet: pyarrow 필요 (zstd 압축)
+# - albc: 순수 Python 대체 포맷 (zlib 압축 컬럼 청크 + 푸터 인덱스)
+# - auto: pyarrow가 있으면 parquet, 없으면 albc
+COLUMNAR_EXPORT_PREFIX = os.environ.get('COLUMNAR_EXPORT_PREFIX', '')
+COLUMNAR_FORMAT = os.environ.get('COLUMNAR_FORMAT', 'auto')
+COLUMNAR_ROW_GROUP_SIZE = int(os.environ.get('COLUMNAR_ROW_GROUP_SIZE', '65536'))
+# 파일에 저장하는 컬럼 (service/날짜/시간은 파티션 경로에 있으므로 제외)
+COLUMNAR_SCHEMA = (
+    ('timestamp_ms', 'int64'),
+    ('status_code', 'int32'),
+    ('target_status_code', 'int32'),
+    ('response_time_ms', 'int64'),
+    ('request_processing_time_ms', 'int64'),
+    ('target_processing_time_ms', 'int64'),
+    ('response_processing_time_ms', 'int64'),
+    ('route', 'string'),
+    ('request_path', 'string'),
+    ('http_method', 'string'),
+    ('sample_weight', 'float64'),
+)
+ALBC_MAGIC = b'ALBC'
+ALBC_VERSION = 1
+
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'ServiceUnavailableException',
+    'InvalidSequenceTokenException',
+    'OperationAbortedException',
+}
+
+# boto3 클라이언트 (콜드 스타트를 줄이기 위해 boto3 import와 생성을 처음 사용할 때로 미루고 웜 스타트 간 재사용)
+# 커넥션 풀은 동시 업로드 스레드 수(객체 동시 처리 수 x 객체당 업로드 동시 수) 이상으로 설정
+s3 = None
+logs = None
+_client_lock = threading.Lock()
+CLIENT_MAX_POOL_CONNECTIONS = int(os.environ.get(
+    'CLIENT_MAX_POOL_CONNECTIONS', str(max(10, OBJECT_CONCURRENCY * UPLOAD_CONCURRENCY))))
+CLIENT_MAX_ATTEMPTS = int(os.environ.get('CLIENT_MAX_ATTEMPTS', '3'))  # S3/DynamoDB 클라이언트 (logs는 직접 재시도)
+
+# 처리한 S3 객체 인덱스 (bucket/key/ETag 단위, 중복 전달된 S3 이벤트와 재시도에서 다시 업로드하지 않도록)
+# - 비어 있으면 비활성
+# - sqlite:///path/to/index.db: 로컬 SQLite 파일 (테스트, 백필)
+# - dynamodb://<table>: DynamoDB 테이블 (파티션 키 object(S), 정렬 키 etag(S), TTL 속성 expires_at)
+DEDUP_INDEX = os.environ.get('DEDUP_INDEX', '')
+DEDUP_TTL_DAYS = int(os.environ.get('DEDUP_TTL_DAYS', '14'))
+object_index = None
+
+# ALB Access Log 필드 (문서에 정의된 순서)
+# https://docs.aws.amazon.com/elasticloadbalancing/latest/application/load-balancer-access-logs.html
+ALB_LOG_FIELDS = (
+    'type',                        # 0: http/https/h2/grpcs/ws/wss
+    'time',                        # 1: 응답 생성 시각 (ISO 8601)
+    'elb',                         # 2: ALB 리소스 ID
+    'client',                      # 3: client:port
+    'target',                      # 4: target:port (대상에 연결되지 않으면 -)
+    'request_processing_time',     # 5: 초 (-1: 대상으로 전달되지 않음)
+    'target_processing_time',      # 6: 초
+    'response_processing_time',    # 7: 초
+    'elb_status_code',             # 8
+    'target_status_code',          # 9
+    'received_bytes',              # 10
+    'sent_bytes',                  # 11
+    'request',                     # 12: "GET /path HTTP/1.1"
+    'user_agent',                  # 13
+    'ssl_cipher',                  # 14
+    'ssl_protocol',                # 15
+    'target_group_arn',            # 16
+    'trace_id',                    # 17: X-Amzn-Trace-Id (Root=...)
+    'domain_name',                 # 18: SNI 도메인
+    'chosen_cert_arn',             # 19
+    'matched_rule_priority',       # 20
+    'request_creation_time',       # 21
+    'actions_executed',            # 22: 쉼표로 구분된 액션 목록
+    'redirect_url',                # 23
+    'error_reason',                # 24
+    'target_port_list',            # 25: 공백으로 구분된 target:port 목록
+    'target_status_code_list',     # 26
+    'classification',              # 27
+    'classification_reason',       # 28
+    'conn_trace_id',               # 29
+)
+ALB_LOG_FIELD_COUNT = len(ALB_LOG_FIELDS)
+ALB_REQUEST_FIELD_INDEX = 12  # 따옴표로 감싸진 첫 번째 필드 (앞의 12개 필드는 공백이 없음)
+ALB_QUOTED_PIECES = 25  # 현재 포맷에서 요청 필드부터 끝까지를 따옴표로 나눈 조각 수 (따옴표 필드 12개)
+
+HTTP_METHODS = frozenset(('GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'HEAD', 'OPTIONS', 'CONNECT', 'TRACE'))
+
+# 요청 경로 → 서비스 라우트 테이블 (listener-rules.json과 같은 디렉토리의 route-table.json)
+ROUTE_TABLE_PATH = os.environ.get(
+    'ROUTE_TABLE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'route-table.json')
+)
+ROUTE_CACHE_SIZE = int(os.environ.get('ROUTE_CACHE_SIZE', '4096'))  # 경로별 분류 결과 LRU 캐시 크기
+ID_SEGMENT = '{id}'
+
+# 원본 이벤트 선택 규칙 (route-table.json과 같은 디렉토리의 sampling-rules.json)
+SAMPLING_RULES_PATH = os.environ.get(
+    'SAMPLING_RULES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sampling-rules.json')
+)
+SAMPLING_CACHE_SIZE = int(os.environ.get('SAMPLING_CACHE_SIZE', '4096'))  # 규칙 판정 결과 LRU 캐시 크기
+
+# sampling-rules.json이 없을 때의 규칙: 기존 동작과 같이 target에 도달하지 않은 요청만 제외
+DEFAULT_SAMPLING_RULES = {
+    'DefaultSampleRate': 1.0,
+    'Rules': [
+        {'Name': 'unreached-target', 'Match': {'Unreached': True}, 'Action': 'drop'},
+    ]
+}
+
+# route-table.json이 배포 패키지에 없을 때 사용하는 기본 라우트 테이블 (파일과 동일한 내용)
+DEFAULT_ROUTE_TABLE = {
+    'DefaultService': 'flash-gateway',
+    'DefaultRoute': '/*',
+    'IdSegmentPatterns': [
+        '^[0-9]+$',
+        '^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$',
+        '^(?=.*[0-9])[0-9a-fA-F]{12,}$',
+        '^[A-Za-z0-9_-]{24,}$',
+    ],
+    'MetricRoutes': [
+        '/',
+        '/auth/register',
+        '/auth/register/admin',
+        '/auth/login',
+        '/auth/refresh',
+        '/auth/logout',
+        '/queue/enqueue',
+        '/queue/status',
+        '/queue/enter',
+        '/queue/healthz',
+        '/events',
+        '/events/{id}',
+        '/orders',
+        '/orders/{id}',
+        '/payments',
+        '/payments/callback',
+        '/payments/{id}',
+        '/products',
+        '/products/{id}',
+        '/api/events',
+        '/api/events/{id}',
+        '/api/orders',
+        '/api/orders/{id}',
+        '/api/payments',
+        '/api/payments/callback',
+        '/api/payments/{id}',
+        '/api/pay',
+        '/api/products',
+        '/api/products/{id}',
+        '/health',
+        '/live',
+        '/metrics',
+    ],
+    'Routes': [
+        {'Prefix': '/api/payments', 'Service': 'flash-api-payment'},
+        {'Prefix': '/api/pay', 'Service': 'flash-api-payment'},
+        {'Prefix': '/api/orders', 'Service': 'flash-api-order'},
+        {'Prefix': '/api', 'Service': 'flash-api'},
+        {'Prefix': '/payments', 'Service': 'flash-api-payment'},
+        {'Prefix': '/events', 'Service': 'flash-api'},
+        {'Prefix': '/queue', 'Service': 'flash-gateway-queue'},
+        {'Prefix': '/orders', 'Service': 'flash-gateway-orders'},
+        {'Prefix': '/products', 'Service': 'flash-gateway-products'},
+        {'Prefix': '/auth', 'Service': 'flash-gateway'},
+        {'Prefix': '/health', 'Service': 'flash-gateway'},
+        {'Prefix': '/live', 'Service': 'flash-gateway'},
+        {'Prefix': '/metrics', 'Service': 'flash-gateway'},
+    ],
+}
+
+# 타임스탬프 디코딩 캐시 ('YYYY-MM-DDTHH:MM:SS' → epoch 초)
+# ALB 로그는 거의 시간순이라 수천 라인이 같은 초를 공유함
+TIMESTAMP_CACHE_SIZE = 4096
+_epoch_seconds_cache = {}
+
+# 처리 시간 필드 변환 캐시 ((요청, 대상, 응답 처리 시간 문자열) → 밀리초 튜플)
+# 처리 시간은 밀리초 단위라 같은 조합이 반복됨
+TIMINGS_CACHE_SIZE = 16384
+_timings_cache = {}
+_NO_TIMINGS = (None, None, None, None)
+
+# 상태 코드 문자열 → 정수 ('-'는 None, 그 외 값은 int 변환)
+_STATUS_CODES = {str(code): code for code in range(100, 600)}
+_STATUS_CODES['-'] = None
+
+# 타임스탬프 소수부 앞 4자리('.123') → 밀리초
+_FRACTION_MILLIS = {f'.{millis:03d}': millis for millis in range(1000)}
+_DAYS_IN_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# 이스케이프된 따옴표(\")가 포함된 라인에서만 사용하는 토큰 패턴
+_QUOTED_TOKEN_PATTERN = re.compile(r'"([^"\\]*(?:\\.[^"\\]*)*)"|(\S+)')
+
+
+def tokenize_alb_log(line, max_fields=ALB_LOG_FIELD_COUNT):
+    """
+    ALB 로그 라인을 한 번의 왼쪽→오른쪽 스캔으로 필드 리스트로 분리 (따옴표 필드는 따옴표 제거)
+
+    앞의 12개 필드는 공백이 없으므로 str.split 한 번으로 분리하고,
+    나머지는 따옴표 기준으로 나눠서 따옴표 안의 공백(user agent 등)을 보존함
+    max_fields까지만 분리하므로 필요한 필드가 앞쪽에 있으면 라인 뒷부분은 스캔하지 않음
+    """
+    tokens = line.split(' ', ALB_REQUEST_FIELD_INDEX)
+    if len(tokens) <= ALB_REQUEST_FIELD_INDEX or max_fields <= ALB_REQUEST_FIELD_INDEX:
+        return tokens[:max_fields]
+
+    rest = tokens.pop()
+    if max_fields == ALB_REQUEST_FIELD_INDEX + 1 and rest[:1] == '"':
+        # 요청 필드까지만 필요한 경우 (parse_alb_log의 핫패스)
+        end = rest.find('"', 1)
+        if end > 0 and rest[end - 1] != '\\':
+            tokens.append(rest[1:end])
+            return tokens
+
+    # 따옴표로 나누면 홀수 번째 조각이 따옴표 안의 값, 짝수 번째 조각이 따옴표 밖의 필드들
+    pieces = rest.split('"')
+    if max_fields == ALB_LOG_FIELD_COUNT and len(pieces) == ALB_QUOTED_PIECES and '\\"' not in rest:
+        # 현재 포맷의 전체 필드 (parse_alb_record의 핫패스): 따옴표 밖 필드가 있는 조각만 다시 분리
+        append = tokens.append
+        append(pieces[1])
+        append(pieces[3])
+        tokens += pieces[4].split()    # ssl_cipher ssl_protocol target_group_arn
+        append(pieces[5])
+        append(pieces[7])
+        append(pieces[9])
+        tokens += pieces[10].split()   # matched_rule_priority request_creation_time
+        tokens += pieces[11:24:2]      # actions_executed ~ classification_reason
+        tokens += pieces[24].split()   # conn_trace_id
+        if len(tokens) == ALB_LOG_FIELD_COUNT:
+            return tokens
+        del tokens[ALB_REQUEST_FIELD_INDEX:]
+    if any(piece[-1:] == '\\' for piece in pieces[1::2]):
+        # 이스케이프된 따옴표(\")가 있으면 정규식 스캐너로 처리 (드문 경우)
+        for quoted, bare in _QUOTED_TOKEN_PATTERN.findall(rest):
+            tokens.append(quoted if bare == '' else bare)
+            if len(tokens) >= max_fields:
+                break
+        return tokens
+
+    append = tokens.append
+    extend = tokens.extend
+    if pieces[0]:
+        extend(pieces[0].split())
+    for i in range(1, len(pieces), 2):
+        append(pieces[i])
+        if i + 1 < len(pieces) and pieces[i + 1] != ' ':
+            extend(pieces[i + 1].split())
+        if len(tokens) >= max_fields:
+            break
+    return tokens[:max_fields]
+
+
+class AlbLogRecord(NamedTuple):
+    """
+    ALB Access Log 한 줄의 전체 필드 (타입 변환 완료, '-'는 None)
+    """
+    type: str
+    time: str
+    elb: str
+    client_ip: Optional[str]
+    client_port: Optional[int]
+    target_ip: Optional[str]
+    target_port: Optional[int]
+    request_processing_time: Optional[float]
+    target_processing_time: Optional[float]
+    response_processing_time: Optional[float]
+    elb_status_code: Optional[int]
+    target_status_code: Optional[int]
+    received_bytes: Optional[int]
+    sent_bytes: Optional[int]
+    http_method: Optional[str]
+    request_url: Optional[str]
+    http_version: Optional[str]
+    user_agent: Optional[str]
+    ssl_cipher: Optional[str]
+    ssl_protocol: Optional[str]
+    target_group_arn: Optional[str]
+    trace_id: Optional[str]
+    domain_name: Optional[str]
+    chosen_cert_arn: Optional[str]
+    matched_rule_priority: Optional[int]
+    request_creation_time: Optional[str]
+    actions_executed: Tuple[str, ...]
+    redirect_url: Optional[str]
+    error_reason: Optional[str]
+    target_port_list: Tuple[str, ...]
+    target_status_code_list: Tuple[str, ...]
+    classification: Optional[str]
+    classification_reason: Optional[str]
+    conn_trace_id: Optional[str]
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _split_host_port(value):
+    if value is None:
+        return None, None
+    host, sep, port = value.rpartition(':')
+    if not sep:
+        return value, None
+    return host, _int_or_none(port)
+
+
+def parse_alb_record(line):
+    """
+    ALB 로그 라인을 전체 필드가 타입 변환된 AlbLogRecord로 파싱
+    필드가 부족한 (구버전 포맷) 라인은 없는 필드를 None으로 채움
+
+    '-'/빈 값은 리스트 컴프리헨션 한 번으로 None으로 바꾸고, 숫자 필드는 묶어서 한 번에 변환한 뒤
+    실패할 때만 필드별로 다시 변환 (필드마다 헬퍼를 호출하지 않음)
+    """
+    tokens = tokenize_alb_log(line)
+    if len(tokens) < 3:
+        return None
+    if len(tokens) < ALB_LOG_FIELD_COUNT:
+        tokens += [None] * (ALB_LOG_FIELD_COUNT - len(tokens))
+
+    log_type, log_time, elb = tokens[0], tokens[1], tokens[2]
+    (client, target, request_seconds, target_seconds, response_seconds, elb_status, target_status,
+     received_bytes, sent_bytes, request, user_agent, ssl_cipher, ssl_protocol, target_group_arn, trace_id,
+     domain_name, chosen_cert_arn, matched_rule_priority, request_creation_time, actions_executed, redirect_url,
+     error_reason, target_port_list, target_status_code_list, classification, classification_reason,
+     conn_trace_id) = [None if value == '-' or value == '' else value for value in tokens[3:]]
+
+    client_ip, client_port = _split_host_port(client)
+    target_ip, target_port = _split_host_port(target)
+
+    http_method = request_url = http_version = None
+    if request:
+        parts = request.split(' ', 2)
+        http_method = parts[0] if parts[0] not in ('-', '') else None
+        if len(parts) > 1:
+            request_url = parts[1] if parts[1] not in ('-', '') else None
+        if len(parts) > 2:
+            http_version = parts[2] if parts[2] not in ('-', '') else None
+
+    try:
+        timings = float(request_seconds), float(target_seconds), float(response_seconds)
+    except (TypeError, ValueError):
+        timings = _float_or_none(request_seconds), _float_or_none(target_seconds), _float_or_none(response_seconds)
+    try:
+        sizes = int(received_bytes), int(sent_bytes)
+    except (TypeError, ValueError):
+        sizes = _int_or_none(received_bytes), _int_or_none(sent_bytes)
+
+    # 필드 순서대로 튜플을 만들어 키워드 인자 처리 없이 생성 (AlbLogRecord 필드 순서와 일치해야 함)
+    return tuple.__new__(AlbLogRecord, (
+        log_type,
+        log_time,
+        elb,
+        client_ip,
+        client_port,
+        target_ip,
+        target_port,
+        *timings,
+        _STATUS_CODES[elb_status] if elb_status in _STATUS_CODES else _int_or_none(elb_status),
+        _STATUS_CODES[target_status] if target_status in _STATUS_CODES else _int_or_none(target_status),
+        *sizes,
+        http_method,
+        request_url,
+        http_version,
+        user_agent,
+        ssl_cipher,
+        ssl_protocol,
+        target_group_arn,
+        trace_id,
+        domain_name,
+        chosen_cert_arn,
+        _int_or_none(matched_rule_priority),
+        request_creation_time,
+        tuple(actions_executed.split(',')) if actions_executed else (),
+        redirect_url,
+        error_reason,
+        tuple(target_port_list.split()) if target_port_list else (),
+        tuple(target_status_code_list.split()) if target_status_code_list else (),
+        classification,
+        classification_reason,
+        conn_trace_id,
+    ))
+
+
+class RouteTable:
+    """
+    요청 경로 → (서비스, 라우트 템플릿) 분류기
+
+    설정의 Prefix를 세그먼트 튜플로 컴파일해 두고, 경로를 세그먼트 단위로 잘라
+    가장 긴 prefix부터 dict 조회로 매칭함 ('/api/pay'는 '/api/payments'와 매칭되지 않음)
+    ID 세그먼트(숫자, UUID, 긴 해시 등)는 {id}로 정규화하여 라우트 템플릿을 만듦
+    예: /api/orders/123 → ('flash-api-order', '/api/orders/{id}')
+
+    분류 결과는 원본 경로를 키로 하는 LRU 캐시에 저장되므로
+    같은 경로가 반복되는 일반적인 경우 dict 조회 한 번으로 끝남
+
+    집계 메트릭의 Route 차원은 metric_route로 MetricRoutes에 설정된 템플릿만 남기고
+    나머지(스캐너 경로 등)는 매칭된 prefix 기준 '<prefix>/*'로 합쳐 값의 개수를 설정 크기로 제한함
+    예: /api/.env, /api/wp-admin/setup.php → '/api/*'
+    """
+
+    def __init__(self, config, cache_size=ROUTE_CACHE_SIZE):
+        self.default_service = config.get('DefaultService', 'unknown')
+        self.default_route = config.get('DefaultRoute', '/*')
+
+        patterns = config.get('IdSegmentPatterns', [])
+        self._id_pattern = re.compile('|'.join(f'(?:{p})' for p in patterns)) if patterns else None
+
+        # 같은 prefix가 여러 번 정의되면 먼저 정의된 것이 우선
+        self._prefixes = {}
+        for route in config.get('Routes', []):
+            segments = tuple(s for s in route['Prefix'].split('/') if s)
+            self._prefixes.setdefault(segments, route['Service'])
+        self._max_depth = max(map(len, self._prefixes), default=0)
+        self._metric_routes = frozenset(config.get('MetricRoutes', []))
+
+        self.classify = functools.lru_cache(maxsize=cache_size)(self._classify)
+        self.metric_route = functools.lru_cache(maxsize=cache_size)(self._metric_route)
+
+    def _classify(self, path):
+        id_pattern = self._id_pattern
+        segments = tuple(
+            ID_SEGMENT if id_pattern is not None and id_pattern.match(s) else s
+            for s in path.split('/') if s
+        )
+        if not segments:
+            return self._prefixes.get((), self.default_service), '/'
+
+        for depth in range(min(len(segments), self._max_depth), -1, -1):
+            service = self._prefixes.get(segments[:depth])
+            if service is not None:
+                return service, '/' + '/'.join(segments)
+
+        return self.default_service, self.default_route
+
+    def _metric_route(self, route):
+        # 설정된 템플릿과 prefix 자체는 그대로, 그 외는 가장 긴 prefix + '/*'
+        if route in self._metric_routes or route == self.default_route:
+            return route
+        segments = tuple(s for s in route.split('/') if s)
+        if segments in self._prefixes:
+            return route
+        for depth in range(min(len(segments), self._max_depth), 0, -1):
+            if segments[:depth] in self._prefixes:
+                return '/' + '/'.join(segments[:depth]) + '/*'
+        return self.default_route
+
+
+def load_route_table(path=ROUTE_TABLE_PATH):
+    """
+    JSON 라우트 테이블을 읽어 RouteTable 생성 (파일이 없으면 기본 테이블 사용)
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = DEFAULT_ROUTE_TABLE
+    return RouteTable(config)
+
+
+# 웜 스타트 간에 재사용 (컴파일된 테이블 + 분류 캐시)
+ROUTE_TABLE = load_route_table()
+
+
+class SamplingRule(NamedTuple):
+    """
+    컴파일된 샘플링 규칙 (None인 조건은 검사하지 않음)
+    """
+    name: str
+    action: str
+    rate: float
+    services: Optional[frozenset]
+    routes: Optional[Tuple[str, ...]]
+    methods: Optional[frozenset]
+    min_status: Optional[int]
+    max_status: Optional[int]
+    unreached: Optional[bool]
+    slow: Optional[bool]
+
+    def matches(self, service, route, method, status_code, slow, unreached):
+        if self.unreached is not None and self.unreached != unreached:
+            return False
+        if self.slow is not None and self.slow != slow:
+            return False
+        if self.min_status is not None and (status_code is None or status_code < self.min_status):
+            return False
+        if self.max_status is not None and (status_code is None or status_code > self.max_status):
+            return False
+        if self.services is not None and service not in self.services:
+            return False
+        if self.methods is not None and method not in self.methods:
+            return False
+        if self.routes is not None:
+            if route is None:
+                return False
+            # 세그먼트 단위 prefix 매칭 ('/health'는 '/health/db'와 매칭, '/healthz'와는 매칭되지 않음)
+            return any(route == prefix or route.startswith(prefix + '/') for prefix in self.routes)
+        return True
+
+
+def trace_sample_point(line):
+    """
+    ALB 로그 라인의 X-Amzn-Trace-Id Root 값을 [0, 1) 구간의 값으로 해시 (crc32 / 2^32)
+    같은 요청은 어느 홉에서 같은 방식으로 샘플링해도 같은 결정을 받음
+    트레이스 필드가 없으면 라인 전체를 해시
+    """
+    # 따옴표로 감싼 필드 안의 따옴표는 \"로 이스케이프되므로 ' "'는 필드 시작에서만 나타남
+    start = line.find(' "Root=')
+    if start >= 0:
+        start += 7
+    else:
+        start = line.find(' "Self=')
+        if start >= 0:
+            start = line.find('Root=', start, line.find('"', start + 2))
+            if start >= 0:
+                start += 5
+    if start < 0:
+        key = line
+    else:
+        end = line.find('"', start)
+        separator = line.find(';', start, end)
+        key = line[start:separator if separator >= 0 else end]
+    return zlib.crc32(key.encode('utf-8')) / 4294967296
+
+
+class SamplingRules:
+    """
+    파싱 결과 → 원본 이벤트 전송 여부와 샘플 가중치를 판정하는 규칙 엔진
+
+    규칙은 위에서부터 처음 매칭되는 것을 적용하고 (keep: 1.0, drop: 0.0, sample: SampleRate),
+    매칭되는 규칙이 없으면 DefaultSampleRate 적용
+    전체 비율(scale, RAW_EVENT_SAMPLE_RATE)은 sample 규칙과 기본 비율에만 곱하고 keep 규칙은 항상 전송
+    판정에 쓰이는 값(서비스, 라우트, 메서드, 상태 코드, 느림 여부, target 도달 여부)을 키로
+    결과를 LRU 캐시에 저장하므로 반복되는 요청 유형은 dict 조회 한 번으로 끝남
+
+    비율이 1 미만이면 트레이스 ID 해시로 결정적으로 샘플링하고,
+    전송하는 이벤트에는 sample_weight(1 / 비율)를 기록하여 전체 건수를 복원할 수 있게 함
+    """
+
+    def __init__(self, config, cache_size=SAMPLING_CACHE_SIZE):
+        self.default_rate = float(config.get('DefaultSampleRate', 1.0))
+        thresholds = dict(config.get('SlowThresholdsMs', {}))
+        self._default_slow_ms = thresholds.pop('Default', None)
+        self._slow_ms = thresholds
+        self.rules = tuple(self._compile(rule) for rule in config.get('Rules', []))
+        self._default_rule = SamplingRule('default', 'sample', self.default_rate, *[None] * 7)
+        self.decide = functools.lru_cache(maxsize=cache_size)(self._decide)
+
+    @staticmethod
+    def _compile(rule):
+        action = rule.get('Action', 'sample')
+        if action == 'keep':
+            rate = 1.0
+        elif action == 'drop':
+            rate = 0.0
+        elif action == 'sample':
+            rate = float(rule['SampleRate'])
+        else:
+            raise ValueError(f"Unknown sampling action: {action}")
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError(f"SampleRate must be between 0 and 1: {rate}")
+
+        match = rule.get('Match', {})
+        unknown = set(match) - {'Services', 'Routes', 'Methods', 'MinStatus', 'MaxStatus', 'Unreached', 'Slow'}
+        if unknown:
+            raise ValueError(f"Unknown sampling match keys: {sorted(unknown)}")
+        return SamplingRule(
+            name=rule.get('Name', action),
+            action=action,
+            rate=rate,
+            services=frozenset(match['Services']) if 'Services' in match else None,
+            routes=tuple(prefix.rstrip('/') or '/' for prefix in match['Routes']) if 'Routes' in match else None,
+            methods=frozenset(match['Methods']) if 'Methods' in match else None,
+            min_status=match.get('MinStatus'),
+            max_status=match.get('MaxStatus'),
+            unreached=match.get('Unreached'),
+            slow=match.get('Slow')
+        )
+
+    def _decide(self, service, route, method, status_code, slow, unreached):
+        for rule in self.rules:
+            if rule.matches(service, route, method, status_code, slow, unreached):
+                return rule
+        return self._default_rule
+
+    def rate_for(self, parsed, scale=1.0):
+        """
+        파싱 결과에 적용되는 (규칙 이름, 전송 비율)
+        scale은 sample 규칙과 기본 비율에 곱하는 전체 비율 (RAW_EVENT_SAMPLE_RATE, keep 규칙에는 적용하지 않음)
+        """
+        latency = parsed['response_time_ms']
+        service = parsed['service']
+        threshold = self._slow_ms.get(service, self._default_slow_ms)
+        rule = self.decide(
+            service, parsed['route'], parsed['http_method'], parsed['status_code'],
+            latency is not None and threshold is not None and latency >= threshold,
+            latency is None
+        )
+        return rule.name, rule.rate if rule.action == 'keep' else rule.rate * scale
+
+    def sample_weight(self, parsed, scale=1.0):
+        """
+        전송하지 않으면 0.0, 전송하면 샘플 가중치(1 / 비율) 반환
+        scale은 sample 규칙과 기본 비율에 곱하는 전체 비율 (RAW_EVENT_SAMPLE_RATE)
+        """
+        rate = self.rate_for(parsed, scale)[1]
+        if rate >= 1.0:
+            return 1.0
+        if rate <= 0.0 or trace_sample_point(parsed['raw_message']) >= rate:
+            return 0.0
+        return 1.0 / rate
+
+
+def load_sampling_rules(path=SAMPLING_RULES_PATH):
+    """
+    JSON 샘플링 규칙을 읽어 SamplingRules 생성 (파일이 없으면 기본 규칙 사용)
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = DEFAULT_SAMPLING_RULES
+    return SamplingRules(config)
+
+
+# 웜 스타트 간에 재사용 (컴파일된 규칙 + 판정 캐시)
+SAMPLING_RULES = load_sampling_rules()
+
+
+def _epoch_seconds(prefix):
+    """
+    'YYYY-MM-DDTHH:MM:SS' (UTC)를 epoch 초로 변환, 형식이 맞지 않으면 None
+    (datetime 없이 그레고리력 일수 계산으로 변환)
+    """
+    if (len(prefix) != 19 or prefix[4] != '-' or prefix[7] != '-' or prefix[10] != 'T'
+            or prefix[13] != ':' or prefix[16] != ':'):
+        return None
+    try:
+        year, month, day = int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10])
+        hour, minute, second = int(prefix[11:13]), int(prefix[14:16]), int(prefix[17:19])
+    except ValueError:
+        return None
+    if not (1 <= year and 1 <= month <= 12 and 0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 60):
+        return None
+    leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    if not 1 <= day <= (29 if month == 2 and leap else _DAYS_IN_MONTH[month]):
+        return None
+
+    # 1970-01-01부터의 일수 (3월을 한 해의 시작으로 보고 윤일을 맨 끝에 둠)
+    y = year - 1 if month <= 2 else year
+    era, year_of_era = divmod(y, 400)
+    day_of_year = (153 * (month - 3 if month > 2 else month + 9) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+    return days * 86400 + hour * 3600 + minute * 60 + second
+
+
+def decode_alb_timestamp(value):
+    """
+    ALB 타임스탬프(YYYY-MM-DDTHH:MM:SS.ffffffZ)를 epoch 밀리초로 변환
+
+    초 단위 prefix의 epoch 값은 캐시하고 라인마다 밀리초 부분만 더함
+    고정 포맷이 아니면 ISO 8601로 파싱하고, 그래도 실패하면 None (호출하는 쪽에서 집계)
+    """
+    seconds = _epoch_seconds_cache.get(value[:19])
+    if seconds is None:
+        seconds = _epoch_seconds(value[:19])
+        if seconds is None:
+            return _decode_iso_timestamp(value)
+        if len(_epoch_seconds_cache) >= TIMESTAMP_CACHE_SIZE:
+            _epoch_seconds_cache.clear()
+        _epoch_seconds_cache[value[:19]] = seconds
+
+    if len(value) == 27 and value[19] == '.' and value[26] == 'Z':
+        fraction = value[20:26]
+        if fraction.isdigit():
+            return seconds * 1000 + int(fraction) // 1000
+    elif len(value) == 20 and value[19] == 'Z':
+        return seconds * 1000
+    return _decode_iso_timestamp(value)
+
+
+def _decode_iso_timestamp(value):
+    # 고정 포맷이 아닌 드문 경우에만 사용하므로 여기서 import
+    from datetime import datetime, timezone
+
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def extract_request_path(raw_url):
+    """
+    ALB request 필드의 URL에서 경로만 추출 (쿼리 스트링 제외)
+    예: https://gateway.highgarden.cloud:443/queue/status?x=1 → /queue/status
+        /orders?page=2 → /orders
+    """
+    scheme_end = raw_url.find('://')
+    if scheme_end >= 0:
+        path_start = raw_url.find('/', scheme_end + 3)
+        if path_start < 0:
+            return '/'
+        path = raw_url[path_start:]
+        end = path.find('?')
+        if end >= 0:
+            path = path[:end]
+        end = path.find('#')
+        if end >= 0:
+            path = path[:end]
+        return path or '/'
+
+    end = raw_url.find('?')
+    return raw_url[:end] if end >= 0 else raw_url
+
+
+def _decode_timings(request, target, response):
+    """
+    처리 시간 필드 3개(초)를 (총 응답 시간, 요청, 대상, 응답 처리 시간) 밀리초 튜플로 변환
+    하나라도 -1(target에 연결되지 않은 요청)이거나 숫자가 아니면 모두 None
+    """
+    try:
+        request_time = float(request)
+        target_time = float(target)
+        response_time = float(response)
+    except ValueError:
+        return _NO_TIMINGS
+    if request_time == -1 or target_time == -1 or response_time == -1:
+        return _NO_TIMINGS
+    # 총 응답 시간은 합계를 반올림 (정수로 반올림하여 부동소수점 오차 제거)
+    return (round((request_time + target_time + response_time) * 1000), round(request_time * 1000),
+            round(target_time * 1000), round(response_time * 1000))
+
+
 def parse_alb_log(line):
     """
     ALB Access Log 라인을 구조화된 JSON으로 파싱
     상태 코드와 응답 시간을 별도 필드로 추출하여 CloudWatch Logs에서 필터링 가능하게 함
     서비스 구분을 위해 request path를 파싱하여 service 필드 추가
 
-    ALB 로그 필드 인덱스 (0-based):
-    0: type (http/https/h2/wss)
-    1: time (ISO 8601 timestamp)
-    2: elb (ALB resource ID)
-    3: client:port
-    4: target:port
-    5: request_processing_time (초)
-    6: target_processing_time (초)
-    7: response_processing_time (초)
-    8: elb_status_code (상태 코드)
-    9: target_status_code (대상 상태 코드)
-    10-11: bytes_sent, user_agent (생략)
-    12: request ("GET /path HTTP/1.1" 형식)
+    일반적인 라인은 split 한 번으로 request 필드("METHOD URL HTTP/x")까지 분리하고,
+    따옴표 안에 공백이 더 있거나 필드가 부족한 라인만 tokenize_alb_log로 분리함 (필드 목록은 ALB_LOG_FIELDS 참고)
+    타임스탬프(초 단위), 처리 시간 문자열, 상태 코드는 캐시/사전 조회로 변환함
+    전체 필드가 필요하면 parse_alb_record 사용
     """
     try:
-        # 기본 필드 추출
-        parts = line.split(None, 2)
-        if len(parts) < 3:
-            return None
-
-        log_type = parts[0]
-        log_time = parts[1]
-        rest = parts[2]
-
-        # 타임스탬프 변환
-        try:
-            dt = datetime.fromisoformat(log_time.replace('Z', '+00:00'))
-            timestamp_ms = int(dt.timestamp() * 1000)
-        except:
-            timestamp_ms = int(time.time() * 1000)
-
-        # 상태 코드 및 응답 시간 추출
-        status_code = None
-        target_status_code = None
-        response_time = None
-        request_processing_time = None
-        target_processing_time = None
-        response_processing_time = None
-        service = "unknown"
-        request_path = None
-        http_method = None
+        fields = line.split(' ', ALB_REQUEST_FIELD_INDEX + 3)
+        if (len(fields) > ALB_REQUEST_FIELD_INDEX + 3 and fields[12][:1] == '"'
+                and fields[14][-1:] == '"' and fields[14][:4] == 'HTTP' and fields[14][-2:-1] != '\\'):
+            # 예시: "GET https://gateway.highgarden.cloud:443/queue/status HTTP/1.1" → 따옴표가 붙은 토큰 3개
+            http_method = fields[12][1:]
+            raw_url = fields[13]
+        else:
+            fields = tokenize_alb_log(line, ALB_REQUEST_FIELD_INDEX + 1)
+            if len(fields) < 3:
+                return None
+            http_method = raw_url = None
+            if len(fields) > ALB_REQUEST_FIELD_INDEX:
+                parts = fields[ALB_REQUEST_FIELD_INDEX].split(' ', 2)  # [메서드, 경로, HTTP버전]
+                if len(parts) == 3 and parts[2].startswith('HTTP'):
+                    http_method, raw_url = parts[0], parts[1]
+        field_count = len(fields)
 
-        try:
-            # 공백으로 구분된 필드들을 파싱
-            fields = line.split()
+        # 타임스탬프 변환 (형식 오류는 None → iter_parsed_logs에서 집계 후 제외)
+        # 고정 포맷(YYYY-MM-DDTHH:MM:SS.ffffffZ)이고 초 단위 값이 캐시에 있으면 밀리초만 더함
+        log_time = fields[1]
+        seconds = _epoch_seconds_cache.get(log_time[:19])
+        millis = _FRACTION_MILLIS.get(log_time[19:23])
+        if (seconds is not None and millis is not None and len(log_time) == 27 and log_time[26] == 'Z'
+                and log_time[23:26].isdigit()):
+            timestamp_ms = seconds * 1000 + millis
+        else:
+            timestamp_ms = decode_alb_timestamp(log_time)
 
-            # 상태 코드 추출 (인덱스 8: elb_status_code)
-            if len(fields) > 8:
-                try:
-                    status_code = int(fields[8])
-                except (ValueError, IndexError):
-                    pass
+        # 상태 코드 추출 (인덱스 8: elb_status_code, 9: target_status_code)
+        status_code = target_status_code = None
+        if field_count > 8:
+            value = fields[8]
+            status_code = _STATUS_CODES[value] if value in _STATUS_CODES else _int_or_none(value)
+        if field_count > 9:
+            value = fields[9]
+            target_status_code = _STATUS_CODES[value] if value in _STATUS_CODES else _int_or_none(value)
 
-            # 대상 상태 코드 추출 (인덱스 9: target_status_code)
-            if len(fields) > 9:
-                try:
-                    target_status_code = int(fields[9])
-                except (ValueError, IndexError):
-                    pass
+        # 응답 시간 추출 (인덱스 5, 6, 7: 각 처리 단계의 시간, 초 단위)
+        # -1은 타겟에 연결되지 않은 요청 (크롤러, 404 등)을 의미하며 이 경우 응답 시간은 null
+        # 같은 처리 시간 조합이 반복되므로 변환 결과를 캐시
+        timings = _NO_TIMINGS
+        if field_count > 7:
+            key = (fields[5], fields[6], fields[7])
+            timings = _timings_cache.get(key)
+            if timings is None:
+                timings = _decode_timings(*key)
+                if len(_timings_cache) >= TIMINGS_CACHE_SIZE:
+                    _timings_cache.clear()
+                _timings_cache[key] = timings
 
-            # 응답 시간 추출 (총 응답 시간 = 모든 처리 단계의 합)
-            # 인덱스 5, 6, 7: 각 처리 단계의 시간 (초 단위)
-            if len(fields) > 7:
-                try:
-                    request_time = float(fields[5])          # 요청 처리 시간
-                    target_time = float(fields[6])           # 대상 처리 시간
-                    response_time_seconds = float(fields[7]) # 응답 처리 시간
-
-                    # -1은 타겟에 연결되지 않은 요청 (크롤러, 404 등)을 의미함
-                    # 이 경우 응답 시간은 null로 설정
-                    if request_time == -1 or target_time == -1 or response_time_seconds == -1:
-                        response_time = None
-                    else:
-                        # 총 응답 시간을 밀리초로 변환 (정수로 반올림하여 부동소수점 오차 제거)
-                        response_time = round((request_time + target_time + response_time_seconds) * 1000)
-
-                        # 각 단계별 시간도 저장 (상세 분석용)
-                        request_processing_time = round(request_time * 1000)
-                        target_processing_time = round(target_time * 1000)
-                        response_processing_time = round(response_time_seconds * 1000)
-                except (ValueError, IndexError):
-                    pass
-
-            # 요청 경로에서 서비스 구분
-            # ALB 로그의 request 필드는 따옴표로 감싸져 있음
-            # 예시: "GET https://gateway.highgarden.cloud:443/queue/status HTTP/1.1"
-            # 또는: "GET /orders HTTP/1.1"
-            # 정규표현식으로 직접 추출 (user-agent에 공백이 있어서 split 위치가 가변적)
-            try:
-                # 따옴표로 감싸진 request 필드 전체 추출
-                import re as regex
-                request_match = regex.search(r'"((?:GET|POST|PUT|DELETE|PATCH|HEAD|OPTIONS)\s+[^\s]+\s+HTTP[^"]*)"', line)
-                if request_match:
-                    request_line = request_match.group(1)  # 예: "GET https://gateway.highgarden.cloud:443/queue/status HTTP/1.1"
-
-                    # 메서드와 경로를 공백으로 분리 (처음 2개만 관심)
-                    parts = request_line.split(None, 2)  # [메서드, 경로, HTTP버전...]
-                    if len(parts) >= 2:
-                        http_method = parts[0]  # GET, POST, etc.
-                        raw_path = parts[1]     # /orders 또는 https://gateway.highgarden.cloud:443/queue/status
-
-                        # URL 형식이면 경로만 추출
-                        if raw_path.startswith('http://') or raw_path.startswith('https://'):
-                            # https://gateway.highgarden.cloud:443/queue/status?query=param → /queue/status
-                            parsed_url = urlparse(raw_path)
-                            request_path = parsed_url.path if parsed_url.path else '/'
-                        else:
-                            # /queue/status?query=param → /queue/status
-                            request_path = raw_path.split('?')[0] if '?' in raw_path else raw_path
-
-                        # 경로 기반 서비스 구분 로직
-                        # API 도메인에서 오는 요청 (api.highgarden.cloud)
-                        # 실제 요청 경로: /payments, /orders, /events 등 (프리픽스 없음)
-                        if 'payment' in request_path or 'pay' in request_path:
-                            service = "flash-api-payment"
-                        elif 'order' in request_path:
-                            service = "flash-api-order"
-                        elif request_path.startswith('/api/'):
-                            # /api/* 형식의 API 엔드포인트
-                            if 'payment' in request_path or 'pay' in request_path:
-                                service = "flash-api-payment"
-                            elif 'order' in request_path:
-                                service = "flash-api-order"
-                            else:
-                                service = "flash-api"
-                        elif request_path.startswith('/events'):
-                            # /events는 API 서비스
-                            service = "flash-api"
-                        elif request_path.startswith('/queue'):
-                            service = "flash-gateway-queue"
-                        elif request_path.startswith('/orders'):
-                            service = "flash-gateway-orders"
-                        elif request_path.startswith('/products'):
-                            service = "flash-gateway-products"
-                        elif request_path.startswith('/'):
-                            service = "flash-gateway"
-                        else:
-                            service = "unknown"
-            except (ValueError, IndexError):
-                pass
-        except:
-            pass
+        # 요청 경로에서 서비스 구분 (route-table.json, 경로별 캐시)
+        # 예시: https://gateway.highgarden.cloud:443/queue/status 또는 /orders
+        service = "unknown"
+        route = request_path = None
+        if http_method in HTTP_METHODS:
+            request_path = extract_request_path(raw_url)
+            service, route = ROUTE_TABLE.classify(request_path)
+        else:
+            http_method = None
 
         # 구조화된 JSON 저장
-        parsed = {
-            'type': log_type,
+        return {
+            'type': fields[0],
             'time': log_time,
             'status_code': status_code,
             'target_status_code': target_status_code,
-            'response_time_ms': response_time,  # 총 응답 시간 (밀리초)
-            'request_processing_time_ms': request_processing_time,
-            'target_processing_time_ms': target_processing_time,
-            'response_processing_time_ms': response_processing_time,
+            'response_time_ms': timings[0],  # 총 응답 시간 (밀리초)
+            'request_processing_time_ms': timings[1],
+            'target_processing_time_ms': timings[2],
+            'response_processing_time_ms': timings[3],
             'service': service,  # 서비스 구분 필드 (flash-gateway, flash-api, etc.)
             'request_path': request_path,  # 요청 경로
+            'route': route,  # ID를 {id}로 정규화한 라우트 템플릿 (예: /api/orders/{id})
             'http_method': http_method,  # HTTP 메서드 (GET, POST, etc.)
             'raw_message': line,
             'timestamp_ms': timestamp_ms
         }
-
-        return parsed
     except Exception as e:
         print(f"Error parsing log line: {str(e)}")
         return None
 
-def lambda_handler(event, context):
+
+def iter_gzip_lines(body, chunk_size=READ_CHUNK_SIZE, metrics=None):
     """
-    S3 이벤트로부터 ALB 로그 파일을 읽어 CloudWatch Logs로 전송 (구조화된 JSON)
+    gzip 스트림(S3 StreamingBody 등 read(n)을 지원하는 객체)을 청크 단위로 읽어
+    점진적으로 해제/디코딩하면서 한 줄씩 반환
+
+    압축 바이트, 해제 바이트, 디코딩 문자열 모두 청크 크기만큼만 메모리에 유지됨
+    여러 gzip 멤버가 이어 붙은 파일도 처리함
+    metrics(PipelineMetrics)가 주어지면 청크 단위로 fetch/decompress 시간과 바이트 수를 기록
     """
-    try:
-        # S3 이벤트 파싱
-        bucket = event['Records'][0]['s3']['bucket']['name']
-        key = event['Records'][0]['s3']['object']['key']
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    member_open = False
+    pending = ''
+    perf_counter = time.perf_counter
 
-        print(f"Processing S3 object: s3://{bucket}/{key}")
+    while True:
+        started = perf_counter()
+        chunk = body.read(chunk_size)
+        if metrics is not None:
+            metrics.add_time('fetch', perf_counter() - started)
+            metrics.counters['bytes_in'] += len(chunk)
+        if not chunk:
+            break
+
+        while chunk:
+            started = perf_counter()
+            member_open = True
+            data = decompressor.decompress(chunk, DECOMPRESS_CHUNK_SIZE)
+            chunk = decompressor.unconsumed_tail
+
+            if decompressor.eof:
+                # 현재 gzip 멤버 종료: 남은 바이트는 다음 멤버로 처리
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+                member_open = False
+
+            if data:
+                lines = (pending + decoder.decode(data)).split('\n')
+                pending = lines.pop()
+                if metrics is not None:
+                    metrics.add_time('decompress', perf_counter() - started)
+                    metrics.counters['bytes_decompressed'] += len(data)
+                yield from lines
+
+    if member_open:
+        raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
 
-        # Log Stream 생성 (존재하지 않으면)
-        try:
-            logs.create_log_stream(
-                logGroupName=LOG_GROUP_NAME,
-                logStreamName=LOG_STREAM_NAME
-            )
-        except logs.exceptions.ResourceAlreadyExistsException:
-            pass
 
-        # S3에서 파일 다운로드
-        response = s3.get_object(Bucket=bucket, Key=key)
+def iter_parsed_logs(lines, stats=None, metrics=None, keep_unreached=False):
+    """
+    로그 라인 iterable을 파싱하여 대상에 도달한 요청의 파싱 결과를 하나씩 반환
+    keep_unreached가 True면 대상에 도달하지 않은 요청(response_time_ms가 None)도 반환 (샘플링 규칙에서 판정)
+    stats dict가 주어지면 타임스탬프 형식 오류로 제외한 라인 수를 'malformed_timestamps'에 더함
 
-        # gzip 파일 해제
-        with gzip.GzipFile(fileobj=BytesIO(response['Body'].read())) as gzipfile:
-            content = gzipfile.read().decode('utf-8')
+    metrics(PipelineMetrics)가 주어지면 라인 수(전체/빈 줄·주석/봇 필터/파싱 실패/타임스탬프 오류)를 세고,
+    STAGE_SAMPLE_INTERVAL 라인마다 한 번 parse/classify 시간을 측정하여 전체 라인 수로 환산
+    classify는 파싱 직후 같은 경로를 다시 분류한 시간(경로 캐시 적중 비용)으로 추정하고 parse에서 뺌
+    """
+    seen = skipped = filtered = failures = malformed = 0
+    sample_interval = STAGE_SAMPLE_INTERVAL if metrics is not None else 0
+    countdown = sample_interval
+    sampled = 0
+    parse_seconds = classify_seconds = 0.0
+    perf_counter = time.perf_counter
+    classify = ROUTE_TABLE.classify
 
-        # ALB 로그 파싱 및 저장
-        log_events = []
-        for line in content.strip().split('\n'):
+    try:
+        for line in lines:
+            seen += 1
             if not line or line.startswith('#'):
+                skipped += 1
                 continue
 
-            parsed = parse_alb_log(line)
-            if parsed:
-                # 크롤러/봇 요청 필터링: response_time_ms가 null이면 ALB에서 차단된 요청
-                # (실제 target에 도달하지 않은 요청)
-                if parsed['response_time_ms'] is None:
-                    continue
+            countdown -= 1
+            if countdown == 0:
+                countdown = sample_interval
+                started = perf_counter()
+                parsed = parse_alb_log(line)
+                parsed_at = perf_counter()
+                if parsed and parsed['request_path'] is not None:
+                    classify(parsed['request_path'])
+                    classify_seconds += perf_counter() - parsed_at
+                parse_seconds += parsed_at - started
+                sampled += 1
+            else:
+                parsed = parse_alb_log(line)
 
-                log_events.append({
-                    'timestamp': parsed['timestamp_ms'],
-                    'message': json.dumps(parsed, ensure_ascii=False)
-                })
+            if not parsed:
+                failures += 1
+                continue
 
-        # CloudWatch Logs에 업로드
-        if log_events:
-            # 타임스탬프 기준 정렬 (CloudWatch 요구사항)
-            log_events.sort(key=lambda x: x['timestamp'])
+            # 타임스탬프가 깨진 라인은 수집 시각으로 대체하지 않고 제외 (순서가 뒤섞이지 않도록)
+            if parsed['timestamp_ms'] is None:
+                malformed += 1
+                continue
 
-            logs.put_log_events(
-                logGroupName=LOG_GROUP_NAME,
-                logStreamName=LOG_STREAM_NAME,
-                logEvents=log_events
-            )
+            # 크롤러/봇 요청 필터링: response_time_ms가 null이면 ALB에서 차단된 요청
+            # (실제 target에 도달하지 않은 요청)
+            if parsed['response_time_ms'] is None and not keep_unreached:
+                filtered += 1
+                continue
+
+            yield parsed
+    finally:
+        if stats is not None and malformed:
+            stats['malformed_timestamps'] = stats.get('malformed_timestamps', 0) + malformed
+        if metrics is not None:
+            counters = metrics.counters
+            counters['lines_seen'] += seen
+            counters['lines_skipped'] += skipped
+            counters['lines_filtered'] += filtered
+            counters['parse_failures'] += failures
+            counters['malformed_timestamps'] += malformed
+            if sampled:
+                scale = (seen - skipped) / sampled
+                metrics.add_time('parse', (parse_seconds - classify_seconds) * scale)
+                metrics.add_time('classify', classify_seconds * scale)
+
+
+def make_full_serializer(keys=FULL_OUTPUT_KEYS):
+    """
+    json.dumps(parsed, ensure_ascii=False)와 바이트 단위로 같은 결과를 만드는 템플릿 인코더
+
+    키 이름과 구분자는 '%s' 템플릿으로 미리 만들어 두고, 값만 C 구현 문자열 인코더로 변환함
+    값은 str/int/float/None만 지원 (parse_alb_log 결과의 타입)
+    """
+    template = '{' + ', '.join(json.dumps(key) + ': %s' for key in keys) + '}'
+    get_values = operator.itemgetter(*keys)
+    encode_string = json.encoder.encode_basestring
+    key_count = len(keys)
+
+    def serialize(parsed):
+        if len(parsed) != key_count:
+            # sample_weight 등 추가 키가 있는 이벤트 (샘플링된 일부 이벤트만 해당)
+            return json.dumps(parsed, ensure_ascii=False)
+        return template % tuple([
+            encode_string(value) if value.__class__ is str else 'null' if value is None else repr(value)
+            for value in get_values(parsed)
+        ])
+    return serialize
+
+
+def make_compact_serializer(key_map=COMPACT_OUTPUT_KEYS):
+    """
+    짧은 키를 쓰고 null 값은 생략하는 compact 인코더 (orjson이 있으면 사용)
+    sample_weight가 있는 이벤트는 'w' 키로 가중치를 추가
+    """
+    keys = tuple(key_map)
+    get_values = operator.itemgetter(*keys)
+    key_count = len(FULL_OUTPUT_KEYS)
+
+    if orjson is not None:
+        short_keys = tuple(key_map.values())
+
+        def serialize(parsed):
+            document = {
+                short_key: value for short_key, value in zip(short_keys, get_values(parsed)) if value is not None
+            }
+            if len(parsed) != key_count and 'sample_weight' in parsed:
+                document['w'] = parsed['sample_weight']
+            return orjson.dumps(document).decode('utf-8')
+        return serialize
+
+    prefixes = tuple(json.dumps(key_map[key]) + ':' for key in keys)
+    encode_string = json.encoder.encode_basestring
 
-            print(f"Successfully uploaded {len(log_events)} log events")
+    def serialize(parsed):
+        items = [
+            prefix + (encode_string(value) if value.__class__ is str else repr(value))
+            for prefix, value in zip(prefixes, get_values(parsed)) if value is not None
+        ]
+        if len(parsed) != key_count and 'sample_weight' in parsed:
+            items.append('"w":' + repr(parsed['sample_weight']))
+        return '{' + ','.join(items) + '}'
+    return serialize
 
+
+def _serialize_raw(parsed):
+    return parsed['raw_message']
+
+
+_serializers = {}
+
+
+def get_serializer(profile):
+    """
+    출력 프로필 이름으로 직렬화 함수 반환 (한 번 만든 인코더는 재사용)
+    """
+    serializer = _serializers.get(profile)
+    if serializer is None:
+        if profile == 'full':
+            serializer = make_full_serializer()
+        elif profile == 'compact':
+            serializer = make_compact_serializer()
+        elif profile == 'raw':
+            serializer = _serialize_raw
+        else:
+            raise ValueError(f"Unknown output profile: {profile}")
+        _serializers[profile] = serializer
+    return serializer
+
+
+def to_log_event(parsed, serialize=None):
+    """
+    파싱 결과를 CloudWatch Logs 이벤트로 변환 (기본: full 프로필)
+    """
+    return {
+        'timestamp': parsed['timestamp_ms'],
+        'message': (serialize or get_serializer('full'))(parsed)
+    }
+
+
+class LatencyBucket:
+    """
+    집계 버킷 하나 (요청 수, 에러 수, 밀리초 단위 응답 시간 히스토그램)
+    """
+    __slots__ = ('count', 'error_count', 'latency_histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.error_count = 0
+        self.latency_histogram = Counter()
+
+    def merge(self, other):
+        self.count += other.count
+        self.error_count += other.error_count
+        self.latency_histogram.update(other.latency_histogram)
+
+    def quantiles(self, fractions):
+        """
+        히스토그램에서 분위수 계산 (fractions는 오름차순 0~1 값)
+        """
+        results = []
+        items = sorted(self.latency_histogram.items())
+        total = sum(count for _, count in items)
+        cumulative = 0
+        index = 0
+        for value, count in items:
+            cumulative += count
+            while index < len(fractions) and cumulative >= fractions[index] * total:
+                results.append(value)
+                index += 1
+        if items:
+            results.extend([items[-1][0]] * (len(fractions) - index))
+        return results
+
+    def metric_values(self, max_values=EMF_MAX_VALUES):
+        """
+        EMF Latency 메트릭 값 배열
+        요청 수가 max_values 이하면 전체 값을, 넘으면 균등 간격 분위수 max_values개를 반환
+        """
+        if self.count <= max_values:
+            return sorted(self.latency_histogram.elements())
+        return self.quantiles([(i + 0.5) / max_values for i in range(max_values)])
+
+
+class LatencyAggregator:
+    """
+    파싱 결과를 (서비스, 라우트, 상태 코드 클래스, 분) 버킷으로 집계하고
+    CloudWatch Embedded Metric Format 문서로 변환
+    (라우트는 RouteTable.metric_route로 설정된 템플릿 수 이내로 제한)
+
+    요청마다 로그 이벤트를 만드는 대신 버킷당 문서 하나만 출력하므로
+    대시보드의 서비스별 p95/p99를 Logs Insights 스캔 없이 메트릭으로 조회할 수 있음
+    """
+
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, parsed):
+        status_code = parsed['status_code']
+        route = parsed['route']
+        key = (
+            parsed['service'],
+            ROUTE_TABLE.metric_route(route) if route is not None else '-',
+            f"{status_code // 100}xx" if status_code else 'unknown',
+            parsed['timestamp_ms'] // 60000
+        )
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = LatencyBucket()
+
+        bucket.count += 1
+        if status_code is not None and status_code >= 500:
+            bucket.error_count += 1
+        bucket.latency_histogram[parsed['response_time_ms']] += 1
+
+    def merge(self, other):
+        for key, other_bucket in other.buckets.items():
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = LatencyBucket()
+            bucket.merge(other_bucket)
+
+    def by_service(self):
+        """
+        라우트/상태 코드/분 차원을 합쳐 서비스별 LatencyBucket으로 반환
+        """
+        services = {}
+        for (service, _route, _status_class, _minute), bucket in self.buckets.items():
+            merged = services.get(service)
+            if merged is None:
+                merged = services[service] = LatencyBucket()
+            merged.merge(bucket)
+        return services
+
+    def to_emf_documents(self, namespace=METRICS_NAMESPACE):
+        """
+        버킷별(Service/Route/StatusClass) 문서와 서비스·분별(Service) 문서를 반환
+
+        버킷 값 배열은 최대 EMF_MAX_VALUES개라 요청 수와 상관없이 같은 비중을 가짐
+        → 서비스 차원의 p95/p99는 같은 분의 버킷 히스토그램을 합친 뒤 다시 뽑은 값으로 계산되게 함
+        """
+        documents = []
+        services = {}
+        for (service, route, status_class, minute), bucket in sorted(self.buckets.items()):
+            documents.append(self._emf_document(namespace, ROUTE_METRIC_DIMENSIONS, minute, bucket, {
+                'Service': service,
+                'Route': route,
+                'StatusClass': status_class,
+            }))
+            merged = services.get((service, minute))
+            if merged is None:
+                merged = services[(service, minute)] = LatencyBucket()
+            merged.merge(bucket)
+
+        for (service, minute), bucket in sorted(services.items()):
+            documents.append(self._emf_document(namespace, SERVICE_METRIC_DIMENSIONS, minute, bucket, {'Service': service}))
+        return documents
+
+    @staticmethod
+    def _emf_document(namespace, dimensions, minute, bucket, dimension_values):
+        p50, p95, p99 = bucket.quantiles([0.5, 0.95, 0.99])
         return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'message': 'Successfully processed ALB logs',
-                'bucket': bucket,
-                'key': key,
-                'events_count': len(log_events)
-            })
+            '_aws': {
+                'Timestamp': minute * 60000,
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': dimensions,
+                    'Metrics': [
+                        {'Name': 'RequestCount', 'Unit': 'Count'},
+                        {'Name': 'ErrorCount', 'Unit': 'Count'},
+                        {'Name': 'Latency', 'Unit': 'Milliseconds'},
+                    ]
+                }]
+            },
+            **dimension_values,
+            'RequestCount': bucket.count,
+            'ErrorCount': bucket.error_count,
+            'Latency': bucket.metric_values(),
+            # 버킷 내부의 정확한 분위수 (메트릭이 아닌 속성, Logs Insights 조회용)
+            'LatencyP50': p50,
+            'LatencyP95': p95,
+            'LatencyP99': p99,
+            'LatencyMax': max(bucket.latency_histogram),
         }
 
-    except Exception as e:
-        print(f"Error: {str(e)}")
+
+# EMF 문서 출력 락 (객체 처리 스레드들이 동시에 출력해도 문서 한 줄이 섞이지 않도록)
+_stdout_lock = threading.Lock()
+
+
+def emit_metric_documents(documents):
+    """
+    EMF 문서를 한 줄씩 stdout으로 출력 (Lambda 로그에서 CloudWatch 메트릭으로 추출됨)
+
+    print()는 본문과 줄바꿈을 따로 쓰므로 여러 스레드에서 호출하면 줄이 섞일 수 있음
+    → 문서마다 줄바꿈까지 포함한 문자열을 락 안에서 write 한 번으로 출력
+    """
+    lines = [json.dumps(document, separators=(',', ':')) + '\n' for document in documents]
+    with _stdout_lock:
+        for line in lines:
+            sys.stdout.write(line)
+    return len(documents)
+
+
+class PipelineMetrics:
+    """
+    처리 단계별 누적 시간(초)과 라인/바이트 카운터
+
+    upload/upload_wait는 업로드 스레드들에서 동시에 더해지므로 add_time은 락으로 보호
+    (upload는 스레드별 PutLogEvents 시간의 합이라 병렬 업로드 시 실제 경과 시간보다 클 수 있음)
+    """
+
+    def __init__(self):
+        self.stage_seconds = dict.fromkeys(PIPELINE_STAGES, 0.0)
+        self.counters = dict.fromkeys(PIPELINE_COUNTERS, 0)
+        self.wall_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+
+    def merge(self, other):
+        with self._lock:
+            for stage, seconds in other.stage_seconds.items():
+                self.stage_seconds[stage] += seconds
+            for name, value in other.counters.items():
+                self.counters[name] += value
+            self.wall_seconds += other.wall_seconds
+
+    def summary(self):
+        """
+        로그 출력/응답용 요약 (시간은 밀리초)
+        """
         return {
-            'statusCode': 500,
-            'body': json.dumps({'error': str(e)})
+            'wall_ms': round(self.wall_seconds * 1000, 3),
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in self.stage_seconds.items()},
+            **self.counters
+        }
+
+    def to_emf_document(self, namespace=METRICS_NAMESPACE, function_name=None):
+        """
+        단계별 시간과 카운터를 함수 이름 차원의 EMF 문서 하나로 변환
+        메트릭 이름: Stage<Name>Time (밀리초), LinesSeen 등 카운터 (바이트 카운터는 Bytes 단위)
+        """
+        function_name = function_name or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'alb-log-processor')
+        document = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': [['Function']],
+                    'Metrics': []
+                }]
+            },
+            'Function': function_name
         }
+        metrics = document['_aws']['CloudWatchMetrics'][0]['Metrics']
+
+        for stage, seconds in self.stage_seconds.items():
+            name = 'Stage' + ''.join(part.capitalize() for part in stage.split('_')) + 'Time'
+            metrics.append({'Name': name, 'Unit': 'Milliseconds'})
+            document[name] = round(seconds * 1000, 3)
+        metrics.append({'Name': 'WallTime', 'Unit': 'Milliseconds'})
+        document['WallTime'] = round(self.wall_seconds * 1000, 3)
+        for counter, value in self.counters.items():
+            name = ''.join(part.capitalize() for part in counter.split('_'))
+            metrics.append({'Name': name, 'Unit': 'Bytes' if counter.startswith('bytes_') else 'Count'})
+            document[name] = value
+        return document
+
+
+class InvocationProfiler:
+    """
+    샘플링된 호출의 cProfile/tracemalloc 프로파일러 (PROFILE_SAMPLE_RATE)
+
+    wrap()으로 감싼 함수(객체 처리)마다 프로파일러를 따로 돌리고 결과를 합침
+    Python 3.12부터는 프로파일러를 동시에 하나만 켤 수 있으므로 감싼 함수는 한 번에 하나씩만 실행해야 함
+    (lambda_handler는 샘플링된 호출의 객체를 순차 처리)
+    """
+
+    def __init__(self):
+        # 프로파일링하지 않는 호출의 콜드 스타트에 영향이 없도록 여기서 import
+        import cProfile
+        import tracemalloc
+
+        self._profile_class = cProfile.Profile
+        self._tracemalloc = tracemalloc
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+        self._lock = threading.Lock()
+        self._stats = None
+
+    @staticmethod
+    def sampled(rate=None):
+        """
+        이번 호출을 프로파일링할지 결정 (비율이 0이면 항상 False)
+        """
+        if rate is None:
+            rate = PROFILE_SAMPLE_RATE
+        return rate > 0.0 and random.random() < rate
+
+    def wrap(self, func):
+        @functools.wraps(func)
+        def profiled(*args, **kwargs):
+            profile = self._profile_class()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                import pstats
+                with self._lock:
+                    if self._stats is None:
+                        self._stats = pstats.Stats(profile)
+                    else:
+                        self._stats.add(profile)
+        return profiled
+
+    def report(self, top_n=None):
+        """
+        누적 시간 기준 상위 함수와 메모리 할당 상위 라인을 문자열로 반환하고 tracemalloc 정리
+        """
+        import io
+
+        top_n = top_n or PROFILE_TOP_N
+        out = io.StringIO()
+        if self._stats is not None:
+            self._stats.stream = out
+            self._stats.sort_stats('cumulative').print_stats(top_n)
+
+        snapshot = self._tracemalloc.take_snapshot()
+        current, peak = self._tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            self._tracemalloc.stop()
+        out.write(f"tracemalloc: current={current / 1024:.1f}KiB peak={peak / 1024:.1f}KiB\n")
+        for stat in snapshot.statistics('lineno')[:top_n]:
+            out.write(f"  {stat}\n")
+        return out.getvalue()
+
+
+def _create_client(service_name, retries=None):
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(service_name, config=Config(
+        max_pool_connections=CLIENT_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries=retries or {'mode': 'adaptive', 'max_attempts': CLIENT_MAX_ATTEMPTS}
+    ))
+
+
+def get_s3_client():
+    """
+    S3 클라이언트 반환 (처음 호출할 때 생성, 이후 재사용)
+    """
+    global s3
+    if s3 is None:
+        with _client_lock:
+            if s3 is None:
+                s3 = _create_client('s3')
+    return s3
+
+
+def get_logs_client():
+    """
+    CloudWatch Logs 클라이언트 반환 (처음 호출할 때 생성, 이후 재사용)
+    """
+    global logs
+    if logs is None:
+        with _client_lock:
+            if logs is None:
+                # PutLogEvents는 _put_batch에서 백오프로 재시도하므로 botocore 재시도는 끔
+                # (겹치면 시도 횟수가 곱해지고, adaptive 모드의 토큰 버킷이 업로드 스레드 전체를 함께 늦춤)
+                logs = _create_client('logs', retries={'mode': 'standard', 'total_max_attempts': 1})
+    return logs
+
+
+def _error_code(error):
+    """
+    botocore ClientError에서 에러 코드 추출 (그 외 예외는 None)
+    """
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('Error', {}).get('Code')
+    return None
+
+
+def _is_retryable_error(error):
+    """
+    재시도할 업로드 에러인지 판정: 스로틀링 등 RETRYABLE_ERROR_CODES, 5xx 응답, 연결/읽기 타임아웃
+    (logs 클라이언트는 botocore 재시도를 끄므로 일시적인 네트워크 에러도 여기서 판정)
+    """
+    if _error_code(error) in RETRYABLE_ERROR_CODES:
+        return True
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+    from botocore.exceptions import ConnectionError, HTTPClientError
+    return isinstance(error, (ConnectionError, HTTPClientError))
+
+
+def _rejected_events_count(response, batch_size):
+    """
+    PutLogEvents 응답의 rejectedLogEventsInfo로부터 거부된 이벤트 수 계산
+    """
+    info = (response or {}).get('rejectedLogEventsInfo')
+    if not info:
+        return 0
+
+    rejected = 0
+    old_end = max(info.get('tooOldLogEventEndIndex', -1), info.get('expiredLogEventEndIndex', -1))
+    if old_end >= 0:
+        rejected += old_end + 1
+    new_start = info.get('tooNewLogEventStartIndex')
+    if new_start is not None:
+        rejected += batch_size - max(new_start, old_end + 1)
+    return rejected
+
+
+class LogEventsUploader:
+    """
+    CloudWatch Logs 이벤트를 PutLogEvents 제한(이벤트 수, 바이트, 24시간 범위)에 맞춰
+    배치로 묶고, 제한된 크기의 스레드 풀로 병렬 업로드
+
+    - add()로 이벤트를 넣으면 배치가 찰 때마다 즉시 업로드 (파싱과 업로드가 겹쳐서 진행)
+    - 동시에 진행 중인 배치 수를 제한하여 메모리 사용량을 일정하게 유지
+    - 스로틀링/시퀀스 토큰 에러는 지터가 있는 지수 백오프로 재시도
+    - close()는 모든 업로드가 끝날 때까지 기다린 뒤 통계를 반환하고,
+      재시도 후에도 실패한 배치가 있으면 (나머지 배치는 전송한 뒤) RuntimeError 발생
+    - 이벤트마다 순번(seq)을 기록하여 low_watermark()로 아직 업로드가 끝나지 않은 가장 앞의 순번을 알려줌
+      (끝난 배치를 수거할 때마다 on_collect 호출, 진행 상황 커밋에 사용)
+    - executor를 넘기면 그 스레드 풀을 함께 사용하고 종료는 소유자에게 맡김 (샤드 간 공유)
+    - slots(세마포어)를 넘기면 배치를 제출하기 전에 하나를 얻고 업로드가 끝나면 반환
+      (여러 업로더가 같은 slots를 쓰면 대기/진행 중인 배치 수가 업로더 수와 관계없이 제한됨)
+    """
+
+    def __init__(self, client, log_group_name, log_stream_name, max_workers=None, metrics=None, on_collect=None,
+                 executor=None, slots=None):
+        self.client = client
+        self.log_group_name = log_group_name
+        self.log_stream_name = log_stream_name
+        self.max_workers = max_workers or UPLOAD_CONCURRENCY
+        self.metrics = metrics
+        self.on_collect = on_collect
+        self.max_retries = UPLOAD_MAX_RETRIES
+        self.backoff_base = UPLOAD_BACKOFF_BASE
+        self.backoff_cap = UPLOAD_BACKOFF_CAP
+
+        self._owns_executor = executor is None
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers) if executor is None else executor
+        self._slots = slots
+        self._in_flight = set()
+        self._batch = []
+        self._batch_bytes = 0
+        self._batch_min_ts = None
+        self._batch_max_ts = None
+        self._next_seq = 0
+        self._batch_first_seq = None
+        self._queued_first_seq = None
+        self._failed_first_seq = None
+        self._in_flight_first_seq = {}
+
+        self.stats = {
+            'uploaded_events': 0,
+            'rejected_events': 0,
+            'oversized_events': 0,
+            'failed_events': 0,
+            'batches': 0,
+            'retries': 0,
+        }
+        self.errors = []
+
+    def add(self, event, seq=None):
+        if seq is None:
+            seq = self._next_seq
+        self._next_seq = seq + 1
+        message = event['message']
+        size = (len(message) if message.isascii() else len(message.encode('utf-8'))) + EVENT_OVERHEAD_BYTES
+        if size - EVENT_OVERHEAD_BYTES > MAX_EVENT_BYTES:
+            self.stats['oversized_events'] += 1
+            return
+
+        timestamp = event['timestamp']
+        if self._batch:
+            min_ts = min(self._batch_min_ts, timestamp)
+            max_ts = max(self._batch_max_ts, timestamp)
+            if (len(self._batch) >= MAX_BATCH_EVENTS
+                    or self._batch_bytes + size > MAX_BATCH_BYTES
+                    or max_ts - min_ts > MAX_BATCH_SPAN_MS):
+                self.flush()
+                min_ts = max_ts = timestamp
+                self._batch_first_seq = seq
+        else:
+            min_ts = max_ts = timestamp
+            self._batch_first_seq = seq
+
+        self._batch.append(event)
+        self._batch_bytes += size
+        self._batch_min_ts = min_ts
+        self._batch_max_ts = max_ts
+
+    def flush(self):
+        """
+        현재 배치를 업로드 큐에 제출 (진행 중인 배치가 가득 차면 하나가 끝날 때까지 대기)
+        """
+        if not self._batch:
+            return
+
+        batch = self._batch
+        self._batch = []
+        self._batch_bytes = 0
+        self._queued_first_seq = self._batch_first_seq
+        self._batch_first_seq = None
+
+        # 이미 끝난 업로드는 먼저 수거 (진행 상황을 배치 단위로 커밋할 수 있도록)
+        done = {future for future in self._in_flight if future.done()}
+        if done:
+            self._in_flight -= done
+            self._collect(done)
+
+        # 타임스탬프 기준 정렬 (CloudWatch 요구사항)
+        # ALB 로그는 거의 시간순이라 timsort가 이미 정렬된 구간(run)을 찾아 C 레벨에서 병합함
+        started = time.perf_counter()
+        batch.sort(key=operator.itemgetter('timestamp'))
+        sorted_at = time.perf_counter()
+
+        while len(self._in_flight) >= self.max_workers:
+            done, self._in_flight = wait(self._in_flight, return_when=FIRST_COMPLETED)
+            self._collect(done)
+        if self._slots is not None:
+            self._slots.acquire()
+
+        if self.metrics is not None:
+            self.metrics.add_time('sort', sorted_at - started)
+            self.metrics.add_time('upload_wait', time.perf_counter() - sorted_at)
+
+        try:
+            future = self._executor.submit(self._put_batch, batch)
+        except BaseException:
+            if self._slots is not None:
+                self._slots.release()
+            raise
+        if self._slots is not None:
+            future.add_done_callback(lambda _: self._slots.release())
+        self._in_flight.add(future)
+        self._in_flight_first_seq[future] = self._queued_first_seq
+        self._queued_first_seq = None
+        self.stats['batches'] += 1
+
+    def low_watermark(self):
+        """
+        업로드가 끝나지 않은(대기/진행 중이거나 실패한) 이벤트 중 가장 앞의 순번, 없으면 None
+        """
+        pending = [
+            seq for seq in (self._batch_first_seq, self._queued_first_seq, self._failed_first_seq)
+            if seq is not None
+        ]
+        pending.extend(self._in_flight_first_seq.values())
+        return min(pending, default=None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # 예외로 빠져나가는 경우에도 진행 중인 업로드를 마무리하고 스레드 풀 정리
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+        else:
+            wait(self._in_flight)
+
+    def close(self):
+        """
+        남은 배치를 업로드하고 모든 업로드가 끝날 때까지 대기한 뒤 통계 반환
+        """
+        self.flush()
+        started = time.perf_counter()
+        done, _ = wait(self._in_flight)
+        if self.metrics is not None:
+            self.metrics.add_time('upload_wait', time.perf_counter() - started)
+        self._in_flight = set()
+        self._collect(done)
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+
+        if self.errors:
+            raise RuntimeError(
+                f"Failed to upload {self.stats['failed_events']} log events "
+                f"in {len(self.errors)} batches: {self.errors[0]}"
+            )
+        return self.stats
+
+    def _collect(self, futures):
+        for future in futures:
+            batch_size, uploaded, rejected, retries, error = future.result()
+            first_seq = self._in_flight_first_seq.pop(future, None)
+            self.stats['uploaded_events'] += uploaded
+            self.stats['rejected_events'] += rejected
+            self.stats['retries'] += retries
+            if error is not None:
+                self.stats['failed_events'] += batch_size
+                self.errors.append(error)
+                if first_seq is not None and (self._failed_first_seq is None or first_seq < self._failed_first_seq):
+                    self._failed_first_seq = first_seq
+        if futures and self.on_collect is not None:
+            self.on_collect()
+
+    def _put_batch(self, batch):
+        """
+        배치 하나를 업로드 (스레드 풀에서 실행)
+        반환: (배치 크기, 업로드 수, 거부 수, 재시도 횟수, 에러 메시지 또는 None)
+        """
+        retries = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.client.put_log_events(
+                    logGroupName=self.log_group_name,
+                    logStreamName=self.log_stream_name,
+                    logEvents=batch
+                )
+            except Exception as e:
+                if self.metrics is not None:
+                    self.metrics.add_time('upload', time.perf_counter() - started)
+                code = _error_code(e)
+                if code == 'DataAlreadyAcceptedException':
+                    # 이전 시도가 이미 반영됨
+                    return len(batch), len(batch), 0, retries, None
+                if retries >= self.max_retries or not _is_retryable_error(e):
+                    return len(batch), 0, 0, retries, f"{code or type(e).__name__}: {e}"
+
+                # Full jitter 지수 백오프
+                time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** retries))))
+                retries += 1
+                continue
+
+            if self.metrics is not None:
+                self.metrics.add_time('upload', time.perf_counter() - started)
+            rejected = _rejected_events_count(response, len(batch))
+            return len(batch), len(batch) - rejected, rejected, retries, None
+
+
+def extract_s3_objects(event):
+    """
+    Lambda 이벤트에서 처리할 S3 객체 목록 추출
+
+    - S3 이벤트 알림: Records[].s3
+    - SQS로 전달된 S3 알림: Records[].body (S3 이벤트 JSON), SNS로 한 번 더 감싼 경우 포함
+    반환: [{'item_id': SQS messageId 또는 None, 'bucket', 'key', 'etag', 'error'}]
+    본문을 해석할 수 없는 SQS 메시지는 error가 채워진 항목으로 반환 (부분 실패로 보고)
+    """
+    objects = []
+    for record in event.get('Records', []):
+        if 's3' in record:
+            objects.append({
+                'item_id': None,
+                'bucket': record['s3']['bucket']['name'],
+                'key': unquote_plus(record['s3']['object']['key']),
+                'etag': normalize_etag(record['s3']['object'].get('eTag')),
+                'error': None
+            })
+            continue
+
+        item_id = record.get('messageId')
+        try:
+            body = json.loads(record['body'])
+            if 'Message' in body and body.get('Type') == 'Notification':
+                body = json.loads(body['Message'])
+            # s3:TestEvent 등 Records가 없는 메시지는 처리할 객체가 없음
+            for inner in body.get('Records', []):
+                objects.append({
+                    'item_id': item_id,
+                    'bucket': inner['s3']['bucket']['name'],
+                    'key': unquote_plus(inner['s3']['object']['key']),
+                    'etag': normalize_etag(inner['s3']['object'].get('eTag')),
+                    'error': None
+                })
+        except (KeyError, TypeError, ValueError) as e:
+            objects.append({
+                'item_id': item_id, 'bucket': None, 'key': None, 'etag': None, 'error': f"Invalid message: {e}"
+            })
+    return objects
+
+
+def normalize_etag(etag):
+    """
+    S3 ETag에서 따옴표 제거 (이벤트 알림의 eTag에는 없고 GetObject 응답의 ETag에는 있음)
+    """
+    return etag.strip('"') if etag else None
+
+
+# 처리한 객체 인덱스 (멱등 재처리)
+#
+# 항목 키는 (bucket, key, ETag)이고 상태는 partial(업로드 중) 또는 done(완료)
+# committed_offset은 싱크에 전달된 이벤트 순번 기준으로, 그 앞의 이벤트는 모두 업로드가 끝났음을 뜻함
+# 같은 객체가 다시 전달되면 done은 다운로드 없이 건너뛰고, partial은 커밋된 오프셋 이후 이벤트만 업로드
+# 백엔드 공통 인터페이스: get(bucket, key, etag) → {'status', 'offset'} 또는 None,
+# commit(bucket, key, etag, offset), complete(bucket, key, etag, offset, events_count)
+
+class SqliteObjectIndex:
+    """
+    SQLite 파일 기반 인덱스 (테스트, 백필용, 여러 스레드/프로세스에서 같은 파일 사용 가능)
+    """
+
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS processed_objects ('
+                ' bucket TEXT NOT NULL, key TEXT NOT NULL, etag TEXT NOT NULL,'
+                ' status TEXT NOT NULL, committed_offset INTEGER NOT NULL, events_count INTEGER,'
+                ' updated_at REAL NOT NULL, PRIMARY KEY (bucket, key, etag))'
+            )
+
+    def get(self, bucket, key, etag):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status, committed_offset FROM processed_objects WHERE bucket = ? AND key = ? AND etag = ?',
+                (bucket, key, etag)
+            ).fetchone()
+        return None if row is None else {'status': row[0], 'offset': row[1]}
+
+    def commit(self, bucket, key, etag, offset):
+        # 오프셋은 앞으로만 이동하고 완료된 항목은 바꾸지 않음
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO processed_objects VALUES (?, ?, ?, \'partial\', ?, NULL, ?)'
+                ' ON CONFLICT (bucket, key, etag) DO UPDATE SET'
+                ' committed_offset = excluded.committed_offset, updated_at = excluded.updated_at'
+                ' WHERE status = \'partial\' AND committed_offset < excluded.committed_offset',
+                (bucket, key, etag, offset, time.time())
+            )
+
+    def complete(self, bucket, key, etag, offset, events_count):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO processed_objects VALUES (?, ?, ?, \'done\', ?, ?, ?)',
+                (bucket, key, etag, offset, events_count, time.time())
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+class DynamoDbObjectIndex:
+    """
+    DynamoDB 테이블 기반 인덱스 (운영용)
+    조건부 업데이트로 오프셋이 뒤로 가거나 완료 항목이 partial로 돌아가지 않게 하고,
+    expires_at(TTL)이 지난 항목은 DynamoDB가 삭제
+    """
+
+    def __init__(self, table_name, client=None):
+        self.table_name = table_name
+        self.client = client or _create_client('dynamodb')
+
+    def _key(self, bucket, key, etag):
+        return {'object': {'S': f"{bucket}/{key}"}, 'etag': {'S': etag}}
+
+    def _expires_at(self):
+        return {'N': str(int(time.time()) + DEDUP_TTL_DAYS * 86400)}
+
+    def get(self, bucket, key, etag):
+        item = self.client.get_item(
+            TableName=self.table_name, Key=self._key(bucket, key, etag), ConsistentRead=True
+        ).get('Item')
+        if item is None:
+            return None
+        return {'status': item['status']['S'], 'offset': int(item['committed_offset']['N'])}
+
+    def commit(self, bucket, key, etag, offset):
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key=self._key(bucket, key, etag),
+                UpdateExpression='SET #status = :partial, committed_offset = :offset, expires_at = :expires_at',
+                ConditionExpression=('attribute_not_exists(committed_offset)'
+                                     ' OR (#status = :partial AND committed_offset < :offset)'),
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':partial': {'S': 'partial'},
+                    ':offset': {'N': str(offset)},
+                    ':expires_at': self._expires_at()
+                }
+            )
+        except Exception as e:
+            # 다른 시도가 이미 더 앞선 오프셋을 커밋했거나 완료함
+            if _error_code(e) != 'ConditionalCheckFailedException':
+                raise
+
+    def complete(self, bucket, key, etag, offset, events_count):
+        self.client.update_item(
+            TableName=self.table_name,
+            Key=self._key(bucket, key, etag),
+            UpdateExpression=('SET #status = :done, committed_offset = :offset,'
+                              ' events_count = :events_count, expires_at = :expires_at'),
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':done': {'S': 'done'},
+                ':offset': {'N': str(offset)},
+                ':events_count': {'N': str(events_count)},
+                ':expires_at': self._expires_at()
+            }
+        )
+
+
+def open_object_index(spec):
+    """
+    DEDUP_INDEX 형식의 설정으로 인덱스 생성 (비어 있으면 None)
+    """
+    if not spec:
+        return None
+    if spec.startswith('sqlite://'):
+        return SqliteObjectIndex(spec[len('sqlite://'):])
+    if spec.startswith('dynamodb://'):
+        return DynamoDbObjectIndex(spec[len('dynamodb://'):])
+    raise ValueError(f"Unknown dedup index: {spec}")
+
+
+def get_object_index():
+    """
+    DEDUP_INDEX 인덱스 반환 (처음 호출할 때 생성, 이후 재사용, 비활성이면 None)
+    """
+    global object_index
+    if object_index is None and DEDUP_INDEX:
+        with _client_lock:
+            if object_index is None:
+                object_index = open_object_index(DEDUP_INDEX)
+    return object_index
+
+
+class ObjectProgress:
+    """
+    객체 하나의 업로드 진행 상황
+    싱크가 업로드 완료된 이벤트 순번을 update()로 알려주면 늘어난 경우에만 인덱스에 커밋
+    """
+
+    def __init__(self, index, bucket, key, etag, offset=0):
+        self.index = index
+        self.bucket = bucket
+        self.key = key
+        self.etag = etag
+        self.start_offset = offset
+        self.committed = offset
+
+    def update(self, offset):
+        if offset > self.committed:
+            self.index.commit(self.bucket, self.key, self.etag, offset)
+            self.committed = offset
+
+    def complete(self, events_count):
+        self.index.complete(self.bucket, self.key, self.etag, self.committed, events_count)
+
+
+# 이미 존재가 확인된 로그 스트림 (웜 스타트에서는 CreateLogStream 호출 생략)
+_known_log_streams = set()
+
+
+def ensure_log_stream(log_stream_name=LOG_STREAM_NAME):
+    """
+    Log Stream 생성 (존재하지 않으면)
+    """
+    if log_stream_name in _known_log_streams:
+        return
+    client = get_logs_client()
+    retries = 0
+    while True:
+        try:
+            client.create_log_stream(
+                logGroupName=LOG_GROUP_NAME,
+                logStreamName=log_stream_name
+            )
+        except client.exceptions.ResourceAlreadyExistsException:
+            pass
+        except Exception as e:
+            # logs 클라이언트는 botocore 재시도를 끄므로 스로틀링은 업로드와 같은 백오프로 재시도
+            if retries >= UPLOAD_MAX_RETRIES or not _is_retryable_error(e):
+                raise
+            time.sleep(random.uniform(0, min(UPLOAD_BACKOFF_CAP, UPLOAD_BACKOFF_BASE * (2 ** retries))))
+            retries += 1
+            continue
+        break
+    _known_log_streams.add(log_stream_name)
+
+
+def alb_node_from_key(key):
+    """
+    ALB 로그 파일명에서 로그를 기록한 ALB 노드 IP 추출 (형식이 다르면 None)
+    {account}_elasticloadbalancing_{region}_{lb-id}_{end-time}_{ip-address}_{random}.log.gz
+    """
+    parts = key.rsplit('/', 1)[-1].split('_')
+    if len(parts) < 7 or parts[1] != 'elasticloadbalancing':
+        return None
+    return parts[-2]
+
+
+def log_stream_for_object(key, sharding=None):
+    """
+    객체 단위 샤딩(none/node/hash)에서 객체의 이벤트를 보낼 스트림 이름
+    """
+    if sharding is None:
+        sharding = LOG_STREAM_SHARDING
+    if sharding == 'node':
+        node = alb_node_from_key(key)
+        return f"{LOG_STREAM_NAME}/node/{node}" if node else LOG_STREAM_NAME
+    if sharding == 'hash':
+        return f"{LOG_STREAM_NAME}/shard/{zlib.crc32(key.encode('utf-8')) % LOG_STREAM_SHARDS}"
+    if sharding in ('none', 'service'):
+        return LOG_STREAM_NAME
+    raise ValueError(f"Unknown log stream sharding: {sharding}")
+
+
+class CloudWatchLogsSink:
+    """
+    파싱 결과를 직렬화하여 CloudWatch Logs로 업로드하는 싱크 (LogEventsUploader 사용)
+
+    싱크 공통 인터페이스: serialize 속성(직렬화 함수, 필요 없으면 None),
+    write(parsed, message), close() → 통계 dict, with 문 지원
+
+    progress(ObjectProgress)가 주어지면 이전 시도에서 커밋된 오프셋까지의 이벤트는 건너뛰고,
+    배치 업로드가 끝날 때마다 연속으로 완료된 이벤트 순번을 커밋
+    """
+
+    def __init__(self, client, log_group_name, log_stream_name, serialize, metrics=None, progress=None):
+        self.serialize = serialize
+        self.progress = progress
+        self.skip = progress.start_offset if progress is not None else 0
+        self.written = 0
+        self.uploader = LogEventsUploader(
+            client, log_group_name, log_stream_name, metrics=metrics,
+            on_collect=self._commit_progress if progress is not None else None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uploader.__exit__(*exc_info)
+
+    def write(self, parsed, message):
+        seq = self.written
+        self.written = seq + 1
+        if seq < self.skip:
+            return
+        self.uploader.add({'timestamp': parsed['timestamp_ms'], 'message': message}, seq)
+
+    def _commit_progress(self):
+        watermark = self.uploader.low_watermark()
+        self.progress.update(self.written if watermark is None else watermark)
+
+    def close(self):
+        return self.uploader.close()
+
+
+class ShardedCloudWatchLogsSink:
+    """
+    서비스별 스트림으로 나눠 업로드하는 싱크
+    스트림마다 LogEventsUploader를 따로 두어 샤드들이 서로 병렬로 업로드되지만,
+    스레드 풀은 하나(max_workers, 기본 UPLOAD_CONCURRENCY)를 공유하므로
+    샤드 수와 관계없이 동시 PutLogEvents 호출 수와 커넥션 사용량은 객체당 max_workers로 제한됨
+    제출한 배치 수도 샤드 전체가 공유하는 세마포어(max_workers개)로 제한하여
+    스레드 풀 큐에 쌓이는 배치(최대 1MiB씩)가 샤드 수만큼 늘어나지 않게 함
+    이벤트 순번은 샤드 전체에서 공통이고, 커밋 오프셋은 모든 샤드에서 완료된 연속 구간 기준
+    """
+
+    def __init__(self, client, log_group_name, serialize, max_workers=None, metrics=None, progress=None):
+        self.client = client
+        self.log_group_name = log_group_name
+        self.serialize = serialize
+        self.max_workers = max_workers
+        self.metrics = metrics
+        self.progress = progress
+        self.skip = progress.start_offset if progress is not None else 0
+        self.written = 0
+        self.uploaders = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or UPLOAD_CONCURRENCY)
+        self._slots = threading.BoundedSemaphore(max_workers or UPLOAD_CONCURRENCY)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for uploader in self.uploaders.values():
+            uploader.__exit__(*exc_info)
+        self._executor.shutdown(wait=True)
+
+    def write(self, parsed, message):
+        seq = self.written
+        self.written = seq + 1
+        if seq < self.skip:
+            return
+        service = parsed['service']
+        uploader = self.uploaders.get(service)
+        if uploader is None:
+            log_stream_name = f"{LOG_STREAM_NAME}/service/{service}"
+            ensure_log_stream(log_stream_name)
+            uploader = self.uploaders[service] = LogEventsUploader(
+                self.client, self.log_group_name, log_stream_name, self.max_workers, self.metrics,
+                on_collect=self._commit_progress if self.progress is not None else None, executor=self._executor,
+                slots=self._slots)
+        uploader.add({'timestamp': parsed['timestamp_ms'], 'message': message}, seq)
+
+    def _commit_progress(self):
+        watermarks = [uploader.low_watermark() for uploader in self.uploaders.values()]
+        self.progress.update(min((seq for seq in watermarks if seq is not None), default=self.written))
+
+    def close(self):
+        # 한 샤드가 실패해도 나머지 샤드는 끝까지 업로드한 뒤 에러 보고
+        stats = {'uploaded_events': 0, 'rejected_events': 0, 'batches': 0}
+        errors = []
+        for uploader in self.uploaders.values():
+            try:
+                shard_stats = uploader.close()
+            except RuntimeError as e:
+                errors.append(str(e))
+                shard_stats = uploader.stats
+            for name in stats:
+                stats[name] += shard_stats[name]
+        self._executor.shutdown(wait=True)
+        if errors:
+            raise RuntimeError('; '.join(errors))
+        return stats
+
+
+def make_log_events_sink(key, serialize, sharding=None, metrics=None, progress=None):
+    """
+    샤딩 설정에 맞는 CloudWatch Logs 싱크 생성 (필요한 스트림은 처음 사용할 때 한 번만 생성)
+    """
+    if sharding is None:
+        sharding = LOG_STREAM_SHARDING
+    if sharding == 'service':
+        return ShardedCloudWatchLogsSink(
+            get_logs_client(), LOG_GROUP_NAME, serialize, metrics=metrics, progress=progress)
+    log_stream_name = log_stream_for_object(key, sharding)
+    ensure_log_stream(log_stream_name)
+    return CloudWatchLogsSink(get_logs_client(), LOG_GROUP_NAME, log_stream_name, serialize, metrics, progress)
+
+
+class NdjsonSink:
+    """
+    파싱 결과를 직렬화하여 NDJSON 파일로 저장하는 싱크 (백필용)
+    임시 파일에 쓴 뒤 close()에서 이름을 바꾸므로 중단되면 결과 파일이 남지 않음
+    """
+
+    def __init__(self, path, serialize):
+        self.path = path
+        self.serialize = serialize
+        self._tmp_path = f"{path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._tmp_path)
+
+    def write(self, parsed, message):
+        self._file.write(message)
+        self._file.write('\n')
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return {'uploaded_events': self.count, 'batches': 0, 'rejected_events': 0}
+
+
+class NullSink:
+    """
+    원본 이벤트를 버리는 싱크 (집계 결과만 필요한 경우, 직렬화도 하지 않음)
+    """
+
+    serialize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def write(self, parsed, message):
+        pass
+
+    def close(self):
+        return {'uploaded_events': 0, 'batches': 0, 'rejected_events': 0}
+
+
+# 컬럼 파일 내보내기 (분석용)
+#
+# albc 파일 구조 (모든 정수는 little-endian):
+#   'ALBC' | 컬럼 청크들 | 푸터 JSON | 푸터 길이(uint32) | 'ALBC'
+# 컬럼 청크는 로우 그룹 × 컬럼마다 하나씩 zlib으로 압축되어 있고,
+# 푸터에 스키마와 로우 그룹별 컬럼 청크의 (offset, length), timestamp_ms 최소/최대가 들어 있어
+# 필요한 컬럼의 청크만 읽을 수 있음
+#   int32/int64: 고정 폭 배열, null은 최솟값으로 표시
+#   float64: double 배열, null은 NaN
+#   string: 사전(JSON 배열) 길이(uint32) + 사전 + int32 인덱스 배열 (null은 -1)
+
+_ALBC_ARRAY_TYPES = {'int32': 'i', 'int64': 'q', 'float64': 'd'}
+_ALBC_NULLS = {'int32': -2 ** 31, 'int64': -2 ** 63}
+
+
+def _albc_array(typecode, values=()):
+    from array import array
+
+    result = array(typecode, values)
+    if sys.byteorder == 'big':
+        result.byteswap()
+    return result
+
+
+def _encode_albc_column(kind, values):
+    if kind == 'string':
+        dictionary = {}
+        indices = [-1 if value is None else dictionary.setdefault(value, len(dictionary)) for value in values]
+        encoded = json.dumps(list(dictionary), ensure_ascii=False).encode('utf-8')
+        return len(encoded).to_bytes(4, 'little') + encoded + _albc_array('i', indices).tobytes()
+    if kind == 'float64':
+        nan = float('nan')
+        return _albc_array('d', [nan if value is None else value for value in values]).tobytes()
+    null = _ALBC_NULLS[kind]
+    return _albc_array(_ALBC_ARRAY_TYPES[kind], [null if value is None else value for value in values]).tobytes()
+
+
+def _decode_albc_column(kind, data):
+    if kind == 'string':
+        size = int.from_bytes(data[:4], 'little')
+        dictionary = json.loads(data[4:4 + size].decode('utf-8'))
+        indices = _albc_array('i')
+        indices.frombytes(data[4 + size:])
+        if sys.byteorder == 'big':
+            indices.byteswap()
+        return [None if index < 0 else dictionary[index] for index in indices]
+
+    values = _albc_array(_ALBC_ARRAY_TYPES[kind])
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    if kind == 'float64':
+        return [None if value != value else value for value in values]
+    null = _ALBC_NULLS[kind]
+    return [None if value == null else value for value in values]
+
+
+class AlbcFileWriter:
+    """
+    albc 컬럼 파일 작성기 (pyarrow 없이 사용하는 대체 포맷)
+    write_row_group()마다 컬럼별 청크를 압축해서 바로 기록하고 close()에서 푸터 기록
+    """
+
+    extension = 'albc'
+
+    def __init__(self, path, schema=COLUMNAR_SCHEMA):
+        self.schema = schema
+        self._file = open(path, 'wb')
+        self._file.write(ALBC_MAGIC)
+        self._row_groups = []
+
+    def write_row_group(self, columns):
+        rows = len(columns[self.schema[0][0]])
+        offsets = {}
+        for name, kind in self.schema:
+            chunk = zlib.compress(_encode_albc_column(kind, columns[name]), 6)
+            offsets[name] = [self._file.tell(), len(chunk)]
+            self._file.write(chunk)
+        timestamps = [value for value in columns.get('timestamp_ms', ()) if value is not None]
+        self._row_groups.append({
+            'rows': rows,
+            'columns': offsets,
+            'timestamp_ms': [min(timestamps), max(timestamps)] if timestamps else None
+        })
+
+    def close(self):
+        footer = json.dumps({
+            'version': ALBC_VERSION,
+            'schema': [list(column) for column in self.schema],
+            'row_groups': self._row_groups
+        }, separators=(',', ':')).encode('utf-8')
+        self._file.write(footer)
+        self._file.write(len(footer).to_bytes(4, 'little'))
+        self._file.write(ALBC_MAGIC)
+        self._file.close()
+
+
+def read_albc_columns(path, columns=None):
+    """
+    albc 파일에서 요청한 컬럼만 읽어 {컬럼: 값 리스트} 반환 (다른 컬럼의 청크는 읽지 않음)
+    """
+    with open(path, 'rb') as f:
+        f.seek(-8, os.SEEK_END)
+        tail = f.read(8)
+        if tail[4:] != ALBC_MAGIC:
+            raise ValueError(f"Not an albc file: {path}")
+        footer_size = int.from_bytes(tail[:4], 'little')
+        f.seek(-8 - footer_size, os.SEEK_END)
+        footer = json.loads(f.read(footer_size).decode('utf-8'))
+
+        kinds = dict(footer['schema'])
+        names = list(kinds) if columns is None else list(columns)
+        result = {name: [] for name in names}
+        for row_group in footer['row_groups']:
+            for name in names:
+                offset, length = row_group['columns'][name]
+                f.seek(offset)
+                result[name].extend(_decode_albc_column(kinds[name], zlib.decompress(f.read(length))))
+    return result
+
+
+class ParquetFileWriter:
+    """
+    Parquet 컬럼 파일 작성기 (pyarrow, zstd 압축, write_row_group()마다 로우 그룹 하나)
+    """
+
+    extension = 'parquet'
+
+    def __init__(self, path, schema=COLUMNAR_SCHEMA):
+        import pyarrow
+        import pyarrow.parquet
+
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema([
+            (name, {'int32': pyarrow.int32(), 'int64': pyarrow.int64(),
+                    'float64': pyarrow.float64(), 'string': pyarrow.string()}[kind])
+            for name, kind in schema
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression='zstd')
+
+    def write_row_group(self, columns):
+        table = self._pyarrow.Table.from_pydict(columns, schema=self._schema)
+        self._writer.write_table(table, row_group_size=table.num_rows)
+
+    def close(self):
+        self._writer.close()
+
+
+def resolve_columnar_format(file_format=None):
+    """
+    'auto'면 pyarrow 설치 여부에 따라 parquet 또는 albc 선택
+    """
+    file_format = file_format or COLUMNAR_FORMAT
+    if file_format == 'auto':
+        # 설치 여부만 확인 (pyarrow import는 수백 ms가 걸리므로 실제로 쓸 때 로드)
+        import importlib.util
+
+        return 'parquet' if importlib.util.find_spec('pyarrow') is not None else 'albc'
+    if file_format not in ('parquet', 'albc'):
+        raise ValueError(f"Unknown columnar format: {file_format}")
+    return file_format
+
+
+def read_columnar_file(path, columns=None):
+    """
+    컬럼 파일(.parquet 또는 .albc)에서 요청한 컬럼만 읽어 {컬럼: 값 리스트} 반환
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet
+
+        return pyarrow.parquet.read_table(path, columns=columns).to_pydict()
+    return read_albc_columns(path, columns)
+
+
+def columnar_part_name(object_key):
+    """
+    원본 객체 키 → 컬럼 파일 이름 (sha1 앞 16자리, 다른 객체끼리 파일을 덮어쓰지 않도록 64비트 사용)
+    """
+    return f"part-{hashlib.sha1(object_key.encode('utf-8')).hexdigest()[:16]}"
+
+
+class ColumnarSink:
+    """
+    파싱 결과를 date/hour/service로 분할된 컬럼 파일로 저장하는 싱크
+    (process_log_lines의 export로 넘기면 샘플링 판정 전의 전체 레코드를 가중치 1로 저장)
+
+    파티션마다 행을 COLUMNAR_ROW_GROUP_SIZE개씩 모아 로우 그룹으로 기록하고,
+    close()에서 파일을 대상 위치(로컬 디렉토리 또는 S3)로 옮김
+    파일 이름은 원본 객체 키의 해시라서 같은 객체를 다시 처리하면 중복되지 않고 덮어씀
+    """
+
+    serialize = None
+
+    def __init__(self, prefix, object_key, file_format=None, row_group_size=None):
+        self.prefix = prefix.rstrip('/')
+        self.file_format = resolve_columnar_format(file_format)
+        self.row_group_size = row_group_size or COLUMNAR_ROW_GROUP_SIZE
+        self.part_name = columnar_part_name(object_key)
+        self._writer_class = ParquetFileWriter if self.file_format == 'parquet' else AlbcFileWriter
+        self._get_values = operator.itemgetter(*(name for name, _ in COLUMNAR_SCHEMA[:-1]))
+        self._hours = {}
+        self._buffers = {}
+        self._writers = {}
+        self._staging = tempfile.mkdtemp(prefix='alb-columnar-')
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        import shutil
+
+        for writer, _ in self._writers.values():
+            writer.close()
+        self._writers = {}
+        shutil.rmtree(self._staging, ignore_errors=True)
+
+    def _partition(self, timestamp_ms, service):
+        hour = timestamp_ms // 3600000
+        partition = self._hours.get(hour)
+        if partition is None:
+            moment = time.gmtime(hour * 3600)
+            partition = self._hours[hour] = f"date={time.strftime('%Y-%m-%d', moment)}/hour={moment.tm_hour:02d}"
+        return f"{partition}/service={service}"
+
+    def write(self, parsed, message):
+        partition = self._partition(parsed['timestamp_ms'], parsed['service'])
+        rows = self._buffers.get(partition)
+        if rows is None:
+            rows = self._buffers[partition] = []
+        rows.append(self._get_values(parsed) + (parsed.get('sample_weight', 1.0),))
+        if len(rows) >= self.row_group_size:
+            self._flush(partition)
+
+    def _flush(self, partition):
+        rows = self._buffers.pop(partition, None)
+        if not rows:
+            return
+        entry = self._writers.get(partition)
+        if entry is None:
+            staging_path = os.path.join(self._staging, f"{len(self._writers)}.{self._writer_class.extension}")
+            entry = self._writers[partition] = (self._writer_class(staging_path), staging_path)
+        columns = dict(zip((name for name, _ in COLUMNAR_SCHEMA), map(list, zip(*rows))))
+        entry[0].write_row_group(columns)
+        self.rows += len(rows)
+
+    def close(self):
+        for partition in list(self._buffers):
+            self._flush(partition)
+
+        for partition, (writer, staging_path) in self._writers.items():
+            writer.close()
+            relative = f"{partition}/{self.part_name}.{self._writer_class.extension}"
+            if self.prefix.startswith('s3://'):
+                bucket, key_prefix = _split_s3_uri(self.prefix)
+                with open(staging_path, 'rb') as f:
+                    get_s3_client().put_object(
+                        Bucket=bucket, Key=f"{key_prefix}/{relative}" if key_prefix else relative, Body=f)
+            else:
+                destination = os.path.join(self.prefix, relative)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                os.replace(staging_path, destination)
+        files = len(self._writers)
+        self._writers = {}
+        self.__exit__(None, None, None)
+        return {'uploaded_events': self.rows, 'batches': files, 'rejected_events': 0}
+
+
+def _iter_partition_dirs(directory, name, accept):
+    try:
+        entries = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.startswith(name + '=') and accept(entry[len(name) + 1:]):
+            yield entry[len(name) + 1:], os.path.join(directory, entry)
+
+
+def query_latency_percentiles(root, services=None, start_ms=None, end_ms=None, fractions=(0.5, 0.95, 0.99)):
+    """
+    컬럼 파일에서 서비스별 요청 수와 응답 시간 분위수 계산
+
+    date/hour/service 파티션 경로로 먼저 걸러내서 범위 밖의 파일은 열지 않고,
+    파일에서는 response_time_ms와 sample_weight 컬럼만 읽음 (샘플링된 이벤트는 가중치만큼 계산)
+    start_ms/end_ms(포함)가 걸친 경계 시간 파티션에서만 timestamp_ms 컬럼을 추가로 읽음
+    반환: {서비스: {'count': 가중 요청 수, 'p50': ..., 'p95': ..., 'p99': ...}}
+    """
+    start_hour = None if start_ms is None else start_ms // 3600000
+    end_hour = None if end_ms is None else end_ms // 3600000
+
+    def hours_overlap(first_hour, last_hour):
+        return ((start_hour is None or last_hour >= start_hour)
+                and (end_hour is None or first_hour <= end_hour))
+
+    def date_in_range(date):
+        day = _epoch_seconds(f"{date}T00:00:00")
+        return day is not None and hours_overlap(day // 3600, day // 3600 + 23)
+
+    def hour_in_range(hour_index):
+        return hours_overlap(hour_index, hour_index)
+
+    buckets = {}
+    for date, date_dir in _iter_partition_dirs(root, 'date', date_in_range):
+        day_hour = _epoch_seconds(f"{date}T00:00:00") // 3600
+        for hour, hour_dir in _iter_partition_dirs(
+                date_dir, 'hour', lambda hour: hour.isdigit() and hour_in_range(day_hour + int(hour))):
+            # 범위 경계에 걸친 시간 파티션만 timestamp_ms 컬럼을 추가로 읽어 행 단위로 거름
+            hour_index = day_hour + int(hour)
+            edge = ((hour_index == start_hour and start_ms % 3600000 != 0)
+                    or (hour_index == end_hour and (end_ms + 1) % 3600000 != 0))
+            names = ['response_time_ms', 'sample_weight'] + (['timestamp_ms'] if edge else [])
+            for service, service_dir in _iter_partition_dirs(
+                    hour_dir, 'service', lambda service: services is None or service in services):
+                bucket = buckets.get(service)
+                if bucket is None:
+                    bucket = buckets[service] = LatencyBucket()
+                histogram = bucket.latency_histogram
+                for name in sorted(os.listdir(service_dir)):
+                    if not name.endswith(('.parquet', '.albc')):
+                        continue
+                    columns = read_columnar_file(os.path.join(service_dir, name), names)
+                    rows = zip(columns['response_time_ms'], columns['sample_weight'],
+                               columns['timestamp_ms'] if edge else columns['response_time_ms'])
+                    for latency, weight, timestamp_ms in rows:
+                        if latency is None:
+                            continue
+                        if edge and ((start_ms is not None and timestamp_ms < start_ms)
+                                     or (end_ms is not None and timestamp_ms > end_ms)):
+                            continue
+                        histogram[latency] += weight
+                        bucket.count += weight
+
+    results = {}
+    for service, bucket in sorted(buckets.items()):
+        if not bucket.count:
+            continue
+        values = bucket.quantiles(list(fractions))
+        results[service] = {'count': bucket.count}
+        for fraction, value in zip(fractions, values):
+            results[service][f"p{fraction * 100:g}"] = value
+    return results
+
+
+def process_log_lines(lines, sink, aggregator=None, sample_rate=None, metrics=None, rules=None, export=None):
+    """
+    로그 라인 → 파싱 → 집계 → 샘플링 규칙 → 직렬화 → 싱크 전송 파이프라인
+    싱크 close()까지 호출하고 라인/싱크 통계를 합쳐서 반환
+
+    집계(aggregator)는 대상에 도달한 모든 요청 기준이고, 원본 이벤트 전송 여부는 rules(SamplingRules)로 판정
+    export(ColumnarSink 등)가 주어지면 샘플링 판정 전에 모든 파싱 결과(target 미도달, 헬스 체크 포함)를 가중치 1로 기록
+    샘플링된 이벤트에는 sample_weight를 기록 (sample_rate는 sample 규칙/기본 비율에 곱하는 전체 비율, keep 규칙은 항상 전송)
+    metrics(PipelineMetrics)가 주어지면 라인 카운터와 parse/classify/serialize 시간, 출력 바이트 수를 기록
+    """
+    if sample_rate is None:
+        sample_rate = RAW_EVENT_SAMPLE_RATE
+    if rules is None:
+        rules = SAMPLING_RULES
+    parsed_count = 0
+    filtered = dropped = sampled_out = 0
+    line_stats = {'malformed_timestamps': 0}
+    serialize = sink.serialize
+    sample_interval = STAGE_SAMPLE_INTERVAL if metrics is not None and serialize is not None else 0
+    countdown = sample_interval
+    sampled = serialized = 0
+    serialize_seconds = 0.0
+    output_chars = 0
+    perf_counter = time.perf_counter
+    rate_for = rules.rate_for
+    exporting = export is not None
+    if not exporting:
+        export = NullSink()
+
+    with sink, export:
+        write = sink.write
+        export_write = export.write
+        for parsed in iter_parsed_logs(lines, line_stats, metrics, keep_unreached=True):
+            if parsed['response_time_ms'] is not None:
+                parsed_count += 1
+                if aggregator is not None:
+                    aggregator.add(parsed)
+            if exporting:
+                export_write(parsed, None)
+
+            rate = rate_for(parsed, sample_rate)[1]
+            if rate < 1.0:
+                if rate <= 0.0:
+                    # target 미도달 요청은 기존과 같이 봇 필터(lines_filtered)로, 나머지는 규칙 제외로 집계
+                    if parsed['response_time_ms'] is None:
+                        filtered += 1
+                    else:
+                        dropped += 1
+                    continue
+                if trace_sample_point(parsed['raw_message']) >= rate:
+                    sampled_out += 1
+                    continue
+                parsed['sample_weight'] = 1.0 / rate
+
+            if serialize is None:
+                write(parsed, None)
+                continue
+            countdown -= 1
+            if countdown == 0:
+                countdown = sample_interval
+                started = perf_counter()
+                message = serialize(parsed)
+                serialize_seconds += perf_counter() - started
+                sampled += 1
+            else:
+                message = serialize(parsed)
+            # 출력 바이트는 문자 수로 근사 (ALB 로그는 ASCII)
+            serialized += 1
+            output_chars += len(message)
+            write(parsed, message)
+        sink_stats = sink.close()
+        export_stats = export.close()
+
+    if metrics is not None:
+        metrics.counters['lines_filtered'] += filtered
+        metrics.counters['events_dropped'] += dropped
+        metrics.counters['events_sampled_out'] += sampled_out
+        metrics.counters['bytes_out'] += output_chars
+        if sampled:
+            metrics.add_time('serialize', serialize_seconds * serialized / sampled)
+
+    return {
+        'parsed_count': parsed_count,
+        'malformed_timestamps': line_stats['malformed_timestamps'],
+        'events_count': sink_stats['uploaded_events'],
+        'batches': sink_stats['batches'],
+        'rejected_events': sink_stats['rejected_events'],
+        'exported_rows': export_stats['uploaded_events']
+    }
+
+
+def process_s3_object(bucket, key, metrics=None, etag=None, index=None):
+    """
+    S3 객체 하나를 스트리밍으로 다운로드/해제/파싱하여 CloudWatch Logs로 업로드
+    업로드가 최종 실패하면 예외 발생
+    단계별 시간/카운터는 metrics(PipelineMetrics)에 기록하고 요약을 결과에 포함
+
+    처리한 객체 인덱스(index, 기본은 DEDUP_INDEX)가 있으면 bucket/key/ETag로 조회하여
+    완료된 객체는 다운로드 없이 건너뛰고, 업로드 중 중단된 객체는 커밋된 오프셋 이후 이벤트만 업로드
+    (이벤트에 ETag가 없으면 GetObject 응답의 ETag 사용)
+    """
+    print(f"Processing S3 object: s3://{bucket}/{key}")
+    if metrics is None:
+        metrics = PipelineMetrics()
+    if index is None:
+        index = get_object_index()
+    started = time.perf_counter()
+
+    entry = index.get(bucket, key, etag) if index is not None and etag is not None else None
+    response = None
+    if entry is None or entry['status'] != 'done':
+        # S3에서 파일 다운로드 (스트리밍)
+        response = get_s3_client().get_object(Bucket=bucket, Key=key)
+        metrics.add_time('fetch', time.perf_counter() - started)
+        if index is not None and etag is None:
+            etag = normalize_etag(response.get('ETag'))
+            entry = index.get(bucket, key, etag) if etag is not None else None
+
+    if entry is not None and entry['status'] == 'done':
+        if response is not None and hasattr(response['Body'], 'close'):
+            response['Body'].close()
+        print(f"Skipping already processed s3://{bucket}/{key} (ETag {etag})")
+        return {'bucket': bucket, 'key': key, 'status': 'skipped', 'etag': etag, 'events_count': 0}
+
+    progress = None
+    if index is not None and etag is not None:
+        progress = ObjectProgress(index, bucket, key, etag, entry['offset'] if entry is not None else 0)
+        if progress.start_offset:
+            print(f"Resuming s3://{bucket}/{key} after {progress.start_offset} committed events")
+
+    # gzip 해제 → 파싱 → 집계/배치 업로드를 스트리밍으로 처리
+    # (배치가 찰 때마다 파싱과 병렬로 업로드됨)
+    aggregator = LatencyAggregator() if EMIT_METRICS else None
+    sink = make_log_events_sink(key, get_serializer(OUTPUT_PROFILE), metrics=metrics, progress=progress)
+    # 샘플링 전의 전체 레코드를 분석용 컬럼 파일로도 저장 (원본 객체 경로를 포함해 파일 이름 결정)
+    export = ColumnarSink(COLUMNAR_EXPORT_PREFIX, f"{bucket}/{key}") if COLUMNAR_EXPORT_PREFIX else None
+    stats = process_log_lines(iter_gzip_lines(response['Body'], metrics=metrics), sink, aggregator, metrics=metrics,
+                              export=export)
+    metrics.wall_seconds += time.perf_counter() - started
+
+    metric_documents = emit_metric_documents(aggregator.to_emf_documents()) if aggregator is not None else 0
+    if progress is not None:
+        progress.complete(stats['events_count'])
+
+    if stats['malformed_timestamps']:
+        print(f"Skipped {stats['malformed_timestamps']} lines with malformed timestamps in s3://{bucket}/{key}")
+    print(f"Successfully uploaded {stats['events_count']} log events from s3://{bucket}/{key}")
+    result = {
+        'bucket': bucket,
+        'key': key,
+        'status': 'ok',
+        **stats,
+        'metric_documents': metric_documents,
+        'pipeline': metrics.summary()
+    }
+    if progress is not None and progress.start_offset:
+        result['resumed_from'] = progress.start_offset
+    return result
+
+
+def lambda_handler(event, context):
+    """
+    S3 이벤트(또는 SQS로 전달된 S3 이벤트)의 모든 ALB 로그 파일을 읽어
+    CloudWatch Logs로 전송 (구조화된 JSON)
+
+    객체들은 제한된 크기의 워커 풀에서 동시에 처리하고, 객체별 결과를 반환함
+    일부 객체가 실패해도 나머지는 처리하며, SQS 메시지 단위 실패는 batchItemFailures로 보고
+    호출마다 단계별 시간/카운터 요약을 한 줄 JSON과 EMF로 출력 (PROFILE_SAMPLE_RATE 비율은 프로파일 포함)
+    """
+    invocation_started = time.perf_counter()
+    try:
+        objects = extract_s3_objects(event)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+    profiler = InvocationProfiler() if InvocationProfiler.sampled() else None
+    process = profiler.wrap(process_s3_object) if profiler is not None else process_s3_object
+
+    results = [None] * len(objects)
+    pending = {}
+    # 객체마다 따로 기록하고 끝난 뒤 합침 (카운터는 처리 스레드 하나에서만 갱신)
+    object_metrics = []
+    runnable = [i for i, obj in enumerate(objects) if obj['error'] is None]
+    if runnable:
+        # 프로파일링하는 호출은 cProfile이 겹치지 않도록 객체를 하나씩 처리
+        object_workers = 1 if profiler is not None else min(OBJECT_CONCURRENCY, len(runnable))
+        with ThreadPoolExecutor(max_workers=object_workers) as executor:
+            for i in runnable:
+                metrics = PipelineMetrics()
+                object_metrics.append(metrics)
+                obj = objects[i]
+                pending[executor.submit(process, obj['bucket'], obj['key'], metrics, obj['etag'])] = i
+
+            for future, i in pending.items():
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    print(f"Error processing s3://{objects[i]['bucket']}/{objects[i]['key']}: {str(e)}")
+                    objects[i]['error'] = str(e)
+
+    failed_item_ids = []
+    for i, obj in enumerate(objects):
+        if obj['error'] is not None:
+            results[i] = {'bucket': obj['bucket'], 'key': obj['key'], 'status': 'error', 'error': obj['error']}
+            if obj['item_id'] is not None and obj['item_id'] not in failed_item_ids:
+                failed_item_ids.append(obj['item_id'])
+
+    failed_count = sum(1 for result in results if result['status'] == 'error')
+
+    invocation_metrics = PipelineMetrics()
+    for metrics in object_metrics:
+        invocation_metrics.merge(metrics)
+    invocation_metrics.wall_seconds = time.perf_counter() - invocation_started
+    print(json.dumps({
+        'type': 'invocation_summary',
+        'objects': len(results),
+        'failed_count': failed_count,
+        **invocation_metrics.summary()
+    }, separators=(',', ':')))
+    if EMIT_METRICS:
+        emit_metric_documents([invocation_metrics.to_emf_document()])
+    if profiler is not None:
+        print(f"Profile (sampled invocation):\n{profiler.report()}")
+    if failed_count == 0:
+        status_code = 200
+    elif failed_count < len(results):
+        status_code = 207
+    else:
+        status_code = 500
+
+    return {
+        'statusCode': status_code,
+        'body': json.dumps({
+            'message': 'Successfully processed ALB logs' if failed_count == 0 else 'Processed ALB logs with failures',
+            'events_count': sum(result.get('events_count', 0) for result in results),
+            'failed_count': failed_count,
+            'objects': results
+        }),
+        'batchItemFailures': [{'itemIdentifier': item_id} for item_id in failed_item_ids]
+    }
+
+
+# 오프라인 백필 (CLI)
+# 로컬 디렉터리 또는 S3 bucket/prefix의 과거 ALB 로그를 프로세스 풀로 병렬 처리
+# 파일 단위로 독립 처리하므로 코어 수에 거의 선형으로 확장되며,
+# 완료된 파일은 체크포인트 파일에 기록되어 중단 후 재실행 시 건너뜀
+#
+#   python alb-log-processor.py --dir ./logs --sink ndjson --output-dir ./out --checkpoint backfill.ckpt
+#   python alb-log-processor.py --bucket my-alb-logs --prefix AWSLogs/ --sink cloudwatch --workers 8
+#   python alb-log-processor.py --dir ./logs --sink columnar --output-dir ./columnar
+#   python alb-log-processor.py --query ./columnar --service flash-api-order --since 2024-01-15T00:00:00
+
+BACKFILL_SINKS = ('cloudwatch', 'ndjson', 'columnar', 'stats')
+BACKFILL_SUFFIXES = ('.log.gz', '.gz')
+
+
+class BackfillCheckpoint:
+    """
+    완료된 소스(로컬 경로 또는 s3:// URI)를 한 줄씩 기록하는 추가 전용 체크포인트
+    기록마다 fsync하므로 강제 종료되어도 완료된 파일은 다시 처리하지 않음
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = set()
+        if path and os.path.exists(path):
+            with open(path, 'rb+') as f:
+                data = f.read()
+                # 마지막 줄이 잘린 채로 중단된 경우는 미완료로 간주하고 잘라냄 (이후 기록과 섞이지 않도록)
+                complete = data.rfind(b'\n') + 1
+                if complete < len(data):
+                    f.truncate(complete)
+            self.completed = set(data[:complete].decode('utf-8').splitlines())
+
+    def __contains__(self, source):
+        return source in self.completed
+
+    def mark_done(self, source):
+        self.completed.add(source)
+        if not self.path:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(source + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def list_local_sources(directory):
+    """
+    디렉터리 아래의 gzip ALB 로그 파일 경로를 정렬된 순서로 반환
+    """
+    sources = []
+    for root, _dirs, files in os.walk(directory):
+        for name in files:
+            if name.endswith(BACKFILL_SUFFIXES):
+                sources.append(os.path.join(root, name))
+    return sorted(sources)
+
+
+def list_s3_sources(bucket, prefix=''):
+    """
+    bucket/prefix 아래의 gzip ALB 로그 객체를 s3://bucket/key 형식으로 반환
+    """
+    sources = []
+    kwargs = {'Bucket': bucket, 'Prefix': prefix}
+    while True:
+        response = get_s3_client().list_objects_v2(**kwargs)
+        for obj in response.get('Contents', []):
+            if obj['Key'].endswith(BACKFILL_SUFFIXES):
+                sources.append(f"s3://{bucket}/{obj['Key']}")
+        if not response.get('IsTruncated'):
+            return sources
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+
+def _split_s3_uri(source):
+    bucket, _, key = source[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def backfill_output_paths(sources, output_dir):
+    """
+    소스별 NDJSON 출력 경로 (입력 디렉터리 구조를 출력 디렉터리 아래에 그대로 유지)
+    로컬 소스는 공통 상위 디렉터리 기준, S3 소스는 bucket/key 기준
+    """
+    local = [os.path.abspath(source) for source in sources if not source.startswith('s3://')]
+    root = os.path.commonpath([os.path.dirname(path) for path in local]) if local else None
+
+    paths = {}
+    for source in sources:
+        if source.startswith('s3://'):
+            relative = source[len('s3://'):]
+        else:
+            relative = os.path.relpath(os.path.abspath(source), root)
+        for suffix in BACKFILL_SUFFIXES:
+            if relative.endswith(suffix):
+                relative = relative[:-len(suffix)]
+                break
+        paths[source] = os.path.join(output_dir, relative + '.ndjson')
+    return paths
+
+
+def _init_backfill_worker():
+    """
+    프로세스 풀 워커 초기화: 부모에서 fork된 boto3 클라이언트의 커넥션을
+    공유하지 않도록 워커에서 처음 사용할 때 새로 생성
+    """
+    global s3, logs, object_index, _client_lock
+    s3 = None
+    logs = None
+    object_index = None
+    _client_lock = threading.Lock()
+    _cached_object_index.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_sampling_rules(path):
+    # 워커 프로세스마다 규칙 파일을 한 번만 읽고 컴파일
+    return load_sampling_rules(path)
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_object_index(spec):
+    # 워커 프로세스마다 인덱스 연결을 한 번만 생성
+    return open_object_index(spec)
+
+
+def backfill_object_identity(source):
+    """
+    백필 소스의 인덱스 키 (bucket, key, etag)
+    S3는 HeadObject의 ETag, 로컬 파일은 크기와 수정 시각으로 대신함
+    """
+    if source.startswith('s3://'):
+        bucket, key = _split_s3_uri(source)
+        return bucket, key, normalize_etag(get_s3_client().head_object(Bucket=bucket, Key=key)['ETag'])
+    stat = os.stat(source)
+    return '', os.path.abspath(source), f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def backfill_source(source, sink_name, output_path=None, profile=OUTPUT_PROFILE, sample_rate=None, rules_path=None,
+                    index_spec=None):
+    """
+    백필 워커: 소스 파일 하나를 처리하고 (통계, 집계) 튜플을 반환
+    집계(LatencyAggregator)는 부모 프로세스에서 병합하여 요약을 출력하는 데 사용
+    index_spec(DEDUP_INDEX 형식)이 있으면 cloudwatch 싱크는 완료된 소스를 건너뛰고 중단된 소스는 이어서 업로드
+    """
+    serialize = get_serializer(profile)
+    rules = _cached_sampling_rules(rules_path) if rules_path else None
+    progress = None
+    if index_spec and sink_name == 'cloudwatch':
+        index = _cached_object_index(index_spec)
+        bucket, key, etag = backfill_object_identity(source)
+        entry = index.get(bucket, key, etag)
+        if entry is not None and entry['status'] == 'done':
+            return {'parsed_count': 0, 'events_count': 0, 'skipped': True}, LatencyAggregator()
+        progress = ObjectProgress(index, bucket, key, etag, entry['offset'] if entry is not None else 0)
+
+    if sink_name == 'cloudwatch':
+        sink = make_log_events_sink(source, serialize, progress=progress)
+    elif sink_name == 'ndjson':
+        sink = NdjsonSink(output_path, serialize)
+    else:
+        sink = NullSink()
+    export = None
+    if sink_name == 'columnar':
+        # 샘플링 전의 전체 레코드를 저장, Lambda와 같은 파일 이름이 되도록 S3 소스는 bucket/key 기준으로 해시
+        export = ColumnarSink(output_path, source[len('s3://'):] if source.startswith('s3://') else source)
+
+    aggregator = LatencyAggregator()
+    if source.startswith('s3://'):
+        bucket, key = _split_s3_uri(source)
+        body = get_s3_client().get_object(Bucket=bucket, Key=key)['Body']
+        stats = process_log_lines(iter_gzip_lines(body), sink, aggregator, sample_rate, rules=rules, export=export)
+    else:
+        with open(source, 'rb') as body:
+            stats = process_log_lines(iter_gzip_lines(body), sink, aggregator, sample_rate, rules=rules,
+                                      export=export)
+    if progress is not None:
+        progress.complete(stats['events_count'])
+    return stats, aggregator
+
+
+def run_backfill(sources, sink_name, output_dir=None, checkpoint=None, workers=None,
+                 profile=OUTPUT_PROFILE, sample_rate=None, rules_path=None, executor_factory=None, index_spec=None):
+    """
+    체크포인트에 없는 소스만 프로세스 풀에서 처리
+    완료되는 순서대로 체크포인트에 기록하고, 실패한 소스는 기록하지 않아 다음 실행에서 재시도됨
+
+    반환값: processed/skipped/failed 소스 수, 라인/이벤트 합계, 병합된 LatencyAggregator
+    """
+    if checkpoint is None:
+        checkpoint = BackfillCheckpoint(None)
+    pending = [source for source in sources if source not in checkpoint]
+    summary = {
+        'processed': 0,
+        'skipped': len(sources) - len(pending),
+        'failed': [],
+        'parsed_count': 0,
+        'events_count': 0,
+        'exported_rows': 0,
+        'aggregator': LatencyAggregator()
+    }
+    if not pending:
+        return summary
+
+    if sink_name == 'ndjson':
+        output_paths = backfill_output_paths(sources, output_dir)
+    elif sink_name == 'columnar':
+        # 컬럼 파일은 파티션 경로 아래에 소스별 파일로 저장되므로 모든 소스가 같은 루트 사용
+        output_paths = dict.fromkeys(sources, output_dir)
+    else:
+        output_paths = {}
+    if executor_factory is None:
+        # multiprocessing import는 Lambda 경로에서 필요 없으므로 백필에서만 로드
+        from concurrent.futures import ProcessPoolExecutor as executor_factory
+    with executor_factory(max_workers=workers, initializer=_init_backfill_worker) as executor:
+        futures = {
+            executor.submit(
+                backfill_source, source, sink_name, output_paths.get(source), profile, sample_rate, rules_path,
+                index_spec
+            ): source
+            for source in pending
+        }
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                stats, aggregator = future.result()
+            except Exception as e:
+                print(f"Error processing {source}: {str(e)}", file=sys.stderr)
+                summary['failed'].append(source)
+                continue
+            checkpoint.mark_done(source)
+            summary['processed'] += 1
+            summary['parsed_count'] += stats['parsed_count']
+            summary['events_count'] += stats['events_count']
+            summary['exported_rows'] += stats.get('exported_rows', 0)
+            summary['aggregator'].merge(aggregator)
+            print(f"Backfilled {source}: {stats['parsed_count']} lines, {stats['events_count']} events", file=sys.stderr)
+
+    summary['failed'].sort()
+    return summary
+
+
+def format_backfill_summary(summary):
+    """
+    백필 결과를 서비스별 요청 수/에러 수/지연 분위수 표로 변환 (stdout 출력용)
+    """
+    lines = [
+        f"files: processed={summary['processed']} skipped={summary['skipped']} failed={len(summary['failed'])}",
+        f"lines: parsed={summary['parsed_count']} forwarded={summary['events_count']} "
+        f"exported={summary['exported_rows']}",
+        f"{'service':<28}{'requests':>10}{'5xx':>8}{'p50':>10}{'p95':>10}{'p99':>10}"
+    ]
+    for service, bucket in sorted(summary['aggregator'].by_service().items()):
+        p50, p95, p99 = bucket.quantiles([0.5, 0.95, 0.99])
+        lines.append(f"{service:<28}{bucket.count:>10}{bucket.error_count:>8}{p50:>10g}{p95:>10g}{p99:>10g}")
+    return '\n'.join(lines)
+
+
+def format_latency_query(results):
+    """
+    query_latency_percentiles 결과를 서비스별 표로 변환 (stdout 출력용)
+    """
+    lines = [f"{'service':<28}{'requests':>12}{'p50':>10}{'p95':>10}{'p99':>10}"]
+    for service, row in results.items():
+        lines.append(f"{service:<28}{row['count']:>12g}{row['p50']:>10g}{row['p95']:>10g}{row['p99']:>10g}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='ALB 액세스 로그 오프라인 백필')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dir', help='gzip ALB 로그가 있는 로컬 디렉터리')
+    source.add_argument('--bucket', help='ALB 로그 S3 버킷')
+    source.add_argument('--query', metavar='DIR', help='컬럼 파일 디렉터리에서 서비스별 지연 분위수 조회')
+    parser.add_argument('--prefix', default='', help='S3 키 prefix (--bucket과 함께 사용)')
+    parser.add_argument('--sink', choices=BACKFILL_SINKS, default='stats',
+                        help='cloudwatch: PutLogEvents 업로드, ndjson: 파일 저장, '
+                             'columnar: 분할 컬럼 파일 저장, stats: 집계 요약만 출력')
+    parser.add_argument('--output-dir', help='--sink ndjson/columnar 출력 디렉터리')
+    parser.add_argument('--checkpoint', help='완료된 소스를 기록할 체크포인트 파일 (재실행 시 이어서 처리)')
+    parser.add_argument('--workers', type=int, default=None, help='워커 프로세스 수 (기본: CPU 코어 수)')
+    parser.add_argument('--profile', choices=('full', 'compact', 'raw'), default=OUTPUT_PROFILE, help='출력 프로파일')
+    parser.add_argument('--sample-rate', type=float, default=1.0,
+                        help='샘플링 규칙 비율에 곱하는 전체 전송 비율 (집계는 항상 전체)')
+    parser.add_argument('--sampling-rules', default=SAMPLING_RULES_PATH, help='원본 이벤트 샘플링 규칙 파일')
+    parser.add_argument('--dedup-index', default=DEDUP_INDEX,
+                        help='--sink cloudwatch 처리 객체 인덱스 (예: sqlite:///tmp/backfill-index.db)')
+    parser.add_argument('--service', action='append', help='--query 대상 서비스 (여러 번 지정 가능, 기본: 전체)')
+    parser.add_argument('--since', help='--query 시작 시각 (UTC, YYYY-MM-DDTHH:MM:SS)')
+    parser.add_argument('--until', help='--query 종료 시각 (UTC, YYYY-MM-DDTHH:MM:SS)')
+    args = parser.parse_args(argv)
+
+    if args.query:
+        bounds = []
+        for option, value in (('--since', args.since), ('--until', args.until)):
+            seconds = _epoch_seconds(value) if value else None
+            if value and seconds is None:
+                parser.error(f"{option} must be YYYY-MM-DDTHH:MM:SS")
+            bounds.append(None if seconds is None else seconds * 1000)
+        results = query_latency_percentiles(args.query, args.service, *bounds)
+        print(format_latency_query(results))
+        return 0
+
+    if args.sink in ('ndjson', 'columnar') and not args.output_dir:
+        parser.error(f"--sink {args.sink} requires --output-dir")
+
+    sources = list_local_sources(args.dir) if args.dir else list_s3_sources(args.bucket, args.prefix)
+
+    summary = run_backfill(
+        sources, args.sink,
+        output_dir=args.output_dir,
+        checkpoint=BackfillCheckpoint(args.checkpoint),
+        workers=args.workers,
+        profile=args.profile,
+        sample_rate=args.sample_rate,
+        rules_path=args.sampling_rules,
+        index_spec=args.dedup_index
+    )
+    print(format_backfill_summary(summary))
+    for failed in summary['failed']:
+        print(f"failed: {failed}", file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
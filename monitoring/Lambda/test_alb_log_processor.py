@@ -1,7 +1,26 @@
+import contextlib
+import functools
+import gzip
+import hashlib
+import io
+import itertools
 import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
+import zlib
+import subprocess
 import sys
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from unittest import mock
+from urllib.parse import urlparse
+
+from botocore.exceptions import ClientError
 
 # Lambda 파일 동적 로드 (하이픈이 있어서 import 불가능하므로)
 import importlib.util
@@ -13,6 +32,179 @@ spec.loader.exec_module(alb_log_processor)
 parse_alb_log = alb_log_processor.parse_alb_log
 
 
+# 최적화 이전 parse_alb_log (c579610의 구현을 이름만 바꿔 그대로 복사, 결과 비교 기준)
+def legacy_parse_alb_log(line):
+    """
+    ALB Access Log 라인을 구조화된 JSON으로 파싱
+    상태 코드와 응답 시간을 별도 필드로 추출하여 CloudWatch Logs에서 필터링 가능하게 함
+    서비스 구분을 위해 request path를 파싱하여 service 필드 추가
+
+    ALB 로그 필드 인덱스 (0-based):
+    0: type (http/https/h2/wss)
+    1: time (ISO 8601 timestamp)
+    2: elb (ALB resource ID)
+    3: client:port
+    4: target:port
+    5: request_processing_time (초)
+    6: target_processing_time (초)
+    7: response_processing_time (초)
+    8: elb_status_code (상태 코드)
+    9: target_status_code (대상 상태 코드)
+    10-11: bytes_sent, user_agent (생략)
+    12: request ("GET /path HTTP/1.1" 형식)
+    """
+    try:
+        # 기본 필드 추출
+        parts = line.split(None, 2)
+        if len(parts) < 3:
+            return None
+
+        log_type = parts[0]
+        log_time = parts[1]
+        rest = parts[2]
+
+        # 타임스탬프 변환
+        try:
+            dt = datetime.fromisoformat(log_time.replace('Z', '+00:00'))
+            timestamp_ms = int(dt.timestamp() * 1000)
+        except:
+            timestamp_ms = int(time.time() * 1000)
+
+        # 상태 코드 및 응답 시간 추출
+        status_code = None
+        target_status_code = None
+        response_time = None
+        request_processing_time = None
+        target_processing_time = None
+        response_processing_time = None
+        service = "unknown"
+        request_path = None
+        http_method = None
+
+        try:
+            # 공백으로 구분된 필드들을 파싱
+            fields = line.split()
+
+            # 상태 코드 추출 (인덱스 8: elb_status_code)
+            if len(fields) > 8:
+                try:
+                    status_code = int(fields[8])
+                except (ValueError, IndexError):
+                    pass
+
+            # 대상 상태 코드 추출 (인덱스 9: target_status_code)
+            if len(fields) > 9:
+                try:
+                    target_status_code = int(fields[9])
+                except (ValueError, IndexError):
+                    pass
+
+            # 응답 시간 추출 (총 응답 시간 = 모든 처리 단계의 합)
+            # 인덱스 5, 6, 7: 각 처리 단계의 시간 (초 단위)
+            if len(fields) > 7:
+                try:
+                    request_time = float(fields[5])          # 요청 처리 시간
+                    target_time = float(fields[6])           # 대상 처리 시간
+                    response_time_seconds = float(fields[7]) # 응답 처리 시간
+
+                    # -1은 타겟에 연결되지 않은 요청 (크롤러, 404 등)을 의미함
+                    # 이 경우 응답 시간은 null로 설정
+                    if request_time == -1 or target_time == -1 or response_time_seconds == -1:
+                        response_time = None
+                    else:
+                        # 총 응답 시간을 밀리초로 변환 (정수로 반올림하여 부동소수점 오차 제거)
+                        response_time = round((request_time + target_time + response_time_seconds) * 1000)
+
+                        # 각 단계별 시간도 저장 (상세 분석용)
+                        request_processing_time = round(request_time * 1000)
+                        target_processing_time = round(target_time * 1000)
+                        response_processing_time = round(response_time_seconds * 1000)
+                except (ValueError, IndexError):
+                    pass
+
+            # 요청 경로에서 서비스 구분
+            # ALB 로그의 request 필드는 따옴표로 감싸져 있음
+            # 예시: "GET https://gateway.highgarden.cloud:443/queue/status HTTP/1.1"
+            # 또는: "GET /orders HTTP/1.1"
+            # 정규표현식으로 직접 추출 (user-agent에 공백이 있어서 split 위치가 가변적)
+            try:
+                # 따옴표로 감싸진 request 필드 전체 추출
+                import re as regex
+                request_match = regex.search(r'"((?:GET|POST|PUT|DELETE|PATCH|HEAD|OPTIONS)\s+[^\s]+\s+HTTP[^"]*)"', line)
+                if request_match:
+                    request_line = request_match.group(1)  # 예: "GET https://gateway.highgarden.cloud:443/queue/status HTTP/1.1"
+
+                    # 메서드와 경로를 공백으로 분리 (처음 2개만 관심)
+                    parts = request_line.split(None, 2)  # [메서드, 경로, HTTP버전...]
+                    if len(parts) >= 2:
+                        http_method = parts[0]  # GET, POST, etc.
+                        raw_path = parts[1]     # /orders 또는 https://gateway.highgarden.cloud:443/queue/status
+
+                        # URL 형식이면 경로만 추출
+                        if raw_path.startswith('http://') or raw_path.startswith('https://'):
+                            # https://gateway.highgarden.cloud:443/queue/status?query=param → /queue/status
+                            parsed_url = urlparse(raw_path)
+                            request_path = parsed_url.path if parsed_url.path else '/'
+                        else:
+                            # /queue/status?query=param → /queue/status
+                            request_path = raw_path.split('?')[0] if '?' in raw_path else raw_path
+
+                        # 경로 기반 서비스 구분 로직
+                        # API 도메인에서 오는 요청 (api.highgarden.cloud)
+                        # 실제 요청 경로: /payments, /orders, /events 등 (프리픽스 없음)
+                        if 'payment' in request_path or 'pay' in request_path:
+                            service = "flash-api-payment"
+                        elif 'order' in request_path:
+                            service = "flash-api-order"
+                        elif request_path.startswith('/api/'):
+                            # /api/* 형식의 API 엔드포인트
+                            if 'payment' in request_path or 'pay' in request_path:
+                                service = "flash-api-payment"
+                            elif 'order' in request_path:
+                                service = "flash-api-order"
+                            else:
+                                service = "flash-api"
+                        elif request_path.startswith('/events'):
+                            # /events는 API 서비스
+                            service = "flash-api"
+                        elif request_path.startswith('/queue'):
+                            service = "flash-gateway-queue"
+                        elif request_path.startswith('/orders'):
+                            service = "flash-gateway-orders"
+                        elif request_path.startswith('/products'):
+                            service = "flash-gateway-products"
+                        elif request_path.startswith('/'):
+                            service = "flash-gateway"
+                        else:
+                            service = "unknown"
+            except (ValueError, IndexError):
+                pass
+        except:
+            pass
+
+        # 구조화된 JSON 저장
+        parsed = {
+            'type': log_type,
+            'time': log_time,
+            'status_code': status_code,
+            'target_status_code': target_status_code,
+            'response_time_ms': response_time,  # 총 응답 시간 (밀리초)
+            'request_processing_time_ms': request_processing_time,
+            'target_processing_time_ms': target_processing_time,
+            'response_processing_time_ms': response_processing_time,
+            'service': service,  # 서비스 구분 필드 (flash-gateway, flash-api, etc.)
+            'request_path': request_path,  # 요청 경로
+            'http_method': http_method,  # HTTP 메서드 (GET, POST, etc.)
+            'raw_message': line,
+            'timestamp_ms': timestamp_ms
+        }
+
+        return parsed
+    except Exception as e:
+        print(f"Error parsing log line: {str(e)}")
+        return None
+
+
 class TestALBLogProcessor(unittest.TestCase):
     """
     ALB 로그 파서 테스트
@@ -71,7 +263,7 @@ class TestALBLogProcessor(unittest.TestCase):
         parsed = parse_alb_log(self.ALB_LOG_PAY)
 
         self.assertIsNotNone(parsed)
-        self.assertEqual(parsed['service'], 'flash-api-payment')  # /api/pay 경로도 payment로 인식 (pay 포함)
+        self.assertEqual(parsed['service'], 'flash-api-payment')  # /api/pay 라우트도 payment로 인식 (route-table.json)
         self.assertEqual(parsed['request_path'], '/api/pay')
         self.assertEqual(parsed['http_method'], 'POST')
         self.assertEqual(parsed['status_code'], 200)
@@ -136,6 +328,2210 @@ class TestALBLogProcessor(unittest.TestCase):
         print("=" * 60)
 
 
+
+class FakeStreamingBody:
+    """S3 get_object()['Body']처럼 read(n)만 지원하는 스트림"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def read(self, size=-1):
+        return self.fileobj.read(size)
+
+
+class FakeS3Client:
+    """로컬 파일을 S3 객체처럼 제공하는 스텁 (없는 키는 NoSuchKey)"""
+
+    def __init__(self, objects, delay=0.0):
+        self.objects = objects  # {(bucket, key): path}
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.get_calls = 0
+        self.lock = threading.Lock()
+
+    def get_object(self, Bucket, Key):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            if (Bucket, Key) not in self.objects:
+                raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'Not Found'}}, 'GetObject')
+            self.get_calls += 1
+            path = self.objects[(Bucket, Key)]
+            return {'Body': FakeStreamingBody(open(path, 'rb')), 'ETag': self.etag(path)}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def head_object(self, Bucket, Key):
+        return {'ETag': self.etag(self.objects[(Bucket, Key)])}
+
+    @staticmethod
+    def etag(path):
+        with open(path, 'rb') as f:
+            return f'"{hashlib.md5(f.read()).hexdigest()}"'
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None, page_size=2):
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + page_size]
+        response = {'Contents': [{'Key': key} for key in page], 'IsTruncated': start + page_size < len(keys)}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + page_size)
+        return response
+
+
+class FakeLogsClient:
+    """
+    CloudWatch Logs 스텁
+    실제 PutLogEvents 제한(이벤트 수, 바이트, 24시간 범위, 시간순 정렬)을 검사하고
+    업로드된 이벤트 수만 세고 메시지는 버림
+    throttle_calls 만큼 처음 호출은 ThrottlingException으로 실패시킴
+    """
+
+    class exceptions:
+        class ResourceAlreadyExistsException(Exception):
+            pass
+
+    def __init__(self, throttle_calls=0, fail_code=None, delay=0.0):
+        self.events_count = 0
+        self.batch_sizes = []
+        self.calls = 0
+        self.throttle_calls = throttle_calls
+        self.fail_code = fail_code
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.created_streams = []
+        self.events_by_stream = {}
+
+    def create_log_stream(self, logGroupName, logStreamName):
+        self.created_streams.append(logStreamName)
+
+    def put_log_events(self, logGroupName, logStreamName, logEvents):
+        with self.lock:
+            self.calls += 1
+            throttled = self.calls <= self.throttle_calls
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            if throttled:
+                raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'PutLogEvents')
+            if self.fail_code:
+                raise ClientError({'Error': {'Code': self.fail_code, 'Message': 'failed'}}, 'PutLogEvents')
+
+            timestamps = [e['timestamp'] for e in logEvents]
+            assert timestamps == sorted(timestamps), 'log events must be in chronological order'
+            assert 0 < len(logEvents) <= 10000, f'too many log events: {len(logEvents)}'
+            batch_bytes = sum(len(e['message'].encode('utf-8')) + 26 for e in logEvents)
+            assert batch_bytes <= 1048576, f'batch too large: {batch_bytes}'
+            assert timestamps[-1] - timestamps[0] <= 24 * 60 * 60 * 1000, 'batch spans more than 24 hours'
+
+            with self.lock:
+                self.events_count += len(logEvents)
+                self.batch_sizes.append(len(logEvents))
+                self.events_by_stream[logStreamName] = self.events_by_stream.get(logStreamName, 0) + len(logEvents)
+            return {'nextSequenceToken': str(self.calls)}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class RecordingSink(alb_log_processor.NullSink):
+    """직렬화된 메시지를 메모리에 모으는 싱크"""
+
+    def __init__(self, serialize):
+        self.serialize = serialize
+        self.messages = []
+
+    def write(self, parsed, message):
+        self.messages.append(message)
+
+    def close(self):
+        return {'uploaded_events': len(self.messages), 'batches': 0, 'rejected_events': 0}
+
+
+def s3_record(bucket, key):
+    return {'s3': {'bucket': {'name': bucket}, 'object': {'key': key}}}
+
+
+def s3_event(bucket, key):
+    return {'Records': [s3_record(bucket, key)]}
+
+
+def make_alb_line(path='/api/orders/123', method='GET', status=200, target_time=0.089, hour=10, second=45,
+                  trace='Root=1-6549c8b7-ijkl9012mn345678'):
+    """
+    ALB_LOG_API_ORDER에서 요청/상태 코드/대상 처리 시간(초)/응답 시각/트레이스 ID만 바꾼 ALB 로그 라인
+    target_time이 None이면 target에 도달하지 않은 요청 (처리 시간 -1, 대상 상태 코드 -)
+    """
+    line = (TestALBLogProcessor.ALB_LOG_API_ORDER
+            .replace('"GET /api/orders/123 HTTP/1.1"', f'"{method} {path} HTTP/1.1"')
+            .replace('2025-11-07T10:30:45.', f'2025-11-07T{hour:02d}:30:{second:02d}.', 1)
+            .replace('"Root=1-6549c8b7-ijkl9012mn345678"', f'"{trace}"'))
+    if target_time is None:
+        return line.replace(' 0.000 0.089 0.000 200 200 ', f' -1 -1 -1 {status} - ')
+    return line.replace(' 0.000 0.089 0.000 200 200 ', f' 0.000 {target_time:.3f} 0.000 {status} {status} ')
+
+
+def invoke_handler(event, fake_s3, fake_logs=None, **patches):
+    """
+    스텁 S3/Logs 클라이언트와 모듈 설정 패치(patches)를 적용하고 lambda_handler 호출
+    반환: (핸들러 응답, JSON 본문)
+    """
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch.object(alb_log_processor, 's3', fake_s3))
+        stack.enter_context(mock.patch.object(alb_log_processor, 'logs', fake_logs or FakeLogsClient()))
+        for name, value in patches.items():
+            stack.enter_context(mock.patch.object(alb_log_processor, name, value))
+        result = alb_log_processor.lambda_handler(event, None)
+    return result, json.loads(result['body'])
+
+
+class TestStreamingPipeline(unittest.TestCase):
+    """
+    S3 객체 스트리밍 처리 테스트
+    gzip 해제와 라인 파싱이 청크 단위로 진행되어 메모리 사용량이 일정한지 검증
+    """
+
+    def write_gzip(self, path, lines):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line + '\n')
+
+    def test_iter_gzip_lines_matches_full_decompression(self):
+        """작은 청크로 읽어도 전체 해제 결과와 동일한 라인을 반환"""
+        lines = [TestALBLogProcessor.ALB_LOG_GATEWAY, '', '# comment', '한글 라인 ✅'] * 50
+        data = gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'))
+
+        result = list(alb_log_processor.iter_gzip_lines(io.BytesIO(data), chunk_size=7))
+        self.assertEqual(result, lines)
+
+    def test_iter_gzip_lines_multi_member(self):
+        """여러 gzip 멤버가 이어 붙은 파일 처리"""
+        data = gzip.compress(b'first\nsecond\n') + gzip.compress(b'third\n')
+        result = list(alb_log_processor.iter_gzip_lines(io.BytesIO(data), chunk_size=5))
+        self.assertEqual(result, ['first', 'second', 'third'])
+
+    def test_iter_gzip_lines_truncated(self):
+        """중간에 잘린 gzip 파일은 에러"""
+        data = gzip.compress(b'first\nsecond\n' * 100)[:-20]
+        with self.assertRaises(EOFError):
+            list(alb_log_processor.iter_gzip_lines(io.BytesIO(data)))
+
+    def measure_handler_peak(self, line_count):
+        lines = (
+            TestALBLogProcessor.ALB_LOG_API_ORDER.replace('/api/orders/123', f'/api/orders/{i}')
+            for i in range(line_count)
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'large.log.gz')
+            self.write_gzip(path, lines)
+            with gzip.open(path, 'rb') as f:
+                uncompressed_size = sum(len(chunk) for chunk in iter(lambda: f.read(1024 * 1024), b''))
+
+            fake_logs = FakeLogsClient()
+            fake_s3 = FakeS3Client({('alb-bucket', 'alb/large.log.gz'): path})
+
+            tracemalloc.start()
+            try:
+                result, body = invoke_handler(s3_event('alb-bucket', 'alb/large.log.gz'), fake_s3, fake_logs)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        self.assertEqual(result['statusCode'], 200)
+        self.assertEqual(body['events_count'], line_count)
+        self.assertEqual(fake_logs.events_count, line_count)
+        return uncompressed_size, peak
+
+    def test_large_object_peak_memory_is_flat(self):
+        """대용량 .gz 파일 처리 시 최대 메모리가 파일 크기와 무관하게 일정"""
+        small_size, small_peak = self.measure_handler_peak(8000)
+        large_size, large_peak = self.measure_handler_peak(32000)
+
+        print(f"\n📦 {small_size / 1e6:.1f}MB → peak {small_peak / 1e6:.1f}MB, "
+              f"{large_size / 1e6:.1f}MB → peak {large_peak / 1e6:.1f}MB")
+
+        # 파일이 4배 커져도 최대 메모리는 거의 그대로 (청크 + 배치 크기 수준)
+        self.assertGreater(large_size, 20 * 1024 * 1024)
+        self.assertLess(large_peak, small_peak * 1.5)
+        self.assertLess(large_peak, large_size / 2)
+
+
+
+class TestLogEventsUploader(unittest.TestCase):
+    """
+    PutLogEvents 배치 업로더 테스트
+    스텁 클라이언트가 실제 제한을 검사하므로 제한을 넘는 배치는 실패함
+    """
+
+    BASE_TS = 1762511445123  # 2025-11-07T10:30:45.123Z
+
+    def upload(self, client, events, max_workers=4):
+        with mock.patch.object(alb_log_processor, 'UPLOAD_BACKOFF_BASE', 0.001):
+            with alb_log_processor.LogEventsUploader(client, 'group', 'stream', max_workers=max_workers) as uploader:
+                for event in events:
+                    uploader.add(event)
+                return uploader.close()
+
+    def test_splits_by_event_count(self):
+        """10,000개 초과 이벤트는 여러 배치로 분할"""
+        client = FakeLogsClient()
+        stats = self.upload(client, ({'timestamp': self.BASE_TS + i, 'message': 'x'} for i in range(25000)))
+
+        self.assertEqual(stats['uploaded_events'], 25000)
+        self.assertEqual(client.events_count, 25000)
+        self.assertEqual(sorted(client.batch_sizes), [5000, 10000, 10000])
+
+    def test_splits_by_batch_bytes(self):
+        """이벤트당 오버헤드를 포함한 1MB 제한에 맞춰 분할 (멀티바이트 문자 포함)"""
+        client = FakeLogsClient()
+        message = '가' * 1000  # UTF-8로 3000 바이트
+        stats = self.upload(client, ({'timestamp': self.BASE_TS, 'message': message} for _ in range(2000)))
+
+        self.assertEqual(client.events_count, 2000)
+        self.assertEqual(stats['batches'], 6)  # 1048576 // (3000 + 26) = 346개씩
+        self.assertEqual(max(client.batch_sizes), 1048576 // 3026)
+
+    def test_splits_by_24_hour_span(self):
+        """24시간을 넘는 타임스탬프 범위는 같은 배치에 넣지 않음"""
+        client = FakeLogsClient()
+        hour = 60 * 60 * 1000
+        events = [{'timestamp': self.BASE_TS + i * hour, 'message': 'x'} for i in range(72)]
+        stats = self.upload(client, events)
+
+        self.assertEqual(client.events_count, 72)
+        self.assertEqual(stats['batches'], 3)
+
+    def test_unsorted_events_are_sorted_per_batch(self):
+        """배치 내부는 시간순으로 정렬하여 전송"""
+        client = FakeLogsClient()
+        events = [{'timestamp': self.BASE_TS + (i * 7919) % 1000, 'message': 'x'} for i in range(1000)]
+        self.upload(client, events)
+        self.assertEqual(client.events_count, 1000)
+
+    def test_retries_throttling(self):
+        """ThrottlingException은 백오프 후 재시도하여 모두 전송"""
+        client = FakeLogsClient(throttle_calls=3)
+        stats = self.upload(client, ({'timestamp': self.BASE_TS, 'message': 'x'} for _ in range(100)), max_workers=1)
+
+        self.assertEqual(client.events_count, 100)
+        self.assertEqual(stats['retries'], 3)
+
+    def test_retries_invalid_sequence_token_until_limit(self):
+        """재시도 가능한 에러가 계속되면 재시도 횟수 제한 후 실패 보고"""
+        client = FakeLogsClient(fail_code='InvalidSequenceTokenException')
+        with self.assertRaises(RuntimeError) as ctx:
+            self.upload(client, [{'timestamp': self.BASE_TS, 'message': 'x'}])
+        self.assertIn('InvalidSequenceTokenException', str(ctx.exception))
+        self.assertEqual(client.calls, alb_log_processor.UPLOAD_MAX_RETRIES + 1)
+
+    def test_retries_transient_connection_and_server_errors(self):
+        """botocore 재시도를 끈 logs 클라이언트 대신 연결 에러와 5xx 응답도 직접 재시도"""
+        from botocore.exceptions import EndpointConnectionError, ReadTimeoutError
+
+        client = FakeLogsClient()
+        put_log_events = client.put_log_events
+        errors = [
+            EndpointConnectionError(endpoint_url='https://logs.ap-northeast-2.amazonaws.com'),
+            ReadTimeoutError(endpoint_url='https://logs.ap-northeast-2.amazonaws.com'),
+            ClientError({'Error': {'Code': 'InternalFailure', 'Message': 'failed'},
+                         'ResponseMetadata': {'HTTPStatusCode': 500}}, 'PutLogEvents'),
+        ]
+
+        def flaky_put_log_events(**kwargs):
+            if errors:
+                raise errors.pop(0)
+            return put_log_events(**kwargs)
+
+        client.put_log_events = flaky_put_log_events
+        stats = self.upload(client, [{'timestamp': self.BASE_TS, 'message': 'x'}])
+
+        self.assertEqual(client.events_count, 1)
+        self.assertEqual(stats['retries'], 3)
+
+    def test_non_retryable_error_fails_without_retry(self):
+        """재시도 불가능한 에러는 바로 실패"""
+        client = FakeLogsClient(fail_code='ResourceNotFoundException')
+        with self.assertRaises(RuntimeError):
+            self.upload(client, [{'timestamp': self.BASE_TS, 'message': 'x'}])
+        self.assertEqual(client.calls, 1)
+
+    def test_uploads_batches_concurrently(self):
+        """여러 배치를 스레드 풀로 동시에 업로드"""
+        client = FakeLogsClient(delay=0.05)
+        self.upload(client, ({'timestamp': self.BASE_TS, 'message': 'x'} for _ in range(80000)), max_workers=4)
+
+        self.assertEqual(client.events_count, 80000)
+        self.assertGreater(client.max_active, 1)
+        self.assertLessEqual(client.max_active, 4)
+
+    def test_handler_reports_rejected_and_failed_uploads(self):
+        """업로드가 최종 실패하면 핸들러는 500 반환"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'a.log.gz')
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                f.write(TestALBLogProcessor.ALB_LOG_GATEWAY + '\n')
+
+            fake_s3 = FakeS3Client({('alb-bucket', 'alb/a.log.gz'): path})
+            fake_logs = FakeLogsClient(fail_code='AccessDeniedException')
+            result, body = invoke_handler(s3_event('alb-bucket', 'alb/a.log.gz'), fake_s3, fake_logs)
+
+        self.assertEqual(result['statusCode'], 500)
+        self.assertIn('AccessDeniedException', body['objects'][0]['error'])
+
+
+
+class TestAlbLogTokenizer(unittest.TestCase):
+    """
+    ALB 로그 토크나이저 테스트
+    따옴표 안의 공백을 보존하면서 문서에 정의된 필드로 분리하는지 검증
+    """
+
+    # 실제 ALB 포맷 (user agent에 공백, 대상 목록, 에러 사유 포함)
+    ALB_LOG_FULL = (
+        'h2 2025-11-07T10:30:45.123456Z app/flash-ticket-alb/1234567890abcdef 203.0.113.9:40123 10.0.1.100:3000 '
+        '0.001 0.250 0.002 502 - 512 1024 '
+        '"POST https://api.highgarden.cloud:443/api/orders/9f1c?retry=1 HTTP/2.0" '
+        '"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15" '
+        'ECDHE-RSA-AES128-GCM-SHA256 TLSv1.2 '
+        'arn:aws:elasticloadbalancing:ap-northeast-2:339712948064:targetgroup/flash-api/efgh5678 '
+        '"Root=1-6549c8b7-abcd1234ef567890" "api.highgarden.cloud" '
+        '"arn:aws:acm:ap-northeast-2:339712948064:certificate/12345678" 1 2025-11-07T10:30:44.870000Z '
+        '"waf,forward" "-" "TargetResponseError" "10.0.1.100:3000 10.0.1.101:3000" "502 -" "-" "-" TID_abc123'
+    )
+
+    def test_tokenize_full_line(self):
+        """30개 필드로 분리하고 따옴표 안의 공백은 보존"""
+        tokens = alb_log_processor.tokenize_alb_log(self.ALB_LOG_FULL)
+
+        self.assertEqual(len(tokens), alb_log_processor.ALB_LOG_FIELD_COUNT)
+        self.assertEqual(tokens[12], 'POST https://api.highgarden.cloud:443/api/orders/9f1c?retry=1 HTTP/2.0')
+        self.assertEqual(tokens[13], 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15')
+        self.assertEqual(tokens[17], 'Root=1-6549c8b7-abcd1234ef567890')
+        self.assertEqual(tokens[25], '10.0.1.100:3000 10.0.1.101:3000')
+        self.assertEqual(tokens[29], 'TID_abc123')
+
+    def test_tokenize_stops_at_max_fields(self):
+        """필요한 필드까지만 분리"""
+        tokens = alb_log_processor.tokenize_alb_log(self.ALB_LOG_FULL, 13)
+        self.assertEqual(len(tokens), 13)
+        self.assertEqual(tokens[8], '502')
+        self.assertTrue(tokens[12].startswith('POST '))
+
+    def test_tokenize_escaped_quotes(self):
+        """user agent 안의 이스케이프된 따옴표 처리"""
+        line = self.ALB_LOG_FULL.replace('AppleWebKit/605.1.15', 'AppleWebKit \\"quoted\\" 605')
+        tokens = alb_log_processor.tokenize_alb_log(line)
+
+        self.assertEqual(len(tokens), alb_log_processor.ALB_LOG_FIELD_COUNT)
+        self.assertEqual(tokens[13], 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit \\"quoted\\" 605')
+        self.assertEqual(tokens[17], 'Root=1-6549c8b7-abcd1234ef567890')
+
+    def test_parse_alb_record_typed_fields(self):
+        """전체 필드를 타입 변환된 값으로 제공"""
+        record = alb_log_processor.parse_alb_record(self.ALB_LOG_FULL)
+
+        self.assertEqual(record.type, 'h2')
+        self.assertEqual(record.client_ip, '203.0.113.9')
+        self.assertEqual(record.client_port, 40123)
+        self.assertEqual(record.target_port, 3000)
+        self.assertEqual(record.target_processing_time, 0.25)
+        self.assertEqual(record.elb_status_code, 502)
+        self.assertIsNone(record.target_status_code)
+        self.assertEqual(record.received_bytes, 512)
+        self.assertEqual(record.sent_bytes, 1024)
+        self.assertEqual(record.http_method, 'POST')
+        self.assertEqual(record.http_version, 'HTTP/2.0')
+        self.assertEqual(record.ssl_protocol, 'TLSv1.2')
+        self.assertTrue(record.target_group_arn.endswith('targetgroup/flash-api/efgh5678'))
+        self.assertEqual(record.trace_id, 'Root=1-6549c8b7-abcd1234ef567890')
+        self.assertEqual(record.domain_name, 'api.highgarden.cloud')
+        self.assertEqual(record.matched_rule_priority, 1)
+        self.assertEqual(record.actions_executed, ('waf', 'forward'))
+        self.assertIsNone(record.redirect_url)
+        self.assertEqual(record.error_reason, 'TargetResponseError')
+        self.assertEqual(record.target_port_list, ('10.0.1.100:3000', '10.0.1.101:3000'))
+        self.assertEqual(record.conn_trace_id, 'TID_abc123')
+
+    def test_parse_alb_record_short_line(self):
+        """필드가 부족한 구버전 포맷은 없는 필드를 None으로 채움"""
+        line = ' '.join(self.ALB_LOG_FULL.split(' ')[:12])
+        record = alb_log_processor.parse_alb_record(line)
+
+        self.assertEqual(record.elb_status_code, 502)
+        self.assertIsNone(record.http_method)
+        self.assertIsNone(record.trace_id)
+        self.assertEqual(record.actions_executed, ())
+
+    def test_parse_absolute_url_and_query(self):
+        """절대 URL과 쿼리 스트링에서 경로만 추출"""
+        parsed = parse_alb_log(self.ALB_LOG_FULL)
+
+        self.assertEqual(parsed['request_path'], '/api/orders/9f1c')
+        self.assertEqual(parsed['http_method'], 'POST')
+        self.assertEqual(parsed['status_code'], 502)
+        self.assertIsNone(parsed['target_status_code'])
+        self.assertEqual(parsed['response_time_ms'], 253)
+
+    def test_parse_matches_legacy(self):
+        """샘플 라인에서 기존 구현과 같은 상태 코드/응답 시간/경로/메서드/타임스탬프를 추출
+        (속도 비교는 alb-log-benchmark.py의 parse 항목)"""
+        lines = [
+            TestALBLogProcessor.ALB_LOG_GATEWAY,
+            TestALBLogProcessor.ALB_LOG_API_PAYMENT,
+            TestALBLogProcessor.ALB_LOG_API_ORDER,
+            TestALBLogProcessor.ALB_LOG_PAY,
+            TestALBLogProcessor.ALB_LOG_GATEWAY_PRODUCTS,
+            self.ALB_LOG_FULL,
+        ]
+        for line in lines:
+            legacy_parsed = legacy_parse_alb_log(line)
+            parsed = parse_alb_log(line)
+            for key in ('status_code', 'target_status_code', 'response_time_ms', 'request_path', 'http_method',
+                        'timestamp_ms'):
+                self.assertEqual(parsed[key], legacy_parsed[key], key)
+
+            record = alb_log_processor.parse_alb_record(line)
+            self.assertEqual(record.elb_status_code, legacy_parsed['status_code'])
+            self.assertEqual(record.http_method, legacy_parsed['http_method'])
+
+
+class TestRouteTable(unittest.TestCase):
+    """
+    라우트 테이블 기반 서비스 분류 테스트
+    세그먼트 단위 최장 prefix 매칭과 ID 정규화, 캐시 동작 검증
+    """
+
+    def test_default_table_matches_json(self):
+        """코드의 기본 테이블과 route-table.json 내용이 동일"""
+        with open('route-table.json', encoding='utf-8') as f:
+            config = json.load(f)
+        config.pop('Description')
+        self.assertEqual(config, alb_log_processor.DEFAULT_ROUTE_TABLE)
+
+    def test_longest_segment_prefix(self):
+        """부분 문자열이 아닌 세그먼트 단위로 가장 긴 prefix 매칭"""
+        table = alb_log_processor.RouteTable(alb_log_processor.DEFAULT_ROUTE_TABLE)
+        cases = [
+            ('/api/payments', 'flash-api-payment', '/api/payments'),
+            ('/api/pay', 'flash-api-payment', '/api/pay'),
+            ('/api/payment-methods', 'flash-api', '/api/payment-methods'),
+            ('/api/events/7/orders', 'flash-api', '/api/events/{id}/orders'),
+            ('/orders', 'flash-gateway-orders', '/orders'),
+            ('/orders/', 'flash-gateway-orders', '/orders'),
+            ('/display', 'flash-gateway', '/*'),
+            ('/reorder-tips', 'flash-gateway', '/*'),
+            ('/queue/status', 'flash-gateway-queue', '/queue/status'),
+            ('/', 'flash-gateway', '/'),
+        ]
+        for path, service, route in cases:
+            self.assertEqual(table.classify(path), (service, route), path)
+
+    def test_id_segments_normalized(self):
+        """숫자, UUID, 긴 해시 세그먼트는 {id}로 정규화"""
+        table = alb_log_processor.RouteTable(alb_log_processor.DEFAULT_ROUTE_TABLE)
+        self.assertEqual(table.classify('/api/orders/123'), ('flash-api-order', '/api/orders/{id}'))
+        self.assertEqual(
+            table.classify('/events/3fa85f64-5717-4562-b3fc-2c963f66afa6/orders'),
+            ('flash-api', '/events/{id}/orders')
+        )
+        self.assertEqual(table.classify('/payments/65a1f0c2e4b0a1b2c3d4e5f6/complete'),
+                         ('flash-api-payment', '/payments/{id}/complete'))
+        self.assertEqual(table.classify('/queue/status'), ('flash-gateway-queue', '/queue/status'))
+
+    def test_prefix_with_id_placeholder(self):
+        """설정의 Prefix에 {id}를 쓸 수 있음"""
+        table = alb_log_processor.RouteTable({
+            'DefaultService': 'other',
+            'IdSegmentPatterns': ['^[0-9]+$'],
+            'Routes': [
+                {'Prefix': '/events/{id}/orders', 'Service': 'event-orders'},
+                {'Prefix': '/events', 'Service': 'events'},
+            ],
+        })
+        self.assertEqual(table.classify('/events/42/orders/9'), ('event-orders', '/events/{id}/orders/{id}'))
+        self.assertEqual(table.classify('/events/42'), ('events', '/events/{id}'))
+        self.assertEqual(table.classify('/users'), ('other', '/*'))
+
+    def test_metric_route_is_bounded(self):
+        """집계 메트릭 라우트는 설정된 템플릿만 유지하고 나머지는 <prefix>/*로 합침"""
+        table = alb_log_processor.RouteTable(alb_log_processor.DEFAULT_ROUTE_TABLE)
+        cases = [
+            ('/api/.env', '/api/*'),
+            ('/api/wp-admin/setup.php', '/api/*'),
+            ('/api/orders/{id}', '/api/orders/{id}'),
+            ('/api/orders/{id}/cancel', '/api/orders/*'),
+            ('/queue/status', '/queue/status'),
+            ('/queue', '/queue'),
+            ('/events/{id}/orders', '/events/*'),
+            ('/*', '/*'),
+            ('/', '/'),
+        ]
+        for route, metric_route in cases:
+            self.assertEqual(table.metric_route(route), metric_route, route)
+
+        # 스캐너가 임의 경로를 보내도 Route 값의 개수는 설정 크기 이내
+        routes = {table.metric_route(table.classify(f'/api/scan-{i}/x.php')[1]) for i in range(1000)}
+        self.assertEqual(routes, {'/api/*'})
+
+        # MetricRoutes가 없는 테이블은 prefix 단위로만 집계
+        table = alb_log_processor.RouteTable({'Routes': [{'Prefix': '/a', 'Service': 'svc-a'}]})
+        self.assertEqual(table.metric_route('/a/b/c'), '/a/*')
+        self.assertEqual(table.metric_route('/b'), '/*')
+
+    def test_load_route_table_from_json(self):
+        """JSON 파일에서 로드하고, 파일이 없으면 기본 테이블 사용"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'routes.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'DefaultService': 'x', 'Routes': [{'Prefix': '/a', 'Service': 'svc-a'}]}, f)
+
+            table = alb_log_processor.load_route_table(path)
+            self.assertEqual(table.classify('/a/b'), ('svc-a', '/a/b'))
+            self.assertEqual(table.classify('/b'), ('x', '/*'))
+
+            fallback = alb_log_processor.load_route_table(os.path.join(tmp, 'missing.json'))
+            self.assertEqual(fallback.classify('/api/orders/1'), ('flash-api-order', '/api/orders/{id}'))
+
+    def test_classification_is_cached(self):
+        """같은 경로는 캐시에서 바로 반환"""
+        table = alb_log_processor.RouteTable(alb_log_processor.DEFAULT_ROUTE_TABLE, cache_size=2)
+        for _ in range(100):
+            table.classify('/queue/status')
+        info = table.classify.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 99)
+
+        # 캐시 크기는 제한됨
+        for i in range(10):
+            table.classify(f'/orders/{i}')
+        self.assertEqual(table.classify.cache_info().currsize, 2)
+
+    def test_parsed_event_has_route(self):
+        """파싱 결과에 라우트 템플릿 포함"""
+        parsed = parse_alb_log(TestALBLogProcessor.ALB_LOG_API_ORDER)
+        self.assertEqual(parsed['route'], '/api/orders/{id}')
+
+
+
+class TestMultiRecordEvents(unittest.TestCase):
+    """
+    이벤트의 모든 레코드 처리 테스트
+    여러 객체를 동시에 처리하고 객체별 결과와 부분 실패를 보고하는지 검증
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.paths = {}
+        for name, count in (('a', 3), ('b', 5), ('c', 7), ('d e', 2)):
+            path = os.path.join(self.tmp.name, f'{name}.log.gz')
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                for _ in range(count):
+                    f.write(TestALBLogProcessor.ALB_LOG_GATEWAY + '\n')
+            self.paths[('alb-bucket', f'alb/{name}.log.gz')] = path
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_processes_every_record(self):
+        """S3 이벤트의 모든 레코드를 처리"""
+        event = {'Records': [s3_record('alb-bucket', f'alb/{name}.log.gz') for name in ('a', 'b', 'c')]}
+        fake_logs = FakeLogsClient()
+        result, body = invoke_handler(event, FakeS3Client(self.paths), fake_logs)
+
+        self.assertEqual(result['statusCode'], 200)
+        self.assertEqual(body['events_count'], 15)
+        self.assertEqual([o['events_count'] for o in body['objects']], [3, 5, 7])
+        self.assertEqual(fake_logs.events_count, 15)
+        self.assertEqual(result['batchItemFailures'], [])
+
+    def test_url_encoded_keys(self):
+        """S3 이벤트의 키는 URL 인코딩되어 있으므로 디코딩해서 사용"""
+        result, body = invoke_handler(s3_event('alb-bucket', 'alb/d+e.log.gz'), FakeS3Client(self.paths))
+
+        self.assertEqual(result['statusCode'], 200)
+        self.assertEqual(body['objects'][0]['key'], 'alb/d e.log.gz')
+        self.assertEqual(body['events_count'], 2)
+
+    def test_partial_failure(self):
+        """실패한 객체가 있어도 나머지는 처리하고 객체별로 보고"""
+        event = {'Records': [s3_record('alb-bucket', key) for key in ('alb/a.log.gz', 'alb/missing.log.gz', 'alb/c.log.gz')]}
+        fake_logs = FakeLogsClient()
+        result, body = invoke_handler(event, FakeS3Client(self.paths), fake_logs)
+
+        self.assertEqual(result['statusCode'], 207)
+        self.assertEqual(body['failed_count'], 1)
+        self.assertEqual([o['status'] for o in body['objects']], ['ok', 'error', 'ok'])
+        self.assertIn('NoSuchKey', body['objects'][1]['error'])
+        self.assertEqual(fake_logs.events_count, 10)
+
+    def test_sqs_batch_item_failures(self):
+        """SQS로 전달된 S3 이벤트는 실패한 메시지만 batchItemFailures로 보고"""
+        event = {'Records': [
+            {'messageId': 'm1', 'body': json.dumps(s3_event('alb-bucket', 'alb/a.log.gz'))},
+            {'messageId': 'm2', 'body': json.dumps({'Records': [
+                s3_record('alb-bucket', 'alb/b.log.gz'),
+                s3_record('alb-bucket', 'alb/missing.log.gz'),
+            ]})},
+            {'messageId': 'm3', 'body': 'not json'},
+            {'messageId': 'm4', 'body': json.dumps({
+                'Type': 'Notification', 'Message': json.dumps(s3_event('alb-bucket', 'alb/c.log.gz'))
+            })},
+            {'messageId': 'm5', 'body': json.dumps({'Event': 's3:TestEvent'})},
+        ]}
+        fake_logs = FakeLogsClient()
+        result, body = invoke_handler(event, FakeS3Client(self.paths), fake_logs)
+
+        self.assertEqual(result['batchItemFailures'], [{'itemIdentifier': 'm2'}, {'itemIdentifier': 'm3'}])
+        self.assertEqual(fake_logs.events_count, 3 + 5 + 7)
+        self.assertEqual(body['failed_count'], 2)
+
+    def test_objects_processed_concurrently(self):
+        """독립된 객체들은 워커 풀에서 동시에 다운로드/처리"""
+        fake_s3 = FakeS3Client(self.paths, delay=0.1)
+        event = {'Records': [s3_record('alb-bucket', f'alb/{name}.log.gz') for name in ('a', 'b', 'c')]}
+        result, _ = invoke_handler(event, fake_s3)
+
+        self.assertEqual(result['statusCode'], 200)
+        self.assertGreater(fake_s3.max_active, 1)
+        self.assertLessEqual(fake_s3.max_active, alb_log_processor.OBJECT_CONCURRENCY)
+
+
+
+class TestLatencyAggregation(unittest.TestCase):
+    """
+    서비스별 집계 메트릭(EMF) 테스트
+    요청마다 이벤트를 만드는 대신 버킷별 문서로 요약되는지 검증
+    """
+
+    def test_buckets_by_service_route_status_and_minute(self):
+        """서비스/라우트/상태 코드 클래스/분 단위로 버킷 구성"""
+        aggregator = alb_log_processor.LatencyAggregator()
+        lines = [
+            make_alb_line('/api/orders/1', status=200, target_time=0.010),
+            make_alb_line('/api/orders/2', status=200, target_time=0.030),
+            make_alb_line('/api/orders/3', status=503, target_time=0.500),
+            make_alb_line('/queue/status', status=200, target_time=0.005),
+        ]
+        for parsed in alb_log_processor.iter_parsed_logs(lines):
+            aggregator.add(parsed)
+
+        minute = 1762511445123 // 60000
+        buckets = aggregator.buckets
+        self.assertEqual(len(buckets), 3)
+        ok = buckets[('flash-api-order', '/api/orders/{id}', '2xx', minute)]
+        self.assertEqual((ok.count, ok.error_count), (2, 0))
+        self.assertEqual(ok.latency_histogram, {10: 1, 30: 1})
+        err = buckets[('flash-api-order', '/api/orders/{id}', '5xx', minute)]
+        self.assertEqual((err.count, err.error_count), (1, 1))
+
+    def test_scanner_paths_share_route_bucket(self):
+        """설정에 없는 경로는 Route 차원에서 <prefix>/* 버킷 하나로 합침"""
+        aggregator = alb_log_processor.LatencyAggregator()
+        lines = [make_alb_line(path, status=404, target_time=0.002)
+                 for path in ('/api/.env', '/api/wp-admin/setup.php', '/api/v1/../../etc/passwd')]
+        for parsed in alb_log_processor.iter_parsed_logs(lines):
+            aggregator.add(parsed)
+
+        minute = 1762511445123 // 60000
+        self.assertEqual(list(aggregator.buckets), [('flash-api', '/api/*', '4xx', minute)])
+        self.assertEqual(aggregator.buckets[('flash-api', '/api/*', '4xx', minute)].count, 3)
+
+    def test_emf_document_structure(self):
+        """EMF 문서 형식 (네임스페이스, 차원, 메트릭 값)"""
+        aggregator = alb_log_processor.LatencyAggregator()
+        for parsed in alb_log_processor.iter_parsed_logs([make_alb_line('/queue/status', status=200, target_time=0.005)] * 3):
+            aggregator.add(parsed)
+
+        document, service_document = aggregator.to_emf_documents()
+        metrics = document['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(metrics['Namespace'], alb_log_processor.METRICS_NAMESPACE)
+        self.assertEqual(metrics['Dimensions'], [['Service', 'Route', 'StatusClass']])
+        self.assertEqual(service_document['_aws']['CloudWatchMetrics'][0]['Dimensions'], [['Service']])
+        self.assertNotIn('Route', service_document)
+        self.assertEqual(service_document['RequestCount'], 3)
+        self.assertEqual(document['_aws']['Timestamp'] % 60000, 0)
+        self.assertEqual(document['Service'], 'flash-gateway-queue')
+        self.assertEqual(document['Route'], '/queue/status')
+        self.assertEqual(document['StatusClass'], '2xx')
+        self.assertEqual(document['RequestCount'], 3)
+        self.assertEqual(document['Latency'], [5, 5, 5])
+        for metric in metrics['Metrics']:
+            self.assertIn(metric['Name'], document)
+
+    def test_large_bucket_is_summarized(self):
+        """요청이 많아도 버킷당 값 배열은 EMF 제한(100개) 이내, 분위수는 정확"""
+        bucket = alb_log_processor.LatencyBucket()
+        for latency in range(1, 10001):
+            bucket.count += 1
+            bucket.latency_histogram[latency] += 1
+
+        values = bucket.metric_values()
+        self.assertEqual(len(values), alb_log_processor.EMF_MAX_VALUES)
+        self.assertEqual(values, sorted(values))
+        self.assertEqual(bucket.quantiles([0.5, 0.95, 0.99]), [5000, 9500, 9900])
+
+    def test_service_percentiles_weight_buckets_by_request_count(self):
+        """서비스 차원 값은 합친 히스토그램에서 뽑으므로 값 배열이 잘린 큰 버킷도 요청 수만큼 반영"""
+        aggregator = alb_log_processor.LatencyAggregator()
+        lines = ([make_alb_line(f'/api/orders/{i}', status=200, target_time=0.010) for i in range(900)]
+                 + [make_alb_line('/api/orders/1', status=503, target_time=1.000)] * 100)
+        for parsed in alb_log_processor.iter_parsed_logs(lines):
+            aggregator.add(parsed)
+
+        documents = aggregator.to_emf_documents()
+        route_documents = [d for d in documents if 'Route' in d]
+        self.assertEqual([d['RequestCount'] for d in route_documents], [900, 100])
+        self.assertEqual(len(route_documents[0]['Latency']), alb_log_processor.EMF_MAX_VALUES)
+
+        [service_document] = [d for d in documents if 'Route' not in d]
+        self.assertEqual(service_document['RequestCount'], 1000)
+        self.assertEqual(service_document['ErrorCount'], 100)
+        values = service_document['Latency']
+        self.assertEqual(len(values), alb_log_processor.EMF_MAX_VALUES)
+        # 전체 요청의 10%만 느리므로 p50은 빠른 값, p95는 느린 값
+        self.assertEqual(values.count(1000), 10)
+        self.assertEqual(values[49], 10)
+        self.assertEqual(values[94], 1000)
+        self.assertEqual(service_document['LatencyP95'], 1000)
+
+    def test_merge(self):
+        """집계 결과 병합"""
+        a = alb_log_processor.LatencyAggregator()
+        b = alb_log_processor.LatencyAggregator()
+        for parsed in alb_log_processor.iter_parsed_logs([make_alb_line('/orders', status=200, target_time=0.010)]):
+            a.add(parsed)
+            b.add(parsed)
+        a.merge(b)
+        [bucket] = a.buckets.values()
+        self.assertEqual(bucket.count, 2)
+        self.assertEqual(bucket.latency_histogram, {10: 2})
+
+    def test_concurrent_emission_writes_whole_lines(self):
+        """여러 스레드에서 동시에 출력해도 write 한 번이 EMF 문서 한 줄"""
+        class RecordingStdout(io.StringIO):
+            def __init__(self):
+                super().__init__()
+                self.writes = []
+
+            def write(self, text):
+                self.writes.append(text)
+                time.sleep(0)  # 다른 스레드로 전환 유도
+                return super().write(text)
+
+        aggregator = alb_log_processor.LatencyAggregator()
+        lines = [make_alb_line(f'/api/orders/{i}', status=200 + (i % 4) * 100, target_time=0.01, second=i % 60)
+                 for i in range(40)]
+        for parsed in alb_log_processor.iter_parsed_logs(lines):
+            aggregator.add(parsed)
+        documents = aggregator.to_emf_documents()
+
+        stdout = RecordingStdout()
+        with contextlib.redirect_stdout(stdout):
+            threads = [threading.Thread(target=alb_log_processor.emit_metric_documents, args=(documents,))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(stdout.writes), 8 * len(documents))
+        for text in stdout.writes:
+            self.assertTrue(text.endswith('\n'))
+            self.assertIn('RequestCount', json.loads(text))
+        self.assertEqual(len(stdout.getvalue().splitlines()), 8 * len(documents))
+
+    def test_handler_emits_metrics_without_raw_events(self):
+        """원본 이벤트 전송을 끄면 EMF 문서만 출력되고 출력 바이트가 크게 줄어듦"""
+        lines = [make_alb_line('/queue/status', status=200, target_time=(i % 50) / 1000, second=i % 60) for i in range(6000)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'a.log.gz')
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+
+            fake_s3 = FakeS3Client({('alb-bucket', 'alb/a.log.gz'): path})
+            fake_logs = FakeLogsClient()
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                result, body = invoke_handler(
+                    s3_event('alb-bucket', 'alb/a.log.gz'), fake_s3, fake_logs, RAW_EVENT_SAMPLE_RATE=0.0)
+
+        self.assertEqual(result['statusCode'], 200)
+        self.assertEqual(fake_logs.events_count, 0)
+        self.assertEqual(body['objects'][0]['parsed_count'], 6000)
+
+        # 호출 요약/파이프라인 메트릭 문서는 제외하고 지연 시간 집계 문서만 확인
+        emf_lines = [line for line in stdout.getvalue().splitlines() if line.startswith('{"_aws"') and 'RequestCount' in line]
+        documents = [json.loads(line) for line in emf_lines]
+        self.assertEqual(len(documents), body['objects'][0]['metric_documents'])
+        self.assertEqual(sum(d['RequestCount'] for d in documents if 'Route' in d), 6000)
+        self.assertEqual(sum(d['RequestCount'] for d in documents if 'Route' not in d), 6000)
+
+        emf_bytes = sum(len(line) for line in emf_lines)
+        raw_bytes = sum(len(alb_log_processor.to_log_event(p)['message'])
+                        for p in alb_log_processor.iter_parsed_logs(lines))
+        print(f"\n📉 raw events {raw_bytes / 1e6:.2f}MB → EMF {emf_bytes / 1e3:.1f}KB")
+        self.assertLess(emf_bytes * 100, raw_bytes)
+
+
+
+class TestOutputProfiles(unittest.TestCase):
+    """
+    전송 이벤트 출력 프로필과 직렬화 테스트
+    full은 기존 json.dumps 결과와 동일해야 하고, compact/raw는 바이트 수가 줄어야 함
+    """
+
+    LINES = [
+        TestALBLogProcessor.ALB_LOG_GATEWAY,
+        TestALBLogProcessor.ALB_LOG_API_PAYMENT,
+        TestALBLogProcessor.ALB_LOG_API_ORDER,
+        TestALBLogProcessor.ALB_LOG_PAY,
+        TestALBLogProcessor.ALB_LOG_GATEWAY_PRODUCTS,
+    ]
+
+    def parsed_lines(self):
+        lines = self.LINES + [
+            TestALBLogProcessor.ALB_LOG_GATEWAY.replace('Mozilla/5.0', '한글 에이전트 \\"따옴표\\" \\u0001'),
+            TestALBLogProcessor.ALB_LOG_GATEWAY.replace('"GET /orders HTTP/1.1"', '"- - -"'),
+        ]
+        return [parse_alb_log(line) for line in lines]
+
+    def test_full_keys_match_parser(self):
+        """full 프로필 키 목록은 parse_alb_log 결과와 같은 순서"""
+        self.assertEqual(tuple(parse_alb_log(self.LINES[0])), alb_log_processor.FULL_OUTPUT_KEYS)
+
+    def test_full_profile_is_byte_identical(self):
+        """full 프로필은 json.dumps(ensure_ascii=False)와 바이트 단위로 동일 (대시보드 쿼리 호환)"""
+        serialize = alb_log_processor.get_serializer('full')
+        for parsed in self.parsed_lines():
+            self.assertEqual(serialize(parsed), json.dumps(parsed, ensure_ascii=False))
+
+    def test_compact_profile(self):
+        """compact 프로필은 짧은 키, null 생략, raw_message 제외"""
+        serialize = alb_log_processor.get_serializer('compact')
+        for parsed in self.parsed_lines():
+            compact = json.loads(serialize(parsed))
+            self.assertNotIn('raw_message', compact)
+            self.assertNotIn(None, compact.values())
+            for key, short_key in alb_log_processor.COMPACT_OUTPUT_KEYS.items():
+                self.assertEqual(compact.get(short_key), parsed[key])
+
+    def test_raw_profile(self):
+        """raw 프로필은 원본 라인 그대로"""
+        serialize = alb_log_processor.get_serializer('raw')
+        self.assertEqual(serialize(parse_alb_log(self.LINES[0])), self.LINES[0])
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            alb_log_processor.get_serializer('xml')
+
+    def test_size_comparison(self):
+        """프로필별 이벤트 바이트 수 비교 (직렬화 처리량은 alb-log-benchmark.py의 serialize 항목)"""
+        parsed = [parse_alb_log(line) for line in self.LINES]
+        sizes = {
+            profile: sum(len(alb_log_processor.get_serializer(profile)(p).encode('utf-8')) for p in parsed)
+            for profile in ('full', 'compact', 'raw')
+        }
+        legacy_size = sum(len(json.dumps(p, ensure_ascii=False).encode('utf-8')) for p in parsed)
+
+        self.assertEqual(sizes['full'], legacy_size)
+        self.assertLess(sizes['compact'] * 3, sizes['full'])
+        self.assertLess(sizes['raw'], sizes['full'])
+
+    def test_handler_uses_output_profile(self):
+        """OUTPUT_PROFILE 설정에 따라 전송 이벤트 형식이 바뀜"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'a.log.gz')
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                f.write('\n'.join(self.LINES) + '\n')
+
+            fake_s3 = FakeS3Client({('alb-bucket', 'alb/a.log.gz'): path})
+            fake_logs = FakeLogsClient()
+            messages = []
+            original_put = fake_logs.put_log_events
+
+            def capture(**kwargs):
+                messages.extend(e['message'] for e in kwargs['logEvents'])
+                return original_put(**kwargs)
+
+            fake_logs.put_log_events = capture
+            result, _ = invoke_handler(
+                s3_event('alb-bucket', 'alb/a.log.gz'), fake_s3, fake_logs, OUTPUT_PROFILE='compact')
+
+        self.assertEqual(result['statusCode'], 200)
+        self.assertEqual(len(messages), len(self.LINES))
+        self.assertTrue(all('"sv":' in message and 'raw_message' not in message for message in messages))
+
+
+
+class TestTimestampDecoding(unittest.TestCase):
+    """
+    ALB 타임스탬프 디코딩 및 거의 정렬된 배치 정렬 테스트
+    """
+
+    def reference_ms(self, value):
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return (int(dt.replace(tzinfo=None).toordinal()) - 719163) * 86400000 + (
+            dt.hour * 3600 + dt.minute * 60 + dt.second) * 1000 + dt.microsecond // 1000
+
+    def test_matches_iso_parsing(self):
+        """고정 포맷 디코딩 결과가 ISO 파싱과 일치 (윤일, 연말 경계 포함)"""
+        values = [
+            '2025-11-07T10:30:45.123456Z',
+            '2025-11-07T10:30:45.999999Z',
+            '2025-11-07T10:30:45.000000Z',
+            '2024-02-29T23:59:59.500000Z',
+            '2025-12-31T23:59:59.999000Z',
+            '2026-01-01T00:00:00.001000Z',
+            '2025-11-07T10:30:45Z',
+        ]
+        for value in values:
+            self.assertEqual(alb_log_processor.decode_alb_timestamp(value), self.reference_ms(value), value)
+
+    def test_other_iso_formats(self):
+        """고정 포맷이 아니어도 ISO 8601이면 파싱"""
+        self.assertEqual(
+            alb_log_processor.decode_alb_timestamp('2025-11-07T19:30:45.123+09:00'),
+            self.reference_ms('2025-11-07T10:30:45.123000Z')
+        )
+
+    def test_malformed_timestamps(self):
+        """형식이 깨진 타임스탬프는 None"""
+        for value in ('-', '', 'not-a-timestamp', '2025-13-07T10:30:45.123456Z',
+                      '2025-11-07T10:30:45.12x456Z', '2025-11-07T25:30:45.123456Z'):
+            self.assertIsNone(alb_log_processor.decode_alb_timestamp(value), value)
+
+    def test_calendar_edge_cases(self):
+        """윤년/월말 경계를 datetime과 동일하게 처리하고 없는 날짜는 None"""
+        for value in ('2024-02-29T23:59:59', '2000-02-29T00:00:00', '1970-01-01T00:00:00',
+                      '2025-12-31T23:59:59', '2026-01-01T00:00:00', '1999-03-01T12:00:00'):
+            expected = int(datetime.fromisoformat(value + '+00:00').timestamp())
+            self.assertEqual(alb_log_processor._epoch_seconds(value), expected, value)
+        for value in ('2100-02-29T00:00:00', '2025-02-29T00:00:00', '2025-04-31T00:00:00',
+                      '2025-13-01T00:00:00', '2025-01-01T24:00:00', '0000-01-01T00:00:00'):
+            self.assertIsNone(alb_log_processor._epoch_seconds(value), value)
+
+    def test_second_prefix_is_cached(self):
+        """같은 초를 공유하는 라인은 캐시된 epoch 초를 사용"""
+        alb_log_processor._epoch_seconds_cache.clear()
+        with mock.patch.object(alb_log_processor, '_epoch_seconds', wraps=alb_log_processor._epoch_seconds) as spy:
+            for micros in range(0, 1000000, 1000):
+                alb_log_processor.decode_alb_timestamp(f'2025-11-07T10:30:45.{micros:06d}Z')
+        self.assertEqual(spy.call_count, 1)
+
+    def test_malformed_lines_are_counted_not_restamped(self):
+        """타임스탬프가 깨진 라인은 수집 시각으로 대체하지 않고 제외 후 집계"""
+        broken = TestALBLogProcessor.ALB_LOG_GATEWAY.replace('2025-11-07T10:30:45.123456Z', 'garbage', 1)
+        stats = {}
+        parsed = list(alb_log_processor.iter_parsed_logs([TestALBLogProcessor.ALB_LOG_GATEWAY, broken], stats))
+
+        self.assertEqual(len(parsed), 1)
+        self.assertEqual(stats['malformed_timestamps'], 1)
+        self.assertIsNone(parse_alb_log(broken)['timestamp_ms'])
+
+
+def thread_executor(max_workers=None, initializer=None, initargs=()):
+    """프로세스 풀 대신 사용하는 스레드 풀 (스텁 클라이언트를 워커에서 교체하지 않도록 initializer 무시)"""
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+class TestBackfill(unittest.TestCase):
+    """
+    오프라인 백필 테스트
+    프로세스 풀 처리, 싱크별 출력, 체크포인트 기반 재개를 검증
+    """
+
+    LINES = {
+        'a': [TestALBLogProcessor.ALB_LOG_GATEWAY] * 3,
+        'b': [TestALBLogProcessor.ALB_LOG_API_PAYMENT] * 4,
+        'c': [TestALBLogProcessor.ALB_LOG_PAY, TestALBLogProcessor.ALB_LOG_API_ORDER],
+    }
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmp.name, 'in', '2025', '11', '07')
+        os.makedirs(self.input_dir)
+        for name, lines in self.LINES.items():
+            with gzip.open(os.path.join(self.input_dir, f'{name}.log.gz'), 'wt', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+        with open(os.path.join(self.input_dir, 'README.txt'), 'w') as f:
+            f.write('not a log')
+        self.output_dir = os.path.join(self.tmp.name, 'out')
+        self.checkpoint_path = os.path.join(self.tmp.name, 'backfill.ckpt')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def output_path(self, name):
+        return os.path.join(self.output_dir, f'{name}.ndjson')
+
+    def run_backfill(self, sink='ndjson', executor_factory=thread_executor, **kwargs):
+        sources = alb_log_processor.list_local_sources(os.path.join(self.tmp.name, 'in'))
+        return alb_log_processor.run_backfill(
+            sources, sink,
+            output_dir=self.output_dir,
+            checkpoint=alb_log_processor.BackfillCheckpoint(self.checkpoint_path),
+            workers=2,
+            executor_factory=executor_factory,
+            **kwargs
+        )
+
+    def test_lists_only_gzip_logs(self):
+        """디렉터리 아래의 gzip 로그만 정렬된 순서로 수집"""
+        sources = alb_log_processor.list_local_sources(os.path.join(self.tmp.name, 'in'))
+        self.assertEqual([os.path.basename(s) for s in sources], ['a.log.gz', 'b.log.gz', 'c.log.gz'])
+
+    def test_ndjson_sink_with_process_pool(self):
+        """프로세스 풀에서 파일별 NDJSON을 만들고 집계는 부모에서 병합"""
+        fork_pool = functools.partial(
+            ProcessPoolExecutor, mp_context=multiprocessing.get_context('fork'))
+        summary = self.run_backfill(executor_factory=fork_pool, profile='full')
+
+        self.assertEqual(summary['processed'], 3)
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual(summary['parsed_count'], 9)
+        self.assertEqual(summary['events_count'], 9)
+
+        by_service = summary['aggregator'].by_service()
+        self.assertEqual(by_service['flash-gateway-orders'].count, 3)
+        self.assertEqual(by_service['flash-api-payment'].count, 5)
+
+        for name, lines in self.LINES.items():
+            with open(self.output_path(name), encoding='utf-8') as f:
+                written = f.read().splitlines()
+            self.assertEqual(written, [json.dumps(parse_alb_log(line), ensure_ascii=False) for line in lines])
+
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            self.assertEqual(len(f.read().splitlines()), 3)
+
+    def test_resume_skips_completed_sources(self):
+        """체크포인트에 기록된 소스는 재실행 시 다시 처리하지 않음"""
+        first = os.path.join(self.input_dir, 'a.log.gz')
+        with open(self.checkpoint_path, 'w', encoding='utf-8') as f:
+            # 마지막 줄이 잘린 기록은 미완료로 간주
+            f.write(first + '\n' + os.path.join(self.input_dir, 'b.log'))
+
+        summary = self.run_backfill()
+
+        self.assertEqual(summary['skipped'], 1)
+        self.assertEqual(summary['processed'], 2)
+        self.assertEqual(summary['parsed_count'], 6)
+        self.assertFalse(os.path.exists(self.output_path('a')))
+
+        again = self.run_backfill()
+        self.assertEqual(again['skipped'], 3)
+        self.assertEqual(again['processed'], 0)
+
+    def test_failed_source_is_retried_on_next_run(self):
+        """실패한 소스는 체크포인트에 남기지 않고, 부분 출력도 남기지 않음"""
+        broken = os.path.join(self.input_dir, 'b.log.gz')
+        with open(broken, 'rb') as f:
+            data = f.read()
+        with open(broken, 'wb') as f:
+            f.write(data[:len(data) // 2])
+
+        summary = self.run_backfill()
+        self.assertEqual(summary['failed'], [broken])
+        self.assertEqual(summary['processed'], 2)
+        output = self.output_path('b')
+        self.assertFalse(os.path.exists(output))
+        self.assertFalse(os.path.exists(output + '.tmp'))
+
+        with open(broken, 'wb') as f:
+            f.write(data)
+        retry = self.run_backfill()
+        self.assertEqual(retry['skipped'], 2)
+        self.assertEqual(retry['processed'], 1)
+        self.assertEqual(retry['failed'], [])
+
+    def test_s3_source_with_cloudwatch_sink(self):
+        """S3 prefix를 페이지 단위로 나열하고 CloudWatch Logs 싱크로 업로드"""
+        objects = {
+            ('alb-bucket', f'AWSLogs/{name}.log.gz'): os.path.join(self.input_dir, f'{name}.log.gz')
+            for name in self.LINES
+        }
+        objects[('alb-bucket', 'other/x.log.gz')] = objects[('alb-bucket', 'AWSLogs/a.log.gz')]
+        fake_logs = FakeLogsClient()
+        with mock.patch.object(alb_log_processor, 's3', FakeS3Client(objects)), \
+                mock.patch.object(alb_log_processor, 'logs', fake_logs):
+            sources = alb_log_processor.list_s3_sources('alb-bucket', 'AWSLogs/')
+            summary = alb_log_processor.run_backfill(
+                sources, 'cloudwatch', checkpoint=alb_log_processor.BackfillCheckpoint(self.checkpoint_path),
+                executor_factory=thread_executor)
+
+        self.assertEqual(sources, [f's3://alb-bucket/AWSLogs/{name}.log.gz' for name in ('a', 'b', 'c')])
+        self.assertEqual(summary['processed'], 3)
+        self.assertEqual(fake_logs.events_count, 9)
+
+    def test_cli_prints_aggregate_summary(self):
+        """CLI의 stats 싱크는 서비스별 요약만 stdout으로 출력"""
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr), \
+                mock.patch('concurrent.futures.ProcessPoolExecutor', thread_executor):
+            exit_code = alb_log_processor.main(['--dir', os.path.join(self.tmp.name, 'in'), '--sink', 'stats'])
+
+        self.assertEqual(exit_code, 0)
+        output = stdout.getvalue()
+        self.assertIn('processed=3 skipped=0 failed=0', output)
+        self.assertIn('parsed=9 forwarded=0', output)
+        self.assertRegex(output, r'flash-api-payment\s+5\s+0\s')
+
+
+class TestLogStreamSharding(unittest.TestCase):
+    """
+    로그 스트림 샤딩 테스트
+    샤딩 방식별 스트림 선택과 웜 스타트의 스트림 생성 캐시를 검증
+    """
+
+    NODE_KEY = ('AWSLogs/339712948064/elasticloadbalancing/ap-northeast-2/2025/11/07/'
+                '339712948064_elasticloadbalancing_ap-northeast-2_app.flash-ticket-alb.1234567890abcdef'
+                '_20251107T1030Z_10.0.1.5_2et2e1mx.log.gz')
+
+    def setUp(self):
+        alb_log_processor._known_log_streams.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'mixed.log.gz')
+        with gzip.open(self.path, 'wt', encoding='utf-8') as f:
+            for line in (TestALBLogProcessor.ALB_LOG_GATEWAY, TestALBLogProcessor.ALB_LOG_API_PAYMENT,
+                         TestALBLogProcessor.ALB_LOG_API_ORDER, TestALBLogProcessor.ALB_LOG_PAY) * 5:
+                f.write(line + '\n')
+
+    def tearDown(self):
+        alb_log_processor._known_log_streams.clear()
+        self.tmp.cleanup()
+
+    def invoke(self, sharding, key='alb/mixed.log.gz', fake_logs=None, times=1):
+        fake_s3 = FakeS3Client({('alb-bucket', key): self.path})
+        fake_logs = fake_logs or FakeLogsClient()
+        for _ in range(times):
+            result, _ = invoke_handler(s3_event('alb-bucket', key), fake_s3, fake_logs, LOG_STREAM_SHARDING=sharding)
+            self.assertEqual(result['statusCode'], 200)
+        return fake_logs
+
+    def test_warm_invocations_skip_stream_creation(self):
+        """이미 확인된 스트림은 다시 생성하지 않음"""
+        fake_logs = self.invoke('none', times=3)
+
+        self.assertEqual(fake_logs.created_streams, ['alb-access-logs'])
+        self.assertEqual(fake_logs.events_by_stream, {'alb-access-logs': 60})
+
+    def test_existing_stream_is_cached(self):
+        """이미 존재하는 스트림도 한 번 확인한 뒤에는 캐시"""
+        fake_logs = FakeLogsClient()
+        calls = []
+
+        def create_log_stream(logGroupName, logStreamName):
+            calls.append(logStreamName)
+            raise FakeLogsClient.exceptions.ResourceAlreadyExistsException()
+
+        fake_logs.create_log_stream = create_log_stream
+        self.invoke('none', fake_logs=fake_logs, times=2)
+        self.assertEqual(calls, ['alb-access-logs'])
+
+    def test_node_sharding(self):
+        """S3 키의 ALB 노드 IP별 스트림 사용 (형식이 다르면 기본 스트림)"""
+        self.assertEqual(alb_log_processor.alb_node_from_key(self.NODE_KEY), '10.0.1.5')
+        self.assertIsNone(alb_log_processor.alb_node_from_key('alb/mixed.log.gz'))
+
+        fake_logs = self.invoke('node', key=self.NODE_KEY)
+        self.assertEqual(fake_logs.events_by_stream, {'alb-access-logs/node/10.0.1.5': 20})
+        self.assertEqual(alb_log_processor.log_stream_for_object('alb/mixed.log.gz', 'node'), 'alb-access-logs')
+
+    def test_hash_sharding(self):
+        """S3 키 해시로 고정된 개수의 샤드 중 하나를 항상 같게 선택"""
+        streams = {alb_log_processor.log_stream_for_object(f'alb/{i}.log.gz', 'hash') for i in range(200)}
+        self.assertEqual(streams, {f'alb-access-logs/shard/{i}' for i in range(alb_log_processor.LOG_STREAM_SHARDS)})
+        self.assertEqual(alb_log_processor.log_stream_for_object('alb/1.log.gz', 'hash'),
+                         alb_log_processor.log_stream_for_object('alb/1.log.gz', 'hash'))
+
+        fake_logs = self.invoke('hash')
+        self.assertEqual(list(fake_logs.events_by_stream.values()), [20])
+
+    def test_service_sharding(self):
+        """서비스별 스트림으로 나눠 업로드하고 스트림은 한 번만 생성"""
+        fake_logs = self.invoke('service', times=2)
+
+        self.assertEqual(fake_logs.events_by_stream, {
+            'alb-access-logs/service/flash-gateway-orders': 10,
+            'alb-access-logs/service/flash-api-payment': 20,
+            'alb-access-logs/service/flash-api-order': 10,
+        })
+        self.assertEqual(sorted(fake_logs.created_streams), sorted(fake_logs.events_by_stream))
+
+    def test_service_shards_share_upload_concurrency(self):
+        """샤드들이 스레드 풀과 세마포어를 공유하여 동시 업로드/대기 배치 수는 샤드 수와 관계없이 max_workers 이내"""
+        fake_logs = FakeLogsClient(delay=0.05)
+        sink = alb_log_processor.ShardedCloudWatchLogsSink(
+            fake_logs, alb_log_processor.LOG_GROUP_NAME, alb_log_processor.get_serializer('full'), max_workers=2)
+        parsed = [parse_alb_log(line) for line in (TestALBLogProcessor.ALB_LOG_GATEWAY,
+                                                   TestALBLogProcessor.ALB_LOG_API_PAYMENT,
+                                                   TestALBLogProcessor.ALB_LOG_API_ORDER)]
+        # 스레드 풀에 제출되어 끝나지 않은(대기 + 진행 중) 배치 수 기록
+        queued = {'current': 0, 'max': 0}
+        lock = threading.Lock()
+        submit = sink._executor.submit
+
+        def counting_submit(*args, **kwargs):
+            with lock:
+                queued['current'] += 1
+                queued['max'] = max(queued['max'], queued['current'])
+            future = submit(*args, **kwargs)
+
+            def done(_):
+                with lock:
+                    queued['current'] -= 1
+            future.add_done_callback(done)
+            return future
+
+        with mock.patch.object(alb_log_processor, 'logs', fake_logs), \
+                mock.patch.object(alb_log_processor, 'MAX_BATCH_EVENTS', 2), \
+                mock.patch.object(sink._executor, 'submit', counting_submit):
+            with sink:
+                for _ in range(4):
+                    for record in parsed:
+                        sink.write(record, sink.serialize(record))
+                stats = sink.close()
+
+        self.assertEqual(len(sink.uploaders), 3)
+        self.assertEqual(stats['uploaded_events'], 12)
+        self.assertEqual(fake_logs.max_active, 2)
+        # 샤드가 3개여도 제출된 배치는 샤드 전체에서 max_workers개 이내
+        self.assertEqual(queued['max'], 2)
+
+    def test_unknown_sharding(self):
+        """알 수 없는 샤딩 방식은 에러"""
+        with self.assertRaises(ValueError):
+            alb_log_processor.log_stream_for_object('alb/a.log.gz', 'random')
+
+
+class TestPipelineInstrumentation(unittest.TestCase):
+    """
+    처리 단계 계측 테스트
+    단계별 시간, 라인/바이트 카운터, 호출 요약/EMF 출력과 샘플링 프로파일러를 검증
+    """
+
+    def setUp(self):
+        base = TestALBLogProcessor.ALB_LOG_GATEWAY
+        bot = base.replace(' 0.000 0.023 0.000 200 200 ', ' -1 -1 -1 403 - ')
+        malformed = base.replace('http 2025-11-07T10:30:45.123456Z', 'http not-a-timestamp', 1)
+        self.lines = ['#Version: 1.0', ''] + [base] * 500 + [bot] * 20 + ['garbage'] * 3 + [malformed] * 2
+        self.text = '\n'.join(self.lines) + '\n'
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'a.log.gz')
+        with gzip.open(self.path, 'wt', encoding='utf-8') as f:
+            f.write(self.text)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def invoke(self, **patches):
+        fake_s3 = FakeS3Client({('alb-bucket', 'alb/a.log.gz'): self.path})
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            result, body = invoke_handler(s3_event('alb-bucket', 'alb/a.log.gz'), fake_s3, **patches)
+        self.assertEqual(result['statusCode'], 200)
+        return body, stdout.getvalue()
+
+    def test_counters_and_stage_times(self):
+        """라인 종류별 카운터와 바이트 수를 정확히 세고 모든 단계 시간을 기록"""
+        body, output = self.invoke()
+        summary = next(json.loads(line) for line in output.splitlines() if '"invocation_summary"' in line)
+
+        self.assertEqual(summary['objects'], 1)
+        self.assertEqual(summary['lines_seen'], len(self.lines))
+        self.assertEqual(summary['lines_skipped'], 2)
+        self.assertEqual(summary['lines_filtered'], 20)
+        self.assertEqual(summary['parse_failures'], 3)
+        self.assertEqual(summary['malformed_timestamps'], 2)
+        self.assertEqual(summary['bytes_in'], os.path.getsize(self.path))
+        self.assertEqual(summary['bytes_decompressed'], len(self.text.encode('utf-8')))
+        serialize = alb_log_processor.get_serializer('full')
+        self.assertEqual(summary['bytes_out'], 500 * len(serialize(parse_alb_log(TestALBLogProcessor.ALB_LOG_GATEWAY))))
+
+        for stage in ('fetch', 'decompress', 'parse', 'classify', 'serialize', 'sort', 'upload'):
+            self.assertGreater(summary['stages_ms'][stage], 0, stage)
+        self.assertGreater(summary['wall_ms'], 0)
+        self.assertEqual(body['objects'][0]['pipeline']['lines_seen'], len(self.lines))
+
+    def test_pipeline_emf_document(self):
+        """호출 요약을 함수 이름 차원의 EMF 문서로 출력"""
+        _, output = self.invoke()
+        document = next(json.loads(line) for line in output.splitlines() if '"StageParseTime"' in line)
+
+        directive = document['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(directive['Dimensions'], [['Function']])
+        names = {metric['Name']: metric['Unit'] for metric in directive['Metrics']}
+        self.assertEqual(names['StageUploadWaitTime'], 'Milliseconds')
+        self.assertEqual(names['LinesSeen'], 'Count')
+        self.assertEqual(names['BytesIn'], 'Bytes')
+        for name in names:
+            self.assertIn(name, document)
+        self.assertEqual(document['ParseFailures'], 3)
+
+    def test_metrics_disabled_emits_only_summary(self):
+        """EMIT_METRICS가 꺼져 있으면 요약 로그만 출력"""
+        _, output = self.invoke(EMIT_METRICS=False)
+        self.assertNotIn('"_aws"', output)
+        self.assertIn('"invocation_summary"', output)
+
+    def test_sampled_profile(self):
+        """샘플링된 호출은 cProfile 상위 함수와 tracemalloc 결과를 로그로 출력"""
+        was_tracing = tracemalloc.is_tracing()
+        _, output = self.invoke(PROFILE_SAMPLE_RATE=1.0, PROFILE_TOP_N=10)
+
+        self.assertIn('Profile (sampled invocation)', output)
+        self.assertIn('process_s3_object', output)
+        self.assertIn('tracemalloc: current=', output)
+        self.assertEqual(tracemalloc.is_tracing(), was_tracing)
+
+        _, output = self.invoke(PROFILE_SAMPLE_RATE=0.0)
+        self.assertNotIn('Profile (sampled invocation)', output)
+
+    def test_sampled_profile_with_several_objects(self):
+        """프로파일링하는 호출은 객체를 하나씩 처리해 프로파일러가 겹치지 않음 (Python 3.12+ 제약)"""
+        import cProfile
+
+        class ExclusiveProfile(cProfile.Profile):
+            # Python 3.12+처럼 다른 프로파일러가 켜져 있으면 ValueError
+            active = 0
+            lock = threading.Lock()
+
+            def runcall(self, func, *args, **kwargs):
+                with ExclusiveProfile.lock:
+                    if ExclusiveProfile.active:
+                        raise ValueError('Another profiling tool is already active')
+                    ExclusiveProfile.active += 1
+                try:
+                    return super().runcall(func, *args, **kwargs)
+                finally:
+                    with ExclusiveProfile.lock:
+                        ExclusiveProfile.active -= 1
+
+        keys = [f'alb/{name}.log.gz' for name in ('a', 'b', 'c')]
+        fake_s3 = FakeS3Client({('alb-bucket', key): self.path for key in keys}, delay=0.02)
+        event = {'Records': [s3_record('alb-bucket', key) for key in keys]}
+        stdout = io.StringIO()
+        with mock.patch('cProfile.Profile', ExclusiveProfile), contextlib.redirect_stdout(stdout):
+            result, body = invoke_handler(event, fake_s3, PROFILE_SAMPLE_RATE=1.0, OBJECT_CONCURRENCY=3)
+
+        self.assertEqual(result['statusCode'], 200)
+        self.assertEqual([obj['status'] for obj in body['objects']], ['ok'] * 3)
+        self.assertEqual(fake_s3.max_active, 1)
+        self.assertIn('process_s3_object', stdout.getvalue())
+
+        # 샘플링하지 않은 호출은 그대로 동시에 처리
+        fake_s3 = FakeS3Client({('alb-bucket', key): self.path for key in keys}, delay=0.02)
+        with contextlib.redirect_stdout(io.StringIO()):
+            invoke_handler(event, fake_s3, PROFILE_SAMPLE_RATE=0.0, OBJECT_CONCURRENCY=3)
+        self.assertGreater(fake_s3.max_active, 1)
+
+    def test_instrumented_parse_matches_plain(self):
+        """계측해도 파싱 결과는 같고 라인 수는 정확히 셈 (계측 오버헤드는 alb-log-benchmark.py의 instrumentation 항목)"""
+        lines = [TestALBLogProcessor.ALB_LOG_GATEWAY] * 2000
+        metrics = alb_log_processor.PipelineMetrics()
+
+        plain = list(alb_log_processor.iter_parsed_logs(lines))
+        instrumented = list(alb_log_processor.iter_parsed_logs(lines, metrics=metrics))
+
+        self.assertEqual(instrumented, plain)
+        self.assertEqual(metrics.counters['lines_seen'], 2000)
+        self.assertGreater(metrics.stage_seconds['parse'], 0)
+
+
+class TestSamplingRules(unittest.TestCase):
+    """
+    원본 이벤트 샘플링 규칙 테스트
+    규칙 순서/조건별 판정, 트레이스 ID 기반 결정적 샘플링, sample_weight 기록을 검증
+    """
+
+    def setUp(self):
+        self.rules = alb_log_processor.load_sampling_rules(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sampling-rules.json'))
+
+    def decide(self, method, path, status, target_time, **kwargs):
+        return self.rules.rate_for(parse_alb_log(make_alb_line(path, method, status, target_time, **kwargs)))
+
+    def test_rule_order(self):
+        """처음 매칭되는 규칙 적용: 에러와 느린 요청은 항상 전송, 헬스 체크는 제외, 폴링은 샘플링"""
+        self.assertEqual(self.decide('GET', '/queue/status', 200, 0.020), ('queue-polling', 0.1))
+        self.assertEqual(self.decide('POST', '/queue/status', 200, 0.020), ('default', 1.0))
+        self.assertEqual(self.decide('GET', '/queue/status', 503, 0.020), ('errors', 1.0))
+        self.assertEqual(self.decide('GET', '/queue/status', 429, 0.020), ('errors', 1.0))
+        # 서비스별 느린 요청 기준: flash-gateway-queue 500ms, 기본 1000ms
+        self.assertEqual(self.decide('GET', '/queue/status', 200, 0.600), ('slow-requests', 1.0))
+        self.assertEqual(self.decide('GET', '/events', 200, 0.600), ('default', 1.0))
+        self.assertEqual(self.decide('GET', '/events', 200, 1.200), ('slow-requests', 1.0))
+        self.assertEqual(self.decide('GET', '/health', 200, 0.001), ('health-checks', 0.0))
+        self.assertEqual(self.decide('GET', '/health/db', 200, 0.001), ('health-checks', 0.0))
+        self.assertEqual(self.decide('GET', '/healthz', 200, 0.001), ('default', 1.0))
+        self.assertEqual(self.decide('GET', '/health', 503, 0.001), ('errors', 1.0))
+        self.assertEqual(self.decide('GET', '/orders', 403, None), ('unreached-target', 0.0))
+
+    def test_decisions_are_cached(self):
+        """같은 요청 유형의 판정은 캐시에서 반환"""
+        self.rules.decide.cache_clear()
+        for i in range(100):
+            self.decide('GET', '/queue/status', 200, 0.020, trace=f'Root=1-6549c8b7-{i:024x}')
+        info = self.rules.decide.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 99))
+
+    def test_trace_sample_point(self):
+        """Root= 트레이스 ID만 해시하므로 같은 요청은 다른 홉/라인에서도 같은 값"""
+        point = alb_log_processor.trace_sample_point
+        first = make_alb_line('/queue/status', 'GET', 200, 0.020, trace='Root=1-6549c8b7-aaaa')
+        other_hop = make_alb_line('/orders', 'POST', 200, 0.300, trace='Self=1-6549c8b8-bbbb;Root=1-6549c8b7-aaaa;Sampled=1')
+        self.assertEqual(point(first), point(other_hop))
+        self.assertNotEqual(point(first), point(first.replace('aaaa', 'aaab')))
+
+        # 사용자 입력(User-Agent)에 들어 있는 Root=는 무시
+        spoofed = first.replace('"Mozilla/5.0"', '"Mozilla \\"Root=1-evil\\""')
+        self.assertEqual(point(spoofed), point(first))
+
+        # 트레이스 ID가 없으면 라인 전체 해시
+        no_trace = first.replace('"Root=1-6549c8b7-aaaa"', '"-"')
+        self.assertEqual(point(no_trace), point(no_trace))
+        self.assertTrue(0.0 <= point(no_trace) < 1.0)
+
+    def test_deterministic_sampling_rate_and_weight(self):
+        """트레이스 ID 해시로 설정 비율만큼 전송하고 sample_weight로 전체 건수를 복원"""
+        parsed = [parse_alb_log(make_alb_line('/queue/status', 'GET', 200, 0.020, trace=f'Root=1-6549c8b7-{i:024x}'))
+                  for i in range(20000)]
+        weights = [self.rules.sample_weight(p) for p in parsed]
+        kept = [w for w in weights if w]
+
+        self.assertAlmostEqual(len(kept) / len(parsed), 0.1, delta=0.01)
+        self.assertTrue(all(w == 10.0 for w in kept))
+        self.assertAlmostEqual(sum(kept), len(parsed), delta=len(parsed) * 0.1)
+        self.assertEqual(weights, [self.rules.sample_weight(p) for p in parsed])
+
+        # 전체 비율을 곱하면 그 부분집합만 전송
+        halved = [self.rules.sample_weight(p, 0.5) for p in parsed]
+        self.assertTrue(all(weights[i] for i, w in enumerate(halved) if w))
+        self.assertTrue(all(w == 20.0 for w in halved if w))
+
+    def test_scale_does_not_apply_to_keep_rules(self):
+        """전체 비율은 sample 규칙과 기본 비율에만 곱하고 keep 규칙(에러, 느린 요청)은 항상 전송"""
+        error = parse_alb_log(make_alb_line('/queue/status', 'GET', 503, 0.020))
+        slow = parse_alb_log(make_alb_line('/events', 'GET', 200, 1.200))
+        polling = parse_alb_log(make_alb_line('/queue/status', 'GET', 200, 0.020))
+        default = parse_alb_log(make_alb_line('/events', 'GET', 200, 0.020))
+
+        self.assertEqual(self.rules.rate_for(error, 0.5), ('errors', 1.0))
+        self.assertEqual(self.rules.rate_for(slow, 0.0), ('slow-requests', 1.0))
+        self.assertEqual(self.rules.rate_for(polling, 0.5), ('queue-polling', 0.05))
+        self.assertEqual(self.rules.rate_for(default, 0.5), ('default', 0.5))
+        self.assertEqual(self.rules.sample_weight(error, 0.0), 1.0)
+        self.assertEqual(self.rules.sample_weight(default, 0.0), 0.0)
+
+    def test_invalid_config(self):
+        """알 수 없는 액션/조건, 범위를 벗어난 비율은 에러"""
+        for rule in ({'Action': 'maybe'},
+                     {'Action': 'sample', 'SampleRate': 1.5},
+                     {'Match': {'Path': '/x'}, 'Action': 'drop'}):
+            with self.assertRaises(ValueError):
+                alb_log_processor.SamplingRules({'Rules': [rule]})
+
+    def test_default_rules_without_file(self):
+        """규칙 파일이 없으면 기존 동작(target 미도달 요청만 제외)"""
+        rules = alb_log_processor.load_sampling_rules('/nonexistent/sampling-rules.json')
+        self.assertEqual(rules.rate_for(parse_alb_log(make_alb_line('/queue/status', 'GET', 200, 0.020))), ('default', 1.0))
+        self.assertEqual(rules.rate_for(parse_alb_log(make_alb_line('/health', 'GET', 200, 0.001))), ('default', 1.0))
+        self.assertEqual(rules.rate_for(parse_alb_log(make_alb_line('/orders', 'GET', 403, None)))[1], 0.0)
+
+    def test_serialized_sample_weight(self):
+        """샘플링된 이벤트의 sample_weight를 출력 (full은 json.dumps와 동일)"""
+        parsed = parse_alb_log(make_alb_line('/queue/status', 'GET', 200, 0.020))
+        parsed['sample_weight'] = 10.0
+        full = alb_log_processor.get_serializer('full')(parsed)
+        self.assertEqual(full, json.dumps(parsed, ensure_ascii=False))
+        self.assertEqual(json.loads(alb_log_processor.get_serializer('compact')(parsed))['w'], 10.0)
+
+    def test_pipeline_applies_rules(self):
+        """집계는 전체 요청 기준, 원본 이벤트만 규칙대로 전송"""
+        lines = (
+            [make_alb_line('/queue/status', 'GET', 200, 0.020, trace=f'Root=1-6549c8b7-{i:024x}') for i in range(2000)]
+            + [make_alb_line('/queue/status', 'GET', 503, 0.020)] * 5
+            + [make_alb_line('/health', 'GET', 200, 0.001)] * 30
+            + [make_alb_line('/orders', 'GET', 403, None)] * 7
+        )
+        sink = RecordingSink(alb_log_processor.get_serializer('full'))
+        aggregator = alb_log_processor.LatencyAggregator()
+        metrics = alb_log_processor.PipelineMetrics()
+        stats = alb_log_processor.process_log_lines(lines, sink, aggregator, metrics=metrics, rules=self.rules)
+        written = [json.loads(message) for message in sink.messages]
+
+        self.assertEqual(stats['parsed_count'], 2035)
+        self.assertEqual(sum(b.count for b in aggregator.buckets.values()), 2035)
+        self.assertEqual(metrics.counters['lines_filtered'], 7)
+        self.assertEqual(metrics.counters['events_dropped'], 30)
+
+        polling = [e for e in written if e['status_code'] == 200]
+        errors = [e for e in written if e['status_code'] == 503]
+        self.assertEqual(len(errors), 5)
+        self.assertTrue(all('sample_weight' not in e for e in errors))
+        self.assertTrue(all(e['sample_weight'] == 10.0 for e in polling))
+        self.assertEqual(len(polling) + metrics.counters['events_sampled_out'], 2000)
+        self.assertAlmostEqual(sum(e['sample_weight'] for e in polling), 2000, delta=400)
+
+
+class TestColumnarExport(unittest.TestCase):
+    """
+    분할 컬럼 파일 내보내기 테스트
+    date/hour/service 파티션 레이아웃, 로우 그룹, 필요한 컬럼/파티션만 읽는 조회를 검증
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, 'columnar')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def export(self, lines, object_key='alb-bucket/alb/a.log.gz', file_format='albc', row_group_size=None, sink=None):
+        export = alb_log_processor.ColumnarSink(self.root, object_key, file_format, row_group_size)
+        return alb_log_processor.process_log_lines(lines, sink or alb_log_processor.NullSink(), export=export)
+
+    def partition_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.root)
+            for directory, _, names in os.walk(self.root) for name in names
+        )
+
+    def test_partition_layout_and_round_trip(self):
+        """date/hour/service 경로로 분할하고 타입이 유지된 값을 그대로 다시 읽음"""
+        lines = ([make_alb_line('/orders', hour=10, target_time=0.020 + i / 1000) for i in range(5)]
+                 + [make_alb_line('/api/payments', hour=11, target_time=0.150, method='POST')] * 3)
+        stats = self.export(lines)
+        self.assertEqual(stats['exported_rows'], 8)
+
+        part = f"part-{hashlib.sha1(b'alb-bucket/alb/a.log.gz').hexdigest()[:16]}.albc"
+        self.assertEqual(self.partition_files(), [
+            f'date=2025-11-07/hour=10/service=flash-gateway-orders/{part}',
+            f'date=2025-11-07/hour=11/service=flash-api-payment/{part}',
+        ])
+
+        columns = alb_log_processor.read_columnar_file(
+            os.path.join(self.root, 'date=2025-11-07/hour=10/service=flash-gateway-orders', part))
+        self.assertEqual(list(columns), [name for name, _ in alb_log_processor.COLUMNAR_SCHEMA])
+        self.assertEqual(columns['response_time_ms'], [20, 21, 22, 23, 24])
+        self.assertEqual(columns['status_code'], [200] * 5)
+        self.assertEqual(columns['route'], ['/orders'] * 5)
+        self.assertEqual(columns['http_method'], ['GET'] * 5)
+        self.assertEqual(columns['sample_weight'], [1.0] * 5)
+        expected_ms = int(datetime(2025, 11, 7, 10, 30, 45, 345678).replace(
+            tzinfo=timezone.utc).timestamp() * 1000)
+        self.assertEqual(columns['timestamp_ms'], [expected_ms] * 5)
+
+    def test_nulls_round_trip(self):
+        """정수/실수/문자열 컬럼의 null 값 보존"""
+        path = os.path.join(self.tmp.name, 'nulls.albc')
+        schema = (('a', 'int64'), ('b', 'int32'), ('c', 'float64'), ('d', 'string'))
+        writer = alb_log_processor.AlbcFileWriter(path, schema)
+        writer.write_row_group({'a': [1, None], 'b': [None, -7], 'c': [0.5, None], 'd': [None, '한글']})
+        writer.close()
+
+        self.assertEqual(alb_log_processor.read_albc_columns(path), {
+            'a': [1, None], 'b': [None, -7], 'c': [0.5, None], 'd': [None, '한글']
+        })
+
+    def test_reads_only_requested_columns(self):
+        """요청한 컬럼의 청크만 읽고 로우 그룹 크기 단위로 나누어 기록"""
+        lines = [make_alb_line(f'/orders/{i}', hour=10, target_time=0.020) for i in range(10)]
+        self.export(lines, row_group_size=4)
+        [path] = [os.path.join(self.root, name) for name in self.partition_files()]
+
+        with mock.patch.object(zlib, 'decompress', wraps=zlib.decompress) as decompress:
+            columns = alb_log_processor.read_columnar_file(path, ['response_time_ms'])
+        self.assertEqual(columns, {'response_time_ms': [20] * 10})
+        # 로우 그룹 3개(4 + 4 + 2) × 컬럼 1개
+        self.assertEqual(decompress.call_count, 3)
+
+    def test_exports_every_record_before_sampling(self):
+        """원본 이벤트 샘플링/제외 규칙과 관계없이 모든 파싱 결과를 가중치 1로 저장"""
+        lines = [make_alb_line('/queue/status', hour=10, target_time=0.020, trace=f'Root=1-00000000-{i:024x}') for i in range(400)]
+        lines += [make_alb_line('/queue/status', hour=10, target_time=0.900)] * 10
+        lines += [make_alb_line('/health', hour=10, target_time=0.001)] * 5
+        lines += [make_alb_line('/orders', status=403, hour=10, target_time=None)] * 3
+        sink = RecordingSink(alb_log_processor.get_serializer('full'))
+        stats = self.export(lines, sink=sink)
+
+        # 원본 이벤트는 규칙대로 줄었지만 컬럼 파일에는 전체 레코드가 들어감
+        self.assertLess(len(sink.messages), 100)
+        self.assertEqual(stats['exported_rows'], 418)
+        part = f"part-{hashlib.sha1(b'alb-bucket/alb/a.log.gz').hexdigest()[:16]}.albc"
+        queue = alb_log_processor.read_columnar_file(
+            os.path.join(self.root, 'date=2025-11-07/hour=10/service=flash-gateway-queue', part))
+        self.assertEqual(queue['sample_weight'], [1.0] * 410)
+
+        results = alb_log_processor.query_latency_percentiles(self.root)
+        row = results['flash-gateway-queue']
+        self.assertEqual(row['count'], 410)
+        self.assertEqual(row['p50'], 20)
+        self.assertEqual(row['p99'], 900)
+        self.assertEqual(results['flash-gateway']['count'], 5)
+        # target 미도달 요청은 저장되지만 응답 시간이 없어 분위수 계산에서 제외
+        self.assertNotIn('flash-gateway-orders', results)
+        self.assertEqual(len(self.partition_files()), 3)
+
+    def test_query_prunes_partitions_and_columns(self):
+        """서비스/시간 범위 밖의 파티션은 열지 않고, 지연/가중치 컬럼만 읽음"""
+        lines = []
+        for hour in (9, 10, 11):
+            lines += [make_alb_line('/orders', hour=hour, target_time=0.010 * hour)] * 4
+            lines += [make_alb_line('/api/payments', hour=hour, target_time=0.200, method='POST')] * 2
+        self.export(lines)
+
+        start = int(datetime(2025, 11, 7, 10, 0, 0).replace(tzinfo=timezone.utc).timestamp() * 1000)
+        end = start + 3600 * 1000 - 1
+        with mock.patch.object(alb_log_processor, 'read_columnar_file',
+                               wraps=alb_log_processor.read_columnar_file) as reader:
+            results = alb_log_processor.query_latency_percentiles(
+                self.root, services=['flash-gateway-orders'], start_ms=start, end_ms=end)
+
+        self.assertEqual(results, {'flash-gateway-orders': {'count': 4, 'p50': 100, 'p95': 100, 'p99': 100}})
+        [call] = reader.call_args_list
+        self.assertIn(os.path.join('hour=10', 'service=flash-gateway-orders'), call.args[0])
+        self.assertEqual(call.args[1], ['response_time_ms', 'sample_weight'])
+
+    def test_query_filters_rows_in_edge_hours(self):
+        """시간 범위 경계가 파티션 중간이면 timestamp_ms로 행 단위 필터링"""
+        self.export([make_alb_line('/orders', hour=10, target_time=0.020), make_alb_line('/orders', hour=11, target_time=0.040)])
+        start = int(datetime(2025, 11, 7, 10, 31, 0).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+        results = alb_log_processor.query_latency_percentiles(self.root, start_ms=start)
+        self.assertEqual(results['flash-gateway-orders']['count'], 1)
+        self.assertEqual(results['flash-gateway-orders']['p50'], 40)
+
+    def test_auto_format_probes_pyarrow_without_import(self):
+        """auto는 pyarrow를 import하지 않고 설치 여부만 확인"""
+        with mock.patch('importlib.util.find_spec', return_value=None) as find_spec:
+            self.assertEqual(alb_log_processor.resolve_columnar_format('auto'), 'albc')
+        find_spec.assert_called_once_with('pyarrow')
+        with mock.patch('importlib.util.find_spec', return_value=object()):
+            self.assertEqual(alb_log_processor.resolve_columnar_format('auto'), 'parquet')
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow not installed')
+    def test_parquet_format(self):
+        """pyarrow가 있으면 zstd Parquet으로 저장하고 같은 조회 결과를 반환"""
+        import pyarrow.parquet
+
+        lines = [make_alb_line('/orders', hour=10, target_time=0.020 + i / 1000) for i in range(10)]
+        self.export(lines, file_format='parquet', row_group_size=4)
+        [name] = self.partition_files()
+        self.assertTrue(name.endswith('.parquet'))
+
+        metadata = pyarrow.parquet.ParquetFile(os.path.join(self.root, name)).metadata
+        self.assertEqual(metadata.num_row_groups, 3)
+        self.assertEqual(metadata.row_group(0).column(0).compression, 'ZSTD')
+        self.assertEqual(str(metadata.schema.to_arrow_schema().field('status_code').type), 'int32')
+
+        results = alb_log_processor.query_latency_percentiles(self.root)
+        self.assertEqual(results['flash-gateway-orders']['count'], 10)
+        self.assertEqual(results['flash-gateway-orders']['p50'], 24)
+
+    def test_process_s3_object_exports_columnar_files(self):
+        """COLUMNAR_EXPORT_PREFIX가 있으면 CloudWatch Logs 업로드와 함께 컬럼 파일도 저장"""
+        path = os.path.join(self.tmp.name, 'a.log.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write('\n'.join(make_alb_line('/orders', hour=10, target_time=0.020) for _ in range(6)) + '\n')
+
+        fake_logs = FakeLogsClient()
+        fake_s3 = FakeS3Client({('alb-bucket', 'alb/a.log.gz'): path})
+        with mock.patch.object(alb_log_processor, 's3', fake_s3), \
+                mock.patch.object(alb_log_processor, 'logs', fake_logs), \
+                mock.patch.object(alb_log_processor, 'COLUMNAR_EXPORT_PREFIX', self.root), \
+                mock.patch.object(alb_log_processor, 'COLUMNAR_FORMAT', 'albc'):
+            result = alb_log_processor.process_s3_object('alb-bucket', 'alb/a.log.gz')
+
+        self.assertEqual(result['events_count'], 6)
+        self.assertEqual(result['exported_rows'], 6)
+        self.assertEqual(fake_logs.events_count, 6)
+        part = f"part-{hashlib.sha1(b'alb-bucket/alb/a.log.gz').hexdigest()[:16]}.albc"
+        self.assertEqual(self.partition_files(), [f'date=2025-11-07/hour=10/service=flash-gateway-orders/{part}'])
+
+    def test_backfill_columnar_sink_and_query_cli(self):
+        """백필 columnar 싱크로 저장한 파일을 --query로 조회"""
+        input_dir = os.path.join(self.tmp.name, 'in')
+        os.makedirs(input_dir)
+        for name, hour in (('a', 10), ('b', 11)):
+            with gzip.open(os.path.join(input_dir, f'{name}.log.gz'), 'wt', encoding='utf-8') as f:
+                f.write('\n'.join(make_alb_line('/orders', hour=hour, target_time=0.030) for _ in range(3)) + '\n')
+
+        summary = alb_log_processor.run_backfill(
+            alb_log_processor.list_local_sources(input_dir), 'columnar',
+            output_dir=self.root, executor_factory=thread_executor)
+        self.assertEqual(summary['processed'], 2)
+        self.assertEqual(summary['exported_rows'], 6)
+        self.assertEqual(len(self.partition_files()), 2)
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_code = alb_log_processor.main(['--query', self.root, '--since', '2025-11-07T11:00:00'])
+        self.assertEqual(exit_code, 0)
+        row = stdout.getvalue().splitlines()[1].split()
+        self.assertEqual(row, ['flash-gateway-orders', '3', '30', '30', '30'])
+
+
+class FakeDynamoDbClient:
+    """
+    처리 객체 인덱스용 DynamoDB 스텁 (get_item/update_item만 지원)
+    조건식은 파싱하지 않고 DynamoDbObjectIndex.commit의 조건(오프셋 증가, partial 상태)을 값으로 검사
+    """
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        item = self.items.get((Key['object']['S'], Key['etag']['S']))
+        return {'Item': dict(item)} if item is not None else {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues,
+                    ExpressionAttributeNames=None, ConditionExpression=None):
+        item_key = (Key['object']['S'], Key['etag']['S'])
+        current = self.items.get(item_key)
+        values = ExpressionAttributeValues
+        if ConditionExpression and current is not None and (
+                current['status']['S'] != 'partial'
+                or int(current['committed_offset']['N']) >= int(values[':offset']['N'])):
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'failed'}},
+                              'UpdateItem')
+        item = dict(current or Key)
+        item['status'] = values.get(':done', values.get(':partial'))
+        item['committed_offset'] = values[':offset']
+        item['expires_at'] = values[':expires_at']
+        if ':events_count' in values:
+            item['events_count'] = values[':events_count']
+        self.items[item_key] = item
+
+
+class FailingLogsClient(FakeLogsClient):
+    """fail_calls에 해당하는 PutLogEvents 호출(1부터)만 재시도 불가능한 에러로 실패시키는 스텁"""
+
+    def __init__(self, fail_calls):
+        super().__init__()
+        self.fail_calls = set(fail_calls)
+
+    def put_log_events(self, logGroupName, logStreamName, logEvents):
+        with self.lock:
+            fail = self.calls + 1 in self.fail_calls
+            if fail:
+                self.calls += 1
+        if fail:
+            raise ClientError({'Error': {'Code': 'InvalidParameterException', 'Message': 'bad'}}, 'PutLogEvents')
+        return super().put_log_events(logGroupName, logStreamName, logEvents)
+
+
+class TestIdempotentReprocessing(unittest.TestCase):
+    """
+    처리 객체 인덱스(bucket/key/ETag) 테스트
+    중복 전달된 이벤트는 다운로드 없이 건너뛰고, 중단된 객체는 커밋된 오프셋부터 이어서 업로드하는지 검증
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = alb_log_processor.SqliteObjectIndex(os.path.join(self.tmp.name, 'index.db'))
+        self.path = os.path.join(self.tmp.name, 'a.log.gz')
+        lines = [
+            TestALBLogProcessor.ALB_LOG_API_ORDER.replace('/api/orders/123', f'/api/orders/{i}')
+            if i % 2 else TestALBLogProcessor.ALB_LOG_GATEWAY
+            for i in range(95)
+        ]
+        with gzip.open(self.path, 'wt', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        self.fake_s3 = FakeS3Client({('alb-bucket', 'alb/a.log.gz'): self.path})
+        self.etag = FakeS3Client.etag(self.path).strip('"')
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def event(self, etag=None):
+        event = s3_event('alb-bucket', 'alb/a.log.gz')
+        if etag is not None:
+            event['Records'][0]['s3']['object']['eTag'] = etag
+        return event
+
+    def handle(self, event, fake_logs, **patches):
+        _, body = invoke_handler(event, self.fake_s3, fake_logs, object_index=self.index, **patches)
+        return body['objects'][0]
+
+    def test_etag_is_read_from_event(self):
+        """S3 이벤트 레코드와 SQS 본문의 eTag를 항목에 포함"""
+        objects = alb_log_processor.extract_s3_objects(self.event('abc123'))
+        self.assertEqual(objects[0]['etag'], 'abc123')
+        sqs = {'Records': [{'messageId': 'm1', 'body': json.dumps(self.event('def456'))}]}
+        self.assertEqual(alb_log_processor.extract_s3_objects(sqs)[0]['etag'], 'def456')
+        self.assertIsNone(alb_log_processor.extract_s3_objects(self.event())[0]['etag'])
+
+    def test_sqlite_index_offsets_only_move_forward(self):
+        """커밋 오프셋은 증가만 하고 완료된 항목은 partial로 돌아가지 않음"""
+        index = self.index
+        self.assertIsNone(index.get('b', 'k', 'e1'))
+        index.commit('b', 'k', 'e1', 20)
+        index.commit('b', 'k', 'e1', 10)
+        self.assertEqual(index.get('b', 'k', 'e1'), {'status': 'partial', 'offset': 20})
+        index.complete('b', 'k', 'e1', 30, 30)
+        index.commit('b', 'k', 'e1', 40)
+        self.assertEqual(index.get('b', 'k', 'e1'), {'status': 'done', 'offset': 30})
+        # 같은 키라도 ETag가 다르면(객체를 덮어쓴 경우) 별도 항목
+        self.assertIsNone(index.get('b', 'k', 'e2'))
+
+    def test_dynamodb_index(self):
+        """DynamoDB 인덱스: 조건부 업데이트 실패는 무시하고 완료 상태 유지"""
+        client = FakeDynamoDbClient()
+        index = alb_log_processor.DynamoDbObjectIndex('alb-log-index', client)
+        index.commit('b', 'k', 'e1', 20)
+        index.commit('b', 'k', 'e1', 10)
+        self.assertEqual(index.get('b', 'k', 'e1'), {'status': 'partial', 'offset': 20})
+        index.complete('b', 'k', 'e1', 30, 30)
+        index.commit('b', 'k', 'e1', 40)
+        self.assertEqual(index.get('b', 'k', 'e1'), {'status': 'done', 'offset': 30})
+        item = client.items[('b/k', 'e1')]
+        self.assertEqual(item['events_count'], {'N': '30'})
+        self.assertGreater(int(item['expires_at']['N']), time.time() + 13 * 86400)
+
+    def test_open_object_index(self):
+        """DEDUP_INDEX 설정 형식별 백엔드 생성"""
+        self.assertIsNone(alb_log_processor.open_object_index(''))
+        index = alb_log_processor.open_object_index(f"sqlite://{os.path.join(self.tmp.name, 'other.db')}")
+        self.assertIsInstance(index, alb_log_processor.SqliteObjectIndex)
+        index.close()
+        with mock.patch.object(alb_log_processor, '_create_client', return_value=FakeDynamoDbClient()):
+            index = alb_log_processor.open_object_index('dynamodb://alb-log-index')
+        self.assertIsInstance(index, alb_log_processor.DynamoDbObjectIndex)
+        self.assertEqual(index.table_name, 'alb-log-index')
+        with self.assertRaises(ValueError):
+            alb_log_processor.open_object_index('redis://x')
+
+    def test_duplicate_delivery_skips_download(self):
+        """같은 ETag의 이벤트가 다시 오면 GetObject 없이 건너뜀"""
+        fake_logs = FakeLogsClient()
+        first = self.handle(self.event(self.etag), fake_logs)
+        self.assertEqual(first['status'], 'ok')
+        self.assertEqual(first['events_count'], 95)
+        self.assertEqual(self.index.get('alb-bucket', 'alb/a.log.gz', self.etag), {'status': 'done', 'offset': 95})
+
+        second = self.handle(self.event(self.etag), fake_logs)
+        self.assertEqual(second['status'], 'skipped')
+        self.assertEqual(second['events_count'], 0)
+        self.assertEqual(self.fake_s3.get_calls, 1)
+        self.assertEqual(fake_logs.events_count, 95)
+
+        # 객체를 덮어써서 ETag가 바뀌면 다시 처리
+        third = self.handle(self.event('new-etag'), fake_logs)
+        self.assertEqual(third['status'], 'ok')
+        self.assertEqual(fake_logs.events_count, 190)
+
+    def test_etag_from_get_object_when_event_has_none(self):
+        """이벤트에 eTag가 없으면 GetObject 응답의 ETag로 판정 (본문은 읽지 않음)"""
+        fake_logs = FakeLogsClient()
+        self.handle(self.event(), fake_logs)
+        second = self.handle(self.event(), fake_logs)
+        self.assertEqual(second['status'], 'skipped')
+        self.assertEqual(second['etag'], self.etag)
+        self.assertEqual(fake_logs.events_count, 95)
+
+    def test_resume_from_committed_offset(self):
+        """업로드 중 실패한 객체는 재시도 때 커밋된 오프셋 이후 이벤트만 업로드"""
+        for sharding in ('none', 'service'):
+            with self.subTest(sharding=sharding):
+                etag = f'etag-{sharding}'
+                patches = {'MAX_BATCH_EVENTS': 10, 'UPLOAD_CONCURRENCY': 1, 'LOG_STREAM_SHARDING': sharding}
+                alb_log_processor._known_log_streams.clear()
+
+                failing_logs = FailingLogsClient(fail_calls=[3])
+                first = self.handle(self.event(etag), failing_logs, **patches)
+                self.assertEqual(first['status'], 'error')
+                entry = self.index.get('alb-bucket', 'alb/a.log.gz', etag)
+                self.assertEqual(entry['status'], 'partial')
+                # 실패한 배치 앞까지만 커밋 (배치 2개 이상, 전체 미만)
+                self.assertGreaterEqual(entry['offset'], 10)
+                self.assertLess(entry['offset'], 95)
+
+                fake_logs = FakeLogsClient()
+                second = self.handle(self.event(etag), fake_logs, **patches)
+                self.assertEqual(second['status'], 'ok')
+                self.assertEqual(second['resumed_from'], entry['offset'])
+                self.assertEqual(fake_logs.events_count, 95 - entry['offset'])
+                # 집계 메트릭은 객체 전체 기준
+                self.assertEqual(second['parsed_count'], 95)
+                self.assertEqual(self.index.get('alb-bucket', 'alb/a.log.gz', etag), {'status': 'done', 'offset': 95})
+
+    def test_uploader_low_watermark(self):
+        """실패한 배치의 첫 순번에서 커밋 오프셋이 멈춤"""
+        commits = []
+        uploader = alb_log_processor.LogEventsUploader(
+            FailingLogsClient(fail_calls=[2]), 'group', 'stream', max_workers=1,
+            on_collect=lambda: commits.append(uploader.low_watermark()))
+        with mock.patch.object(alb_log_processor, 'MAX_BATCH_EVENTS', 5):
+            for seq in range(23):
+                uploader.add({'timestamp': 1000 + seq, 'message': f'event {seq}'})
+            self.assertEqual(uploader.low_watermark(), 5)
+            with self.assertRaises(RuntimeError):
+                uploader.close()
+        self.assertEqual(uploader.low_watermark(), 5)
+        self.assertIn(5, commits)
+
+    def test_backfill_with_dedup_index(self):
+        """백필 cloudwatch 싱크도 인덱스로 완료된 소스를 건너뜀"""
+        index_spec = f"sqlite://{os.path.join(self.tmp.name, 'backfill.db')}"
+        fake_logs = FakeLogsClient()
+        self.addCleanup(alb_log_processor._cached_object_index.cache_clear)
+        with mock.patch.object(alb_log_processor, 'logs', fake_logs):
+            first = alb_log_processor.run_backfill(
+                [self.path], 'cloudwatch', executor_factory=thread_executor, index_spec=index_spec)
+            second = alb_log_processor.run_backfill(
+                [self.path], 'cloudwatch', executor_factory=thread_executor, index_spec=index_spec)
+
+        self.assertEqual(first['events_count'], 95)
+        self.assertEqual(second['processed'], 1)
+        self.assertEqual(second['events_count'], 0)
+        self.assertEqual(fake_logs.events_count, 95)
+
+
+class TestBenchmarkHarness(unittest.TestCase):
+    """
+    합성 ALB 로그 생성기와 벤치마크 하네스 테스트
+    시나리오 분포, 결정적 생성, 결과 문서와 기준값 비교(회귀 시 실패)를 검증
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        benchmark_spec = importlib.util.spec_from_file_location("alb_log_benchmark", "alb-log-benchmark.py")
+        cls.benchmark = importlib.util.module_from_spec(benchmark_spec)
+        benchmark_spec.loader.exec_module(cls.benchmark)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def lines(self, scenario, count, seed=0):
+        return list(itertools.islice(self.benchmark.iter_synthetic_lines(scenario, seed), count))
+
+    def test_generator_is_deterministic_and_parseable(self):
+        """같은 seed는 같은 라인을 만들고 모든 라인이 전체 필드로 파싱됨"""
+        lines = self.lines('stress', 2000)
+        self.assertEqual(lines, self.lines('stress', 2000))
+        self.assertNotEqual(lines, self.lines('stress', 2000, seed=1))
+
+        for line in lines:
+            record = alb_log_processor.parse_alb_record(line)
+            self.assertIsNotNone(record.conn_trace_id)
+            parsed = parse_alb_log(line)
+            self.assertIsNotNone(parsed['timestamp_ms'])
+            self.assertNotEqual(parsed['service'], 'unknown')
+
+    def test_scenario_distributions(self):
+        """시나리오별 대기열 폴링 비율, 에러율, target 미도달(-1) 비율이 stress_test 결과와 비슷함"""
+        def summary(scenario):
+            parsed = [parse_alb_log(line) for line in self.lines(scenario, 20000)]
+            polling = [p for p in parsed if p['route'] == '/queue/status']
+            return {
+                'polling_share': len(polling) / len(parsed),
+                'polling_errors': sum(p['status_code'] >= 400 for p in polling) / len(polling),
+                'unreached': sum(p['response_time_ms'] is None for p in parsed) / len(parsed),
+            }
+
+        load, stress = summary('load'), summary('stress')
+        # 여정 18개 요청 중 10개가 대기열 상태 폴링 (02/03 load test)
+        self.assertAlmostEqual(load['polling_share'], 10 / 18, delta=0.03)
+        self.assertEqual(load['polling_errors'], 0)
+        self.assertLess(load['unreached'], 0.02)
+        # 03 load test: Queue Status 실패율 74%, 503/502/504는 target 미도달
+        self.assertAlmostEqual(stress['polling_errors'], 0.74, delta=0.03)
+        self.assertGreater(stress['unreached'], 0.35)
+
+    def test_write_synthetic_log(self):
+        """압축 해제 기준 목표 크기까지 gzip 파일로 저장"""
+        path = os.path.join(self.tmp.name, 'synthetic.log.gz')
+        stats = self.benchmark.write_synthetic_log(path, 500000, 'smoke')
+
+        self.assertGreaterEqual(stats['bytes'], 500000)
+        self.assertLess(stats['bytes'], 500000 + 1000 * 700)
+        self.assertEqual(stats['compressed_bytes'], os.path.getsize(path))
+        with open(path, 'rb') as f:
+            self.assertEqual(sum(1 for _ in alb_log_processor.iter_gzip_lines(f)), stats['lines'])
+
+    def test_handler_benchmark(self):
+        """로컬 스텁으로 lambda_handler 처리량을 측정하고, 별도 프로세스에서 최대 RSS 측정"""
+        results = self.benchmark.run_benchmarks([0.2], 'load', work_dir=self.tmp.name, isolate=False)
+        [row] = results['handler']
+        self.assertEqual(row['size_mb'], 0.2)
+        self.assertEqual(row['lines'], 1000)
+        self.assertGreater(row['lines_per_sec'], 0)
+        self.assertGreater(row['mb_per_sec'], 0)
+        # 대기열 폴링은 샘플링 규칙으로 10%만 전송
+        self.assertGreater(row['events_uploaded'], 300)
+        self.assertLess(row['events_uploaded'], 1000)
+        self.assertGreater(results['parse']['lines_per_sec'], 0)
+        self.assertGreater(results['parse_record']['lines_per_sec'], 0)
+        serialize = results['serialize']
+        self.assertEqual(set(serialize), {'full', 'compact', 'raw', 'json_dumps'})
+        self.assertEqual(serialize['full']['bytes_per_line'], serialize['json_dumps']['bytes_per_line'])
+        self.assertLess(serialize['compact']['bytes_per_line'] * 3, serialize['full']['bytes_per_line'])
+        self.assertGreater(results['cold_start']['import_ms'], 0)
+        self.assertGreater(results['instrumentation']['overhead'], 0)
+
+        # 부모 프로세스가 메모리를 많이 쓰고 있어도 자식 프로세스의 최대 RSS에 섞이지 않음
+        ballast = b'x' * (200 * 1024 * 1024)
+        isolated = self.benchmark._benchmark_handler_isolated(
+            os.path.join(self.tmp.name, 'synthetic-load-0-0.2mb.log.gz'))
+        del ballast
+        self.assertEqual(isolated['events_uploaded'], row['events_uploaded'])
+        self.assertGreater(isolated['peak_rss_mb'], 0)
+        self.assertLess(isolated['peak_rss_mb'], 200)
+
+    def test_compare_results(self):
+        """처리량이 허용치보다 낮거나 최대 RSS가 허용치보다 높으면 회귀로 보고"""
+        baseline = {
+            'parse': {'lines_per_sec': 100000},
+            'serialize': {'compact': {'lines_per_sec': 500000, 'bytes_per_line': 170.0}},
+            'handler': [{'size_mb': 1, 'lines_per_sec': 40000, 'mb_per_sec': 25.0, 'peak_rss_mb': 50.0}],
+        }
+        current = json.loads(json.dumps(baseline))
+        current['handler'].append({'size_mb': 300, 'lines_per_sec': 1, 'mb_per_sec': 0.1, 'peak_rss_mb': 900.0})
+        current['parse']['lines_per_sec'] = 80000
+        current['handler'][0]['peak_rss_mb'] = 60.0
+        self.assertEqual(self.benchmark.compare_results(current, baseline, tolerance=0.25), [])
+
+        current['parse']['lines_per_sec'] = 70000
+        current['serialize']['compact']['bytes_per_line'] = 250.0
+        current['handler'][0]['peak_rss_mb'] = 70.0
+        regressions = self.benchmark.compare_results(current, baseline, tolerance=0.25)
+        self.assertEqual(len(regressions), 3)
+        self.assertIn('parse lines_per_sec', regressions[0])
+        self.assertIn('serialize compact bytes_per_line', regressions[1])
+        self.assertIn('handler 1MB peak_rss_mb', regressions[2])
+
+    def test_cli_writes_results_and_fails_on_regression(self):
+        """run 명령은 결과 JSON을 저장하고 기준값보다 느리면 종료 코드 1"""
+        output_path = os.path.join(self.tmp.name, 'results.json')
+        baseline_path = os.path.join(self.tmp.name, 'baseline.json')
+        args = ['run', '--sizes', '0.2', '--work-dir', self.tmp.name, '--baseline', baseline_path]
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with mock.patch.object(self.benchmark, 'PARSE_BENCHMARK_LINES', 2000), \
+                contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            self.assertEqual(self.benchmark.main(args + ['--update-baseline']), 0)
+            self.assertEqual(self.benchmark.main(args + ['--output', output_path, '--tolerance', '10']), 0)
+
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+            baseline['parse']['lines_per_sec'] *= 100
+            with open(baseline_path, 'w') as f:
+                json.dump(baseline, f)
+            self.assertEqual(self.benchmark.main(args), 1)
+
+        with open(output_path) as f:
+            results = json.load(f)
+        self.assertEqual(results['scenario'], 'load')
+        self.assertEqual([row['size_mb'] for row in results['handler']], [0.2])
+        self.assertIn('PERFORMANCE REGRESSION: parse lines_per_sec', stderr.getvalue())
+
+
+class TestColdStart(unittest.TestCase):
+    """
+    콜드 스타트 테스트
+    boto3 등 무거운 모듈을 import 시점에 로드하지 않고 리전/자격 증명 없이 import와 첫 호출이 되는지 검증
+    (새 인터프리터에서 확인, import/첫 호출 시간은 alb-log-benchmark.py의 cold_start 항목)
+    """
+
+    CHECK_SCRIPT = '''
+import importlib.util, json, sys
+spec = importlib.util.spec_from_file_location("alb_log_processor", "alb-log-processor.py")
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+event = module.to_log_event(module.parse_alb_log(sys.argv[1]), module.get_serializer(module.OUTPUT_PROFILE))
+print(json.dumps({
+    "modules": sorted(name for name in ("boto3", "botocore", "multiprocessing", "argparse") if name in sys.modules),
+    "timestamp": event["timestamp"],
+}))
+'''
+
+    def test_import_without_aws_config(self):
+        """리전/자격 증명 없이 import되고 첫 호출까지 boto3 등을 로드하지 않음"""
+        env = {key: value for key, value in os.environ.items() if not key.startswith('AWS_')}
+        result = subprocess.run(
+            [sys.executable, '-c', self.CHECK_SCRIPT, TestALBLogProcessor.ALB_LOG_GATEWAY],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+            capture_output=True, text=True, check=True
+        )
+        checked = json.loads(result.stdout)
+
+        self.assertEqual(checked['modules'], [])
+        self.assertEqual(checked['timestamp'], 1762511445123)
+
+    def test_clients_are_created_once(self):
+        """클라이언트는 처음 사용할 때 한 번만 생성되고 스레드 간에 공유"""
+        created = []
+
+        def create_client(service_name, retries=None):
+            time.sleep(0.01)
+            created.append(service_name)
+            return object()
+
+        with mock.patch.object(alb_log_processor, 's3', None), \
+                mock.patch.object(alb_log_processor, 'logs', None), \
+                mock.patch.object(alb_log_processor, '_create_client', create_client):
+            threads = [threading.Thread(target=alb_log_processor.get_s3_client) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertIs(alb_log_processor.get_s3_client(), alb_log_processor.get_s3_client())
+            alb_log_processor.get_logs_client()
+            alb_log_processor.get_logs_client()
+
+        self.assertEqual(created, ['s3', 'logs'])
+
+    def test_client_config(self):
+        """커넥션 풀, keep-alive 설정, S3는 adaptive 재시도, logs는 botocore 재시도 없음"""
+        with mock.patch.dict(os.environ, {'AWS_DEFAULT_REGION': 'ap-northeast-2'}), \
+                mock.patch.object(alb_log_processor, 's3', None), \
+                mock.patch.object(alb_log_processor, 'logs', None):
+            s3_client = alb_log_processor.get_s3_client()
+            logs_client = alb_log_processor.get_logs_client()
+
+        for client in (s3_client, logs_client):
+            config = client.meta.config
+            self.assertGreaterEqual(config.max_pool_connections,
+                                    alb_log_processor.OBJECT_CONCURRENCY * alb_log_processor.UPLOAD_CONCURRENCY)
+            self.assertTrue(config.tcp_keepalive)
+        self.assertEqual(s3_client.meta.config.retries['mode'], 'adaptive')
+        self.assertEqual(logs_client.meta.config.retries, {'mode': 'standard', 'total_max_attempts': 1})
+
+    def test_ensure_log_stream_retries_throttling(self):
+        """CreateLogStream 스로틀링은 백오프 후 재시도 (logs 클라이언트는 botocore 재시도 없음)"""
+        fake_logs = FakeLogsClient()
+        calls = []
+
+        def create_log_stream(logGroupName, logStreamName):
+            calls.append(logStreamName)
+            if len(calls) <= 2:
+                raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}},
+                                  'CreateLogStream')
+
+        fake_logs.create_log_stream = create_log_stream
+        with mock.patch.object(alb_log_processor, 'logs', fake_logs), \
+                mock.patch.object(alb_log_processor, 'UPLOAD_BACKOFF_BASE', 0.001), \
+                mock.patch.object(alb_log_processor, '_known_log_streams', set()):
+            alb_log_processor.ensure_log_stream('alb-access-logs/retry')
+            alb_log_processor.ensure_log_stream('alb-access-logs/retry')
+
+        self.assertEqual(calls, ['alb-access-logs/retry'] * 3)
+
+
 if __name__ == '__main__':
     # 테스트 실행
     unittest.main(verbosity=2)